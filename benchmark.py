@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+
+# Benchmarks for the BicycleDA hot paths on synthetic fleets and sales days.
+# Run "python benchmark.py" to print timings, "--save" to record them as the baseline
+# and "--compare" to fail when an operation got slower than the baseline allows.
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import time as dt_time
+
+import numpy as np
+import pandas as pd
+
+import main
+
+BIKE_TYPES = ["adult", "kid", "tandem", "family", "pgk"]
+#Share of the fleet per bike type
+TYPE_SHARES = [0.5, 0.2, 0.15, 0.1, 0.05]
+TODAY = "20230101"
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+
+#Write a bicycle_db.csv with the given number of bikes, all in store
+def make_inventory(directory, fleet_size):
+    frames = []
+    for biketype, share in zip(BIKE_TYPES, TYPE_SHARES):
+        count = max(1, int(fleet_size * share))
+        bicycle = main.Bicycle(biketype)
+        frames.append(pd.DataFrame({
+            'Bike Type': biketype,
+            'Serial Number': [f"{biketype[0].upper()}{n:03d}" for n in range(1, count + 1)],
+            'Price': bicycle.price,
+            'Price Unit': bicycle.priceUnit,
+            'Status': 'In',
+            'Contact': None,
+            'Time Out': None,
+            'Booked Hours': 0,
+            'Est Time In': None}))
+    pd.concat(frames, ignore_index=True).to_csv(os.path.join(directory, 'bicycle_db.csv'), index=False)
+
+#Write a sales_list csv with the given number of transactions spread over opening hours
+def make_sales_day(directory, todaydate, transactions, seed=0):
+    rng = np.random.default_rng(seed)
+    types = rng.choice(BIKE_TYPES, size=transactions, p=TYPE_SHARES)
+    rates = pd.Series(types).map({biketype: main.Bicycle(biketype).price for biketype in BIKE_TYPES}).to_numpy()
+    seconds = rng.integers(8 * 3600, 22 * 3600, size=transactions)
+    excess = rng.random(transactions) < 0.1
+    sales_df = pd.DataFrame({
+        'Bike Type': types,
+        'Price': rates,
+        'Price Unit': np.where(types == 'pgk', 'per 0.5 hour', 'per hour'),
+        'Contact': rng.integers(80000000, 100000000, size=transactions),
+        'Time': [f"{s // 3600:02d}:{s // 60 % 60:02d}:{s % 60:02d}" for s in seconds],
+        'Transaction Type': np.where(excess, 'Excess Hour Charges', 'Rental'),
+        'Amount': rates * rng.integers(1, 5, size=transactions),
+        'Serial Number': [f"{t[0].upper()}{n:03d}" for t, n in zip(types, rng.integers(1, 1000, size=transactions))]})
+    sales_df = sales_df.sort_values('Time', kind='stable')
+    sales_df.reindex(columns=main.SALES_COLUMNS).to_csv(os.path.join(directory, f'sales_list_{todaydate}.csv'), index=False)
+
+#Seconds per call of fn, best and median over the repeats
+def measure(fn, repeat=5, number=1, setup=None):
+    samples = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) / number)
+    return {'best': min(samples), 'median': statistics.median(samples)}
+
+#BicycleDA on the csv files of a folder, saving only when flush is called
+def open_da(directory):
+    return main.BicycleDA(main.CsvStorage(directory), flush_every=float('inf'), flush_interval=float('inf'))
+
+#Timings of the inventory operations for one fleet size
+def bench_fleet(fleet_size, repeat):
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        make_inventory(directory, fleet_size)
+        results['load'] = measure(lambda: open_da(directory), repeat)
+        da = open_da(directory)
+        da.initsales(TODAY)
+        results['get_inv'] = measure(lambda: da.get_inv('adult'), repeat, number=1000)
+        rented = []
+        rent_time = dt_time(9, 0)
+        results['rentalfee'] = measure(lambda: rented.extend(da.rent_bikes('adult', 2, rent_time, 91234567, 1, TODAY)[0]), repeat, number=20)
+        return_time = dt_time(12, 0)
+        results['returnbike'] = measure(lambda: da.return_bike(rented.pop(), return_time, TODAY), repeat, number=20)
+        group = []
+        def return_group():
+            for sn in group:
+                da.return_bike(sn, return_time, TODAY)
+            group.clear()
+        results['rentalfee_group_50'] = measure(lambda: group.extend(da.rent_bikes('adult', 2, rent_time, 91234567, 50, TODAY)[0]), repeat, setup=return_group)
+        results['insertNewBicycle_1000'] = measure(lambda: da.add_bicycles(main.Bicycle('kid'), 1000), repeat)
+        with contextlib.redirect_stdout(io.StringIO()):
+            results['displayBicycles'] = measure(da.displayBicycles, repeat)
+        def save():
+            da.rent_bikes('kid', 1, rent_time, 91234567, 1, TODAY)
+            da.flush()
+        results['flush'] = measure(save, repeat)
+        da.flush()
+    return results
+
+#Timings of the sales report for one day of the given size
+def bench_sales(transactions, repeat):
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        make_inventory(directory, 100)
+        make_sales_day(directory, TODAY, transactions)
+        da = open_da(directory)
+        results['initsales'] = measure(lambda: da.initsales(TODAY), repeat)
+        with contextlib.redirect_stdout(io.StringIO()):
+            results['salesreport'] = measure(lambda: da.salesreport(TODAY), repeat)
+        path = os.path.join(directory, f'sales_list_{TODAY}.csv')
+        sales_df = pd.read_csv(path)
+        results['report_from_sales'] = measure(lambda: main.SalesReport.from_sales(sales_df, TODAY), repeat)
+        #Streamed in chunks straight from the file, as when a day is opened
+        results['report_from_csv'] = measure(lambda: main.SalesMetrics.from_csv(path).report(TODAY), repeat)
+    return results
+
+#Read the output of a process until the given prompt shows up
+def wait_for(process, prompt):
+    output = b''
+    while prompt not in output:
+        chunk = os.read(process.stdout.fileno(), 65536)
+        if not chunk:
+            raise RuntimeError(f"main.py ended before showing {prompt!r}: {output.decode(errors='replace')}")
+        output += chunk
+
+#Seconds from starting main.py until the date prompt, and until the menu after the date is keyed in at once
+def bench_startup(fleet_size, repeat):
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        make_inventory(directory, fleet_size)
+        make_sales_day(directory, TODAY, 100)
+        prompt_samples, menu_samples = [], []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            process = subprocess.Popen([sys.executable, MAIN], cwd=directory, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            wait_for(process, b'(yyyyMMdd)')
+            prompt_samples.append(time.perf_counter() - start)
+            process.stdin.write(f"{TODAY}\n".encode())
+            process.stdin.flush()
+            wait_for(process, b'Enter your choice:')
+            menu_samples.append(time.perf_counter() - start)
+            process.communicate(b"X\n")
+        for name, samples in (('startup_prompt', prompt_samples), ('startup_menu', menu_samples)):
+            results[name] = {'best': min(samples), 'median': statistics.median(samples)}
+    return results
+
+def run(fleet_sizes, sales_sizes, repeat):
+    results = {}
+    for name, timing in bench_startup(fleet_sizes[0], repeat).items():
+        results[f"{name}[fleet={fleet_sizes[0]}]"] = timing
+        print(f"{name + f'[fleet={fleet_sizes[0]}]':<45s} {timing['median'] * 1000:12.3f} ms")
+    for fleet_size in fleet_sizes:
+        for name, timing in bench_fleet(fleet_size, repeat).items():
+            results[f"{name}[fleet={fleet_size}]"] = timing
+            print(f"{name + f'[fleet={fleet_size}]':<45s} {timing['median'] * 1000:12.3f} ms")
+    for transactions in sales_sizes:
+        for name, timing in bench_sales(transactions, repeat).items():
+            results[f"{name}[sales={transactions}]"] = timing
+            print(f"{name + f'[sales={transactions}]':<45s} {timing['median'] * 1000:12.3f} ms")
+    return results
+
+#Operations slower than the baseline allows, and operations the baseline has no timing for yet
+def regressions(results, baseline, tolerance):
+    slower, new = [], []
+    for name, timing in results.items():
+        before = baseline['results'].get(name)
+        if before is None:
+            new.append((name, timing['median']))
+        elif timing['median'] > before['median'] * tolerance:
+            slower.append((name, before['median'], timing['median']))
+    return slower, new
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark BicycleDA operations on synthetic data")
+    parser.add_argument("--fleet", type=int, nargs="+", default=[1000, 10000, 100000], help="fleet sizes to test")
+    parser.add_argument("--sales", type=int, nargs="+", default=[1000, 100000, 1000000], help="transactions per sales day to test")
+    parser.add_argument("--repeat", type=int, default=5, help="repeats per operation, the median is reported")
+    parser.add_argument("--baseline", default=BASELINE, help="baseline file to save to or compare with")
+    parser.add_argument("--save", action="store_true", help="record the results as the new baseline")
+    parser.add_argument("--compare", action="store_true", help="exit with an error when an operation is slower than the baseline")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="allowed slowdown against the baseline median")
+    args = parser.parse_args()
+
+    results = run(args.fleet, args.sales, args.repeat)
+    if args.save:
+        with open(args.baseline, "w") as file:
+            json.dump({'python': platform.python_version(), 'pandas': pd.__version__, 'results': results}, file, indent=2)
+            file.write("\n")
+        print(f"Baseline saved to {args.baseline}")
+    if args.compare:
+        with open(args.baseline) as file:
+            slower, new = regressions(results, json.load(file), args.tolerance)
+        for name, after in new:
+            print(f"NEW {name}: {after * 1000:.3f} ms, not in the baseline")
+        for name, before, after in slower:
+            print(f"REGRESSION {name}: {before * 1000:.3f} ms -> {after * 1000:.3f} ms")
+        if slower:
+            sys.exit(1)
+        print("No regressions against the baseline.")
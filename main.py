@@ -1,17 +1,234 @@
 # -*- coding: utf-8 -*-
 
 # Import library
-import pandas as pd
+import importlib
 import sys
 import math
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, time as dt_time
 import os
+import argparse
+import json
+import contextlib
+import functools
+import io
+try:
+    import fcntl
+except ImportError:
+    #No advisory locks on this platform, shared mode then relies on the version check only
+    fcntl = None
+import time
+import atexit
+import csv
+import sqlite3
+import itertools
+import bisect
+import threading
+import gzip
+import shutil
+
+class _LazyModule:
+    #Stand-in for a heavy module, imported on first use so the menu does not wait for pandas and numpy
+    def __init__(self, name, alias):
+        self.__name = name
+        self.__alias = alias
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self.__name)
+        #later lookups of the alias find the module itself
+        globals()[self.__alias] = module
+        return getattr(module, attr)
+
+pd = _LazyModule('pandas', 'pd')
+np = _LazyModule('numpy', 'np')
+
+class Instrumentation:
+    #Opt-in timers and counters: latency histograms of every BicycleDA operation and of the stages under it
+    #(csv parse and write, dataframe updates, report rendering), rows read and written and bytes written
+    #Disabled by default, every hook then returns straight away
+    buckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self):
+        self.enabled = False
+        self.__lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        #(kind, name) -> [count, total seconds, count per bucket]
+        self.timings = {}
+        #(counter, label) -> total
+        self.counters = {}
+
+    #Record one timing of an 'operation' or a 'stage'
+    def observe(self, kind, name, seconds):
+        with self.__lock:
+            timing = self.timings.setdefault((kind, name), [0, 0.0, [0] * (len(self.buckets) + 1)])
+            timing[0] += 1
+            timing[1] += seconds
+            timing[2][bisect.bisect_left(self.buckets, seconds)] += 1
+
+    @contextlib.contextmanager
+    def timer(self, kind, name):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(kind, name, time.perf_counter() - start)
+
+    def count(self, counter, label, value=1):
+        if self.enabled:
+            with self.__lock:
+                self.counters[(counter, label)] = self.counters.get((counter, label), 0) + value
+
+    #Timings and counters as plain dicts, histogram buckets are cumulative like in Prometheus
+    def snapshot(self):
+        with self.__lock:
+            result = {'operations': {}, 'stages': {}, 'counters': {}}
+            for (kind, name), (count, seconds, per_bucket) in sorted(self.timings.items()):
+                cumulative = list(itertools.accumulate(per_bucket))
+                result[kind + 's'][name] = {'count': count, 'seconds': seconds,
+                                            'buckets': dict(zip([str(le) for le in self.buckets] + ['+Inf'], cumulative))}
+            for (counter, label), value in sorted(self.counters.items()):
+                result['counters'].setdefault(counter, {})[label] = value
+            return result
+
+    #Label value in the Prometheus text format, backslashes, quotes and newlines are escaped
+    @staticmethod
+    def __label(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    #Snapshot in the Prometheus text exposition format
+    def to_prometheus(self):
+        snapshot = self.snapshot()
+        lines = []
+        for kind, label in [('operations', 'operation'), ('stages', 'stage')]:
+            metric = f"bicycle_{label}_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            for name, timing in snapshot[kind].items():
+                name = self.__label(name)
+                for le, count in timing['buckets'].items():
+                    lines.append(f'{metric}_bucket{{{label}="{name}",le="{le}"}} {count}')
+                lines.append(f'{metric}_sum{{{label}="{name}"}} {timing["seconds"]}')
+                lines.append(f'{metric}_count{{{label}="{name}"}} {timing["count"]}')
+        for counter, values in snapshot['counters'].items():
+            lines.append(f"# TYPE bicycle_{counter}_total counter")
+            for label, value in values.items():
+                lines.append(f'bicycle_{counter}_total{{source="{self.__label(label)}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    #Write a snapshot file, Prometheus text for .prom and .txt files and json otherwise
+    def write(self, path):
+        with open(path, 'w') as file:
+            if path.endswith(('.prom', '.txt')):
+                file.write(self.to_prometheus())
+            else:
+                json.dump(self.snapshot(), file, indent=2)
+                file.write("\n")
+
+INSTRUMENTS = Instrumentation()
+
+#Switch on instrumentation and/or cProfile for this process, the snapshot and the profile are written at exit
+#The profile is a pstats file, e.g. "python -m pstats FILE" or snakeviz; py-spy can attach to the process as is
+def _observe_session(metrics_path=None, profile_path=None):
+    if metrics_path:
+        INSTRUMENTS.enabled = True
+        atexit.register(INSTRUMENTS.write, metrics_path)
+    if profile_path:
+        import cProfile
+        profiler = cProfile.Profile()
+        def dump():
+            profiler.disable()
+            profiler.dump_stats(profile_path)
+        atexit.register(dump)
+        profiler.enable()
+
+#Decorator timing a BicycleDA operation under its method name when instrumentation is on
+def _timed(method):
+    name = method.__name__
+    @functools.wraps(method)
+    def timed(*args, **kwargs):
+        if not INSTRUMENTS.enabled:
+            return method(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            INSTRUMENTS.observe('operation', name, time.perf_counter() - start)
+    return timed
+
+class Tariff:
+    #Rental rate, price unit and charging block of each bike type, loaded once and shared by all pricing
+    default_rates = {"adult": {"price": 8, "unit": "per hour", "block_minutes": 60},
+                     "kid": {"price": 6, "unit": "per hour", "block_minutes": 60},
+                     "tandem": {"price": 16, "unit": "per hour", "block_minutes": 60},
+                     "family": {"price": 35, "unit": "per hour", "block_minutes": 60},
+                     "pgk": {"price": 13, "unit": "per 0.5 hour", "block_minutes": 30}}
+
+    def __init__(self, rates=None):
+        rates = rates if rates is not None else self.default_rates
+        self.types = list(rates)
+        self.price = {biketype: rate["price"] for biketype, rate in rates.items()}
+        self.unit = {biketype: rate["unit"] for biketype, rate in rates.items()}
+        self.block_minutes = {biketype: rate["block_minutes"] for biketype, rate in rates.items()}
+        #Same figures as arrays in the order of self.types for vectorized pricing, built on first use
+        self.__prices = None
+        self.__block_seconds = None
+
+    #Tariff of an outlet, a json file shaped like default_rates
+    @classmethod
+    def from_file(cls, path):
+        with open(path) as file:
+            return cls(json.load(file))
+
+    def __codes(self, types):
+        codes = pd.Categorical(np.atleast_1d(types), categories=self.types).codes
+        if (codes < 0).any():
+            raise KeyError(f"unknown bike type in {list(np.atleast_1d(types)[codes < 0])}")
+        return codes
+
+    #Charging blocks and amounts for arrays of bike types and durations, each rounded up to whole blocks
+    #Durations are given in hours, or in seconds e.g. for the overtime of returns
+    def quote(self, types, hours=None, seconds=None):
+        if self.__prices is None:
+            self.__prices = np.array([self.price[biketype] for biketype in self.types])
+            self.__block_seconds = np.array([self.block_minutes[biketype] * 60 for biketype in self.types], dtype=float)
+        codes = self.__codes(types)
+        seconds = np.asarray(hours, dtype=float) * 3600 if seconds is None else np.asarray(seconds, dtype=float)
+        #rounding first keeps 1.5 hours at exactly 3 half hour blocks
+        blocks = np.ceil(np.round(seconds / self.__block_seconds[codes], 9)).astype(int)
+        return blocks, blocks * self.__prices[codes]
+
+    #Same as quote for one bike type and duration with plain numbers, a dict lookup instead of the arrays
+    #as every single rent, return and booking is priced this way
+    def quote_one(self, biketype, hours=None, seconds=None):
+        if biketype not in self.price:
+            raise KeyError(f"unknown bike type {biketype!r}")
+        seconds = hours * 3600 if seconds is None else seconds
+        blocks = math.ceil(round(seconds / (self.block_minutes[biketype] * 60), 9))
+        return blocks, blocks * self.price[biketype]
+
+    #Hours covered by a number of blocks, whole hours are kept as int
+    def block_hours(self, biketype, blocks):
+        minutes = self.block_minutes[biketype]
+        if minutes % 60 == 0:
+            return int(blocks) * minutes // 60
+        return blocks * minutes / 60
+
+    #Rental hours rounded up to whole blocks of the bike type
+    def round_hours(self, biketype, hours):
+        return self.block_hours(biketype, self.quote_one(biketype, hours)[0])
+
+#Tariff used unless an outlet loads its own
+TARIFF = Tariff()
 
 class Bicycle:
     #Initialization with columns needed for inventory
-    def __init__(self, biketype, sn=None, price = 0, priceUnit = None, status="In", contact=None, time_out=None, booked_hours=0, est_time_in=None):
+    def __init__(self, biketype, sn=None, price = 0, priceUnit = None, status="In", contact=None, time_out=None, booked_hours=0, est_time_in=None, tariff=TARIFF):
         self.biketype = biketype
         self.sn = sn
+        self.tariff = tariff
         self.price = self.get_price()
         self.priceUnit = self.get_priceUnit()
         self.status = status
@@ -22,288 +239,1917 @@ class Bicycle:
 
     #Get price for each bike type    
     def get_price(self):
-        type_key = self.biketype.lower()
-        price_dict = {"adult": 8,
-                      "kid": 6,
-                      "tandem": 16,
-                      "family": 35,
-                      "pgk": 13}
-        return price_dict[type_key]
+        return self.tariff.price[self.biketype.lower()]
     
     #Get unit for the price of each bike type
     def get_priceUnit(self):
-        type_key = self.biketype.lower()
-        priceUnit_dict = {"adult": "per hour",
-                      "kid": "per hour",
-                      "tandem": "per hour",
-                      "family": "per hour",
-                      "pgk": "per 0.5 hour"}
-        return priceUnit_dict[type_key]
+        return self.tariff.unit[self.biketype.lower()]
+
+#columns of the inventory list
+INVENTORY_COLUMNS = ['Bike Type', 'Serial Number', 'Price', 'Price Unit', 'Status', 'Contact', 'Time Out', 'Booked Hours', 'Est Time In']
+#columns of the daily sales list
+SALES_COLUMNS = ['Bike Type','Price','Price Unit','Contact','Time','Transaction Type','Amount','Serial Number']
+#columns of the reservations list, one row per booked bike
+RESERVATION_COLUMNS = ['Booking', 'Serial Number', 'Bike Type', 'Contact', 'Start', 'End']
+
+#Types of the inventory and sales columns in memory: repeated labels are categoricals and contact numbers
+#nullable integers. 'Est Time In' is a datetime and the times of day 'Time Out' and 'Time' are timedeltas
+#from midnight, parsed once on load; the csv files keep their HH:MM:SS and yyyy-mm-dd HH:MM:SS text
+INVENTORY_DTYPES = {'Bike Type': 'category', 'Serial Number': str, 'Price Unit': 'category',
+                    'Status': 'category', 'Contact': 'Int64', 'Booked Hours': float}
+SALES_DTYPES = {'Bike Type': 'category', 'Serial Number': str, 'Price Unit': 'category',
+                'Transaction Type': 'category', 'Contact': 'Int64'}
+TIME_COLUMNS = ['Time Out', 'Time']
+#fixed categories, so every status can be assigned
+CATEGORIES = {'Status': ['In', 'Out']}
+DATETIME_COLUMNS = ['Est Time In']
+
+#Time of day as a timedelta from midnight
+def _since_midnight(value):
+    return pd.Timedelta(hours=value.hour, minutes=value.minute, seconds=value.second)
+
+#Times of day as timedeltas, values that are already parsed are kept
+def _timedeltas(values):
+    if pd.api.types.is_timedelta64_dtype(values):
+        return values
+    return pd.to_timedelta(values, errors='coerce')
+
+#Give the columns of a frame their in-memory types
+def _typed(df, dtypes):
+    df = df.astype({col: dtype for col, dtype in dtypes.items() if col in df})
+    for col, categories in CATEGORIES.items():
+        if col in df and isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].cat.set_categories(categories)
+    for col in TIME_COLUMNS:
+        if col in df:
+            df[col] = _timedeltas(df[col])
+    for col in DATETIME_COLUMNS:
+        if col in df and not pd.api.types.is_datetime64_dtype(df[col]):
+            df[col] = pd.to_datetime(df[col], errors='coerce')
+    return df
+
+#Read a csv file straight into the in-memory types
+def _read_csv(path, dtypes):
+    with INSTRUMENTS.timer('stage', 'csv_parse'):
+        df = _typed(pd.read_csv(path, dtype=dtypes), dtypes)
+    INSTRUMENTS.count('rows_read', 'inventory' if dtypes is INVENTORY_DTYPES else 'sales', len(df))
+    return df
+
+#Times and datetimes back to the text format of the csv files, whole hours as int as they were always written
+def _csv_frame(df):
+    text = {}
+    if 'Booked Hours' in df and pd.api.types.is_float_dtype(df['Booked Hours']):
+        hours = df['Booked Hours']
+        whole = (hours % 1 == 0).to_numpy()
+        if whole.all():
+            text['Booked Hours'] = hours.astype('int64')
+        elif whole.any():
+            mixed = hours.to_numpy(dtype=object)
+            mixed[whole] = hours.to_numpy()[whole].astype('int64')
+            text['Booked Hours'] = mixed
+    for col in TIME_COLUMNS:
+        if col in df and pd.api.types.is_timedelta64_dtype(df[col]):
+            text[col] = (pd.Timestamp(0) + df[col]).dt.strftime('%H:%M:%S')
+    for col in DATETIME_COLUMNS:
+        if col in df and pd.api.types.is_datetime64_dtype(df[col]):
+            text[col] = df[col].dt.strftime('%Y-%m-%d %H:%M:%S')
+    return df.assign(**text)
+
+#Concatenate typed frames, categorical columns stay categorical over the union of their categories
+def _concat_typed(frames):
+    for col in frames[0].columns:
+        if isinstance(frames[0][col].dtype, pd.CategoricalDtype):
+            categories = frames[0][col].cat.categories
+            for frame in frames[1:]:
+                categories = categories.union(frame[col].cat.categories, sort=False)
+            frames = [frame.assign(**{col: frame[col].cat.set_categories(categories)}) for frame in frames]
+    return pd.concat(frames)
+
+class SalesJournal:
+    #Append-only writer for the daily sales csv, fsync is done once every sync_every rows
+    def __init__(self, path, columns, sync_every=20):
+        self.path = path
+        self.columns = columns
+        self.__sync_every = sync_every
+        self.__unsynced = 0
+        try:
+            with open(path, newline='') as file:
+                header = next(csv.reader(file), None)
+        except FileNotFoundError:
+            header = None
+        if header is not None and header != columns:
+            #Rewrite once into the current column order, e.g. files saved before 'Serial Number' was kept
+            pd.read_csv(path).reindex(columns=columns).to_csv(path, index=False)
+        self.__file = open(path, 'a', newline='')
+        self.__writer = csv.writer(self.__file)
+        if header is None:
+            #Rows logged in the write-ahead log are put back after the header, so the header is on disk first
+            self.__writer.writerow(columns)
+            self.__file.flush()
+            os.fsync(self.__file.fileno())
+
+    #Csv text of transaction rows (dicts keyed by column name), exactly as append writes them
+    def encode(self, rows):
+        text = io.StringIO()
+        csv.writer(text).writerows([['' if pd.isna(row.get(col)) else row.get(col) for col in self.columns] for row in rows])
+        return text.getvalue()
+
+    #Bytes in the file, where the next appended row starts
+    def size(self):
+        return self.__file.tell()
+
+    #Append transaction rows (dicts keyed by column name) to the end of the file
+    def append(self, rows):
+        with INSTRUMENTS.timer('stage', 'sales_append'):
+            start = self.__file.tell()
+            self.__file.write(self.encode(rows))
+            self.__file.flush()
+        INSTRUMENTS.count('rows_written', 'sales', len(rows))
+        INSTRUMENTS.count('bytes_written', 'sales', self.__file.tell() - start)
+        self.__unsynced += len(rows)
+        if self.__unsynced >= self.__sync_every:
+            self.sync()
+
+    #Force appended rows to disk
+    def sync(self):
+        if self.__unsynced:
+            with INSTRUMENTS.timer('stage', 'sales_fsync'):
+                self.__file.flush()
+                os.fsync(self.__file.fileno())
+            self.__unsynced = 0
+
+    def close(self):
+        if not self.__file.closed:
+            self.sync()
+            self.__file.close()
+
+class WriteAheadLog:
+    #Inventory changes since the last snapshot, one json line per operation with all of its entries, appended
+    #and fsynced before the operation is acknowledged. Every entry sets absolute values, so replaying entries
+    #already contained in the snapshot gives the same state; a torn last line from a crash during the append
+    #is skipped, so an operation is replayed whole or not at all
+    def __init__(self, path):
+        self.path = path
+        self.__file = None
+        self.__grouped = 0
+        self.__unsynced = False
+
+    def append(self, entries):
+        if self.__file is None:
+            self.__file = open(self.path, 'a')
+        with INSTRUMENTS.timer('stage', 'wal_append'):
+            data = json.dumps(entries) + '\n'
+            self.__file.write(data)
+            self.__file.flush()
+            if self.__grouped:
+                self.__unsynced = True
+            else:
+                os.fsync(self.__file.fileno())
+        INSTRUMENTS.count('bytes_written', 'wal', len(data))
+
+    #Operations appended inside the group are fsynced once when it ends instead of one by one, for a run of
+    #operations that is acknowledged as a whole like a batch file
+    @contextlib.contextmanager
+    def group(self):
+        self.__grouped += 1
+        try:
+            yield
+        finally:
+            self.__grouped -= 1
+            if not self.__grouped and self.__unsynced:
+                os.fsync(self.__file.fileno())
+                self.__unsynced = False
+
+    def entries(self):
+        entries = []
+        try:
+            with open(self.path) as file:
+                for line in file:
+                    try:
+                        operation = json.loads(line)
+                    except ValueError:
+                        break
+                    #a single entry per line in logs written before operations were grouped
+                    entries.extend(operation if isinstance(operation, list) else [operation])
+        except FileNotFoundError:
+            pass
+        return entries
+
+    #Start an empty log once a snapshot holds every entry
+    def truncate(self):
+        if self.__file is None:
+            self.__file = open(self.path, 'a')
+        self.__file.truncate(0)
+        os.fsync(self.__file.fileno())
+        self.__unsynced = False
+
+    def close(self):
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+
+#Inventory cell value as json for the write-ahead log, times as their csv text
+def _wal_value(value):
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if isinstance(value, pd.Timedelta):
+        return (pd.Timestamp(0) + value).strftime('%H:%M:%S')
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if hasattr(value, 'item'):
+        return value.item()
+    return value
+
+#Json value from the write-ahead log back into the in-memory type of its column
+def _wal_parse(column, value):
+    if column in TIME_COLUMNS:
+        return pd.NaT if value is None else pd.Timedelta(value)
+    if column in DATETIME_COLUMNS:
+        return pd.NaT if value is None else pd.Timestamp(value)
+    return value
+
+#Make renames and new files in a folder durable, a rename is only on disk once its folder is synced
+def _sync_directory(directory):
+    try:
+        fd = os.open(directory or '.', os.O_RDONLY)
+    except OSError:
+        #Folders cannot be opened for syncing on Windows
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+#Write a file through a temporary file in the same folder renamed over the old one,
+#so readers and a crash in between see either the old or the new file, never a partial one
+def _atomic_write(path, write, mode='w'):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, mode, newline='' if 'b' not in mode else None) as file:
+        write(file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp, path)
+    _sync_directory(os.path.dirname(path))
+
+class SalesArchive:
+    #Closed days of sales, each compressed into one segment sales_archive/sales_<date>.csv.gz
+    #A segment is a run of gzip members of about block_size bytes of whole rows, readable as one gzip file,
+    #and index.csv keeps where each member starts uncompressed and compressed, so a row at a known offset
+    #of the day's csv is read by inflating a single member
+    def __init__(self, directory, block_size=1 << 18):
+        self.directory = directory
+        self.index_path = os.path.join(directory, 'index.csv')
+        self.__block_size = block_size
+        #date -> (uncompressed offsets, compressed offsets) of the members
+        self.__blocks = None
+        #(inode, mtime, size) of the index when it was read, another counter may have replaced it since
+        self.__version = None
+
+    def __stat(self):
+        try:
+            stat = os.stat(self.index_path)
+            return stat.st_ino, stat.st_mtime_ns, stat.st_size
+        except FileNotFoundError:
+            return None
+
+    def __load(self):
+        version = self.__stat()
+        if self.__blocks is not None and version == self.__version:
+            return
+        self.__blocks = {}
+        self.__version = version
+        try:
+            with open(self.index_path, newline='') as file:
+                for date, offset, compressed in itertools.islice(csv.reader(file), 1, None):
+                    starts, positions = self.__blocks.setdefault(date, ([], []))
+                    starts.append(int(offset))
+                    positions.append(int(compressed))
+        except FileNotFoundError:
+            pass
+
+    #The index is replaced as a whole, so it always matches whole segments
+    def __save(self):
+        def index(file):
+            writer = csv.writer(file)
+            writer.writerow(['Date', 'Offset', 'Compressed Offset'])
+            for day, (starts, positions) in self.__blocks.items():
+                writer.writerows([day, start, position] for start, position in zip(starts, positions))
+        _atomic_write(self.index_path, index)
+        self.__version = self.__stat()
+
+    def __contains__(self, date):
+        self.__load()
+        return date in self.__blocks
+
+    def segment_path(self, date):
+        return os.path.join(self.directory, 'sales_' + date + '.csv.gz')
+
+    #Compress a day's sales csv into its segment and remove the csv, the segment is complete and
+    #indexed before the csv goes, so an interrupted archive is simply done again. A day already in the
+    #archive is compressed again from its csv, which is the newer copy: it was put back by restore and
+    #may have rows added since, or a crash stopped a restore before the index entry was dropped
+    def add(self, date, path):
+        self.__load()
+        os.makedirs(self.directory, exist_ok=True)
+        starts, positions = [], []
+        def compress(out):
+            with open(path, 'rb') as source:
+                while True:
+                    data = source.read(self.__block_size)
+                    if not data:
+                        break
+                    #members end on a row boundary
+                    data += source.readline()
+                    starts.append(source.tell() - len(data))
+                    positions.append(out.tell())
+                    out.write(gzip.compress(data, mtime=0))
+        _atomic_write(self.segment_path(date), compress, 'wb')
+        self.__blocks[date] = (starts, positions)
+        self.__save()
+        os.remove(path)
+
+    #The rows starting at the given offsets of the day's csv, as bytes in the same order
+    def read_lines(self, date, offsets):
+        self.__load()
+        starts, positions = self.__blocks[date]
+        members = {}
+        lines = []
+        with open(self.segment_path(date), 'rb') as file:
+            for offset in offsets:
+                i = bisect.bisect_right(starts, offset) - 1
+                if i not in members:
+                    file.seek(positions[i])
+                    members[i] = gzip.decompress(file.read(positions[i + 1] - positions[i]) if i + 1 < len(positions) else file.read())
+                data = members[i]
+                start = offset - starts[i]
+                lines.append(data[start:data.index(b'\n', start) + 1])
+        return lines
+
+    #Put a day back as a plain sales csv, when sales are recorded on that date again. The csv is complete
+    #before the index entry and the segment go; if a crash leaves both, the csv wins and add archives it again
+    def restore(self, date, path):
+        self.__load()
+        def decompress(out):
+            with gzip.open(self.segment_path(date), 'rb') as source:
+                shutil.copyfileobj(source, out)
+        _atomic_write(path, decompress, 'wb')
+        del self.__blocks[date]
+        self.__save()
+        os.remove(self.segment_path(date))
+
+class ContactIndex:
+    #Contact number -> (date, byte offset) of each of their rows in the daily sales csv files
+    #Kept in an append-only csv, each lookup first indexes only the sales rows added since the last one
+    #Rows of archived days are read from their segment at the same offsets
+    def __init__(self, directory, path, archive=None):
+        self.directory = directory
+        self.path = path
+        self.archive = archive
+        self.__offsets = None
+        #date -> (bytes of that day's sales file already indexed, inode of the file)
+        self.__indexed = {}
+
+    def __load(self):
+        self.__offsets = {}
+        try:
+            with open(self.path, newline='') as file:
+                for row in itertools.islice(csv.reader(file), 1, None):
+                    date, offset, contact = row[:3]
+                    if contact:
+                        self.__offsets.setdefault(int(float(contact)), []).append((date, int(offset)))
+                    else:
+                        #a row without contact marks how far the day's file is indexed, and which file it was;
+                        #indexes written before the file was recorded are redone once
+                        self.__indexed[date] = (int(offset), int(row[3]) if len(row) > 3 and row[3] else None)
+        except FileNotFoundError:
+            pass
+
+    #Write the whole index again, after a day was indexed from the start
+    def __save(self):
+        def write(file):
+            writer = csv.writer(file)
+            writer.writerow(['Date', 'Offset', 'Contact', 'File'])
+            writer.writerows([date, offset, contact] for contact, entries in self.__offsets.items() for date, offset in entries)
+            writer.writerows([date, offset, '', inode] for date, (offset, inode) in self.__indexed.items())
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        _atomic_write(self.path, write)
+
+    #Index the rows appended to every day's sales file since the last update
+    def update(self):
+        if self.__offsets is None:
+            self.__load()
+        new_rows = []
+        reindexed = False
+        for name in sorted(os.listdir(self.directory)):
+            if not (name.startswith('sales_list_') and name.endswith('.csv')):
+                continue
+            date = name[len('sales_list_'):-len('.csv')]
+            path = os.path.join(self.directory, name)
+            stat = os.stat(path)
+            done, inode = self.__indexed.get(date, (0, stat.st_ino))
+            if stat.st_size == done and stat.st_ino == inode:
+                continue
+            if stat.st_ino != inode or stat.st_size < done:
+                #the file was rewritten, e.g. put back from the archive, index it again from the start
+                for entries in self.__offsets.values():
+                    entries[:] = [entry for entry in entries if entry[0] != date]
+                done = 0
+                reindexed = True
+            with open(path, 'rb') as file:
+                header = next(csv.reader([file.readline().decode()]))
+                column = header.index('Contact')
+                offset = max(done, file.tell())
+                file.seek(offset)
+                for line in file:
+                    if not line.endswith(b'\n'):
+                        break
+                    contact = next(csv.reader([line.decode()]))[column]
+                    if contact:
+                        contact = int(float(contact))
+                        self.__offsets.setdefault(contact, []).append((date, offset))
+                        new_rows.append([date, offset, contact])
+                    offset += len(line)
+            INSTRUMENTS.count('bytes_read', 'contact_index', offset - done)
+            self.__indexed[date] = (offset, stat.st_ino)
+            new_rows.append([date, offset, '', stat.st_ino])
+        if reindexed:
+            #rows of the old file are not left behind to be loaded again
+            self.__save()
+        elif new_rows:
+            new_file = not os.path.exists(self.path)
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path, 'a', newline='') as file:
+                writer = csv.writer(file)
+                if new_file:
+                    writer.writerow(['Date', 'Offset', 'Contact', 'File'])
+                writer.writerows(new_rows)
+
+    #Sales rows of a contact over all days, read straight from their offsets
+    def history(self, contact):
+        self.update()
+        offsets_by_date = {}
+        for date, offset in sorted(self.__offsets.get(contact, [])):
+            offsets_by_date.setdefault(date, []).append(offset)
+        frames = []
+        for date, offsets in offsets_by_date.items():
+            path = os.path.join(self.directory, 'sales_list_' + date + '.csv')
+            if not os.path.exists(path) and self.archive is not None and date in self.archive:
+                #the header is the row at offset 0
+                lines = self.archive.read_lines(date, [0] + offsets)
+            elif not os.path.exists(path):
+                #the day's file was removed without being archived
+                continue
+            else:
+                with open(path, 'rb') as file:
+                    lines = [file.readline()]
+                    for offset in offsets:
+                        file.seek(offset)
+                        lines.append(file.readline())
+            frames.append(pd.read_csv(io.BytesIO(b''.join(lines)), dtype=SALES_DTYPES).assign(Date=date))
+        if not frames:
+            return _typed(pd.DataFrame(columns=['Date'] + SALES_COLUMNS), SALES_DTYPES)
+        return _typed(pd.concat(frames, ignore_index=True).reindex(columns=['Date'] + SALES_COLUMNS), SALES_DTYPES)
+
+#Dates from start to end inclusive, both yyyyMMdd strings
+def _dates_between(start, end):
+    day = datetime.strptime(start, '%Y%m%d')
+    last = datetime.strptime(end, '%Y%m%d')
+    while day <= last:
+        yield day.strftime('%Y%m%d')
+        day += timedelta(days=1)
+
+#Convert a cell value into something sqlite can store
+def _sql_value(value):
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if isinstance(value, (datetime, dt_time)):
+        return str(value)
+    if hasattr(value, 'item'):
+        return value.item()
+    return value
+
+class CsvStorage:
+    #Default storage: inventory in bicycle_db.csv saved write-behind, sales appended to sales_list_<date>.csv
+    #With shared=True several processes can use the same files: changes are written through under a lock file
+    #and the inventory is read again whenever another process has saved it since
+    def __init__(self, directory='.', db='bicycle_db.csv', shared=False):
+        self.directory = directory
+        self.db = os.path.join(directory, db)
+        self.reservations = os.path.join(directory, 'reservations.csv')
+        self.journal = None
+        self.__date = None
+        self.shared = shared
+        self.write_behind = not shared
+        #(mtime, size) of the inventory file when this process last read or wrote it
+        self.__version = None
+        self.__booking_version = None
+        self.__lock_file = None
+        self.__lock_depth = 0
+        #changes not yet in the inventory snapshot, only needed while saving is write-behind
+        self.wal = WriteAheadLog(os.path.splitext(self.db)[0] + '.wal')
+        self.archive = SalesArchive(os.path.join(directory, 'sales_archive'))
+        self.contacts = ContactIndex(directory, os.path.join(directory, 'sales_cache', 'contacts.csv'), self.archive)
+
+    def __stat(self, path=None):
+        try:
+            stat = os.stat(path or self.db)
+            return stat.st_mtime_ns, stat.st_size
+        except FileNotFoundError:
+            return None
+
+    #Exclusive advisory lock around a read-modify-write, re-entrant within the process
+    @contextlib.contextmanager
+    def locked(self):
+        if not self.shared or fcntl is None:
+            yield
+            return
+        if self.__lock_depth == 0:
+            self.__lock_file = open(self.db + '.lock', 'a')
+            fcntl.flock(self.__lock_file, fcntl.LOCK_EX)
+        self.__lock_depth += 1
+        try:
+            yield
+        finally:
+            self.__lock_depth -= 1
+            if self.__lock_depth == 0:
+                fcntl.flock(self.__lock_file, fcntl.LOCK_UN)
+                self.__lock_file.close()
+
+    #True when another process saved the inventory or the reservations after we last read or wrote them
+    def changed(self):
+        return self.shared and (self.__stat() != self.__version or self.__stat(self.reservations) != self.__booking_version)
+
+    #Read the whole inventory, creating the file when it does not exist yet
+    def load_inventory(self, columns):
+        try:
+            df = _read_csv(self.db, INVENTORY_DTYPES)
+        except FileNotFoundError:
+            df = pd.DataFrame(columns=columns)
+            df.to_csv(self.db, index=False)
+        self.__version = self.__stat()
+        return df
+
+    #The new inventory snapshot replaces the file in one rename
+    def save_inventory(self, df):
+        with INSTRUMENTS.timer('stage', 'csv_write'):
+            _atomic_write(self.db, lambda file: _csv_frame(df).to_csv(file, index=False))
+        self.__version = self.__stat()
+        INSTRUMENTS.count('rows_written', 'inventory', len(df))
+        INSTRUMENTS.count('bytes_written', 'inventory', self.__version[1])
+
+    #Booked bikes, one dict per bike of a reservation with the start and end as datetimes
+    def load_reservations(self):
+        try:
+            with open(self.reservations, newline='') as file:
+                rows = [dict(row, Start=datetime.fromisoformat(row['Start']), End=datetime.fromisoformat(row['End'])) for row in csv.DictReader(file)]
+        except FileNotFoundError:
+            rows = []
+        self.__booking_version = self.__stat(self.reservations)
+        return rows
+
+    def save_reservations(self, rows):
+        def write(file):
+            writer = csv.DictWriter(file, RESERVATION_COLUMNS)
+            writer.writeheader()
+            writer.writerows(rows)
+        _atomic_write(self.reservations, write)
+        self.__booking_version = self.__stat(self.reservations)
+
+    #Number of bikes per (Bike Type, Status) as the process using the files has them, the snapshot with
+    #the changes logged since it was saved; only those columns are read and nothing is written
+    def inventory_counts(self):
+        while True:
+            version = self.__stat()
+            try:
+                df = pd.read_csv(self.db, usecols=['Serial Number', 'Bike Type', 'Status'], dtype=str)
+            except FileNotFoundError:
+                df = pd.DataFrame(columns=['Serial Number', 'Bike Type', 'Status'])
+            entries = self.wal.entries()
+            #a checkpoint in between may have emptied the log the snapshot was read without, read both again
+            if self.__stat() == version:
+                break
+        types = dict(zip(df['Serial Number'], df['Bike Type']))
+        statuses = dict(zip(df['Serial Number'], df['Status']))
+        for entry in entries:
+            if entry['op'] == 'add':
+                types.update(dict.fromkeys(entry['sns'], entry['values']['Bike Type']))
+                statuses.update(dict.fromkeys(entry['sns'], entry['values']['Status']))
+            elif entry['op'] == 'set' and 'Status' in entry['values']:
+                statuses.update((sn, entry['values']['Status']) for sn in entry['sns'] if sn in statuses)
+        counts = {}
+        for sn, status in statuses.items():
+            counts[(types[sn], status)] = counts.get((types[sn], status), 0) + 1
+        return counts
+
+    def sales_path(self, todaydate):
+        return os.path.join(self.directory, 'sales_list_' + todaydate + '.csv')
+
+    #Open the sales journal of the day, returns True when the day has no sales file yet
+    #An archived day that is opened again is put back as a plain csv first
+    def open_sales(self, todaydate, columns):
+        path = self.sales_path(todaydate)
+        if not os.path.exists(path) and todaydate in self.archive:
+            self.archive.restore(todaydate, path)
+        new_day = not os.path.exists(path)
+        if self.journal is not None:
+            self.journal.close()
+        self.journal = SalesJournal(path, columns)
+        self.__date = todaydate
+        return new_day
+
+    def load_sales(self):
+        self.journal.sync()
+        return _read_csv(self.journal.path, SALES_DTYPES)
+
+    #Sales totals of the day, streamed from the file in chunks
+    def day_metrics(self):
+        self.journal.sync()
+        return SalesMetrics.from_csv(self.journal.path)
+
+    #Record inventory changes in the write-ahead log until the next snapshot, files that are shared
+    #are saved as a whole on every change instead. The csv text of the operation's sales rows and where
+    #it starts in the journal go in the same write, so a crash never keeps the one without the other
+    def log(self, entries, sales_rows=()):
+        if not self.write_behind:
+            return
+        if sales_rows:
+            entries = entries + [{'op': 'sales', 'date': self.__date, 'offset': self.journal.size(), 'text': self.journal.encode(sales_rows)}]
+        if entries:
+            self.wal.append(entries)
+
+    #Logged changes to replay over the snapshot after a crash, the sales rows among them that had not
+    #reached the day's csv yet are written back to it first
+    def recover(self):
+        if not self.write_behind:
+            return []
+        entries = self.wal.entries()
+        for entry in entries:
+            if entry['op'] == 'sales':
+                self.__recover_sales(entry)
+        return entries
+
+    def __recover_sales(self, entry):
+        path = self.sales_path(entry['date'])
+        #An archived day was synced when it was closed
+        if not os.path.exists(path):
+            return
+        data = entry['text'].encode()
+        with open(path, 'r+b') as file:
+            size = file.seek(0, os.SEEK_END)
+            if size >= entry['offset'] + len(data):
+                return
+            #Drop a torn last row and write the logged rows in its place
+            file.truncate(min(size, entry['offset']))
+            file.seek(0, os.SEEK_END)
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+
+    #The snapshot just saved holds every logged change, and the journal every logged sales row
+    def checkpoint(self):
+        if self.write_behind:
+            self.sync()
+            #a sales file started since the last checkpoint is in the folder on disk before the log is emptied
+            _sync_directory(self.directory)
+            self.wal.truncate()
+
+    #Sales rows are appended right away, the inventory waits for save_inventory unless the files are shared
+    def commit(self, inventory, changed, sales_rows):
+        if sales_rows:
+            self.journal.append(sales_rows)
+        if self.shared:
+            #Without a write-ahead log the sales rows are on disk before the inventory that goes with them
+            self.journal.sync()
+            self.save_inventory(inventory)
+
+    #Sync the write-ahead log once for all operations of the block
+    def group_commit(self):
+        return self.wal.group()
+
+    #Compress the sales csv of every day before todaydate into the archive. Shared files keep the day before
+    #as a plain csv for one more day, another counter may still be recording sales on it
+    def archive_sales(self, todaydate):
+        last = todaydate
+        if self.shared:
+            last = (datetime.strptime(todaydate, '%Y%m%d') - timedelta(days=1)).strftime('%Y%m%d')
+        #index the contacts of the closed days while they are plain csv
+        self.contacts.update()
+        for name in sorted(os.listdir(self.directory)):
+            if name.startswith('sales_list_') and name.endswith('.csv') and name[len('sales_list_'):-len('.csv')] < last:
+                self.archive.add(name[len('sales_list_'):-len('.csv')], os.path.join(self.directory, name))
+
+    #Sales totals of every day in [start, end] except skip_date, closed days are cached as .npz next to the csv files
+    def sales_metrics_range(self, start, end, skip_date=None, workers=None):
+        cache_dir = os.path.join(self.directory, 'sales_cache')
+        metrics = SalesMetrics()
+        todo = []
+        for todaydate in _dates_between(start, end):
+            path = self.sales_path(todaydate)
+            if not os.path.exists(path) and todaydate in self.archive:
+                path = self.archive.segment_path(todaydate)
+            if todaydate == skip_date or not os.path.exists(path):
+                continue
+            stat = os.stat(path)
+            source = np.array([stat.st_mtime_ns, stat.st_size])
+            cache = os.path.join(cache_dir, todaydate + '.npz')
+            try:
+                with np.load(cache) as arrays:
+                    if np.array_equal(arrays['source'], source):
+                        metrics.merge(SalesMetrics.from_arrays(arrays))
+                        continue
+            except (FileNotFoundError, KeyError, ValueError):
+                pass
+            todo.append((path, cache, source))
+        #Parse the uncached days in parallel, one file per task
+        paths = [path for path, cache, source in todo]
+        if len(paths) > 1 and workers != 1:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(workers) as pool:
+                parts = list(pool.map(_sales_file_metrics, paths))
+        else:
+            parts = [_sales_file_metrics(path) for path in paths]
+        for (path, cache, source), part in zip(todo, parts):
+            os.makedirs(cache_dir, exist_ok=True)
+            np.savez(cache, source=source, **part.to_arrays())
+            metrics.merge(part)
+        return metrics
+
+    #Every sales row of a contact number across the days, with the day in a 'Date' column
+    def contact_history(self, contact):
+        self.sync()
+        with self.locked(), INSTRUMENTS.timer('stage', 'contact_lookup'):
+            return self.contacts.history(contact)
+
+    def sync(self):
+        if self.journal is not None:
+            self.journal.sync()
+
+    def close(self):
+        if self.journal is not None:
+            self.journal.close()
+        self.wal.close()
+
+class SqliteStorage:
+    #Inventory and sales in one sqlite file, every rent/return is committed as a single transaction
+    write_behind = False
+    shared = False
+
+    def __init__(self, path='bicycle_rental.db', import_from='.'):
+        self.path = path
+        self.__tableName = "bicycles"
+        self.__salestableName = "sales"
+        self.__date = None
+        self.__columns = None
+        self.__conn = sqlite3.connect(path)
+        self.__import_from = import_from
+
+    #Create tables and indexes, and import the csv files the first time the database is used
+    def __setup(self, columns, salescolumns):
+        if self.__columns is not None:
+            return
+        self.__columns = columns
+        self.__salescolumns = salescolumns
+        conn = self.__conn
+        inv_cols = ', '.join(f'"{col}" TEXT PRIMARY KEY' if col == 'Serial Number' else f'"{col}"' for col in columns)
+        sales_cols = ', '.join(f'"{col}"' for col in ['Date'] + salescolumns)
+        booking_cols = ', '.join(f'"{col}"' for col in RESERVATION_COLUMNS)
+        with conn:
+            conn.execute(f'CREATE TABLE IF NOT EXISTS {self.__tableName} ({inv_cols})')
+            conn.execute(f'CREATE INDEX IF NOT EXISTS {self.__tableName}_type_status ON {self.__tableName} ("Bike Type", "Status")')
+            conn.execute(f'CREATE TABLE IF NOT EXISTS {self.__salestableName} ({sales_cols})')
+            conn.execute(f'CREATE INDEX IF NOT EXISTS {self.__salestableName}_time ON {self.__salestableName} ("Date", "Time")')
+            conn.execute(f'CREATE INDEX IF NOT EXISTS {self.__salestableName}_contact ON {self.__salestableName} ("Contact")')
+            conn.execute('CREATE TABLE IF NOT EXISTS days ("Date" TEXT PRIMARY KEY)')
+            conn.execute(f'CREATE TABLE IF NOT EXISTS reservations ({booking_cols})')
+        empty = conn.execute(f'SELECT COUNT(*) FROM {self.__tableName}').fetchone()[0] == 0
+        if empty and self.__import_from is not None:
+            self.import_csv(self.__import_from)
+
+    #Import bicycle_db.csv and every sales_list_<date>.csv of a folder, days already in the database are skipped
+    def import_csv(self, directory):
+        conn = self.__conn
+        db = os.path.join(directory, 'bicycle_db.csv')
+        with conn:
+            if os.path.exists(db):
+                self.__upsert(_read_csv(db, INVENTORY_DTYPES))
+            for name in sorted(os.listdir(directory)):
+                if not (name.startswith('sales_list_') and name.endswith('.csv')):
+                    continue
+                todaydate = name[len('sales_list_'):-len('.csv')]
+                if conn.execute('SELECT 1 FROM days WHERE "Date"=?', (todaydate,)).fetchone():
+                    continue
+                sales_df = _csv_frame(_read_csv(os.path.join(directory, name), SALES_DTYPES)).reindex(columns=self.__salescolumns)
+                self.__insert_sales(todaydate, sales_df.to_dict('records'))
+                conn.execute('INSERT INTO days VALUES (?)', (todaydate,))
+
+    def __upsert(self, df):
+        cols = ', '.join(f'"{col}"' for col in self.__columns)
+        marks = ', '.join('?' * len(self.__columns))
+        rows = _csv_frame(df.reindex(columns=self.__columns)).itertuples(index=False, name=None)
+        updates = ', '.join(f'"{col}"=excluded."{col}"' for col in self.__columns if col != 'Serial Number')
+        self.__conn.executemany(f'INSERT INTO {self.__tableName} ({cols}) VALUES ({marks}) ON CONFLICT("Serial Number") DO UPDATE SET {updates}', [[_sql_value(v) for v in row] for row in rows])
+
+    def __insert_sales(self, todaydate, sales_rows):
+        cols = ', '.join(f'"{col}"' for col in ['Date'] + self.__salescolumns)
+        marks = ', '.join('?' * (len(self.__salescolumns) + 1))
+        self.__conn.executemany(f'INSERT INTO {self.__salestableName} ({cols}) VALUES ({marks})', [[todaydate] + [_sql_value(row.get(col)) for col in self.__salescolumns] for row in sales_rows])
+
+    def load_inventory(self, columns):
+        self.__setup(columns, SALES_COLUMNS)
+        with INSTRUMENTS.timer('stage', 'sqlite_read'):
+            df = _typed(pd.read_sql_query(f'SELECT * FROM {self.__tableName} ORDER BY rowid', self.__conn), INVENTORY_DTYPES)
+        INSTRUMENTS.count('rows_read', 'inventory', len(df))
+        return df
+
+    def save_inventory(self, df):
+        with self.__conn, INSTRUMENTS.timer('stage', 'sqlite_write'):
+            self.__conn.execute(f'DELETE FROM {self.__tableName}')
+            self.__upsert(df)
+        INSTRUMENTS.count('rows_written', 'inventory', len(df))
+
+    def load_reservations(self):
+        cols = ', '.join(f'"{col}"' for col in RESERVATION_COLUMNS)
+        cursor = self.__conn.execute(f'SELECT {cols} FROM reservations ORDER BY rowid')
+        return [dict(zip(RESERVATION_COLUMNS, row), Start=datetime.fromisoformat(row[4]), End=datetime.fromisoformat(row[5])) for row in cursor]
+
+    #Reservations are few next to the inventory, the table is rewritten as a whole in one transaction
+    def save_reservations(self, rows):
+        with self.__conn:
+            self.__conn.execute('DELETE FROM reservations')
+            marks = ', '.join('?' * len(RESERVATION_COLUMNS))
+            self.__conn.executemany(f'INSERT INTO reservations VALUES ({marks})',
+                                    [[_sql_value(row[col]) for col in RESERVATION_COLUMNS] for row in rows])
+
+    def inventory_counts(self):
+        rows = self.__conn.execute(f'SELECT "Bike Type", "Status", COUNT(*) FROM {self.__tableName} GROUP BY 1, 2')
+        return {(biketype, status): count for biketype, status, count in rows}
+
+    def open_sales(self, todaydate, columns):
+        self.__date = todaydate
+        with self.__conn:
+            return self.__conn.execute('INSERT OR IGNORE INTO days VALUES (?)', (todaydate,)).rowcount == 1
+
+    def load_sales(self):
+        cols = ', '.join(f'"{col}"' for col in self.__salescolumns)
+        with INSTRUMENTS.timer('stage', 'sqlite_read'):
+            df = _typed(pd.read_sql_query(f'SELECT {cols} FROM {self.__salestableName} WHERE "Date"=? ORDER BY rowid', self.__conn, params=(self.__date,)), SALES_DTYPES)
+        INSTRUMENTS.count('rows_read', 'sales', len(df))
+        return df
+
+    #Closed days stay in the sales table, which is compact and indexed by date already
+    def archive_sales(self, todaydate):
+        pass
+
+    #Sales totals of the day, grouped by the database
+    def day_metrics(self):
+        return self.sales_metrics_range(self.__date, self.__date)
+
+    #Sales totals of every day in [start, end] except skip_date, grouped by the database
+    def sales_metrics_range(self, start, end, skip_date=None, workers=None):
+        rows = self.__conn.execute(f'SELECT "Bike Type", "Transaction Type", CAST(substr("Time", 1, 2) AS INTEGER), SUM("Amount"), COUNT(*) '
+                                   f'FROM {self.__salestableName} WHERE "Date" BETWEEN ? AND ? AND "Date" IS NOT ? '
+                                   f'GROUP BY 1, 2, 3', (start, end, skip_date))
+        metrics = SalesMetrics()
+        for biketype, transaction, hour, amount, count in rows:
+            metrics.add_totals(biketype, transaction, hour, amount, count)
+        return metrics
+
+    #Every sales row of a contact number across the days, looked up through the contact index
+    def contact_history(self, contact):
+        cols = ', '.join(f'"{col}"' for col in ['Date'] + self.__salescolumns)
+        return _typed(pd.read_sql_query(f'SELECT {cols} FROM {self.__salestableName} WHERE "Contact"=? ORDER BY rowid', self.__conn, params=(contact,)), SALES_DTYPES)
+
+    #Changed inventory rows and their sales rows are written in one transaction
+    def commit(self, inventory, changed, sales_rows):
+        INSTRUMENTS.count('rows_written', 'inventory', len(changed))
+        INSTRUMENTS.count('rows_written', 'sales', len(sales_rows))
+        with self.__conn, INSTRUMENTS.timer('stage', 'sqlite_commit'):
+            if changed:
+                self.__upsert(inventory.loc[changed])
+            if sales_rows:
+                self.__insert_sales(self.__date, sales_rows)
+
+    def locked(self):
+        return contextlib.nullcontext()
+
+    #Every change is its own sqlite transaction
+    def group_commit(self):
+        return contextlib.nullcontext()
+
+    def changed(self):
+        return False
+
+    #Every change is already committed as a sqlite transaction
+    def log(self, entries, sales_rows=()):
+        pass
+
+    def recover(self):
+        return []
+
+    def checkpoint(self):
+        pass
+
+    def sync(self):
+        pass
+
+    def close(self):
+        self.__conn.close()
+
+#Hour of a sales 'Time' value, which is a time object or a HH:MM:SS string
+def _sale_hour(value):
+    if hasattr(value, 'hour'):
+        return value.hour
+    try:
+        return datetime.strptime(str(value), '%H:%M:%S').hour
+    except ValueError:
+        return None
+
+#Hours of the day of a sales 'Time' column, text times are parsed once per distinct value
+def _sale_hours(times):
+    if pd.api.types.is_timedelta64_dtype(times):
+        return times // pd.Timedelta(hours=1)
+    times = times.astype('category')
+    hours = (_timedeltas(pd.Series(times.cat.categories)) // pd.Timedelta(hours=1)).to_numpy(dtype=float)
+    #code -1 (a missing time) picks the NaN appended at the end
+    return pd.Series(np.append(hours, np.nan)[times.cat.codes.to_numpy()], index=times.index)
+
+#Rows per chunk when a sales file is aggregated as a stream
+SALES_CHUNK_ROWS = 100000
+
+class SalesMetrics:
+    #Running sales totals per bike type, transaction type and hour, updated as each sale is recorded
+    def __init__(self):
+        self.revenue_by_type = {}
+        self.number_by_type = {}
+        self.revenue_by_transaction = {}
+        self.number_by_transaction = {}
+        self.hourly_revenue = {}
+
+    #Rebuild the totals from a sales frame with one grouped pass over (Bike Type, Transaction Type, hour)
+    @classmethod
+    def from_sales(cls, sales_df):
+        metrics = cls()
+        with INSTRUMENTS.timer('stage', 'report_aggregate'):
+            hours = _sale_hours(sales_df["Time"])
+            grouped = sales_df.groupby([sales_df["Bike Type"], sales_df["Transaction Type"], hours], dropna=False, observed=True)["Amount"].agg(['sum', 'count'])
+        for (biketype, transaction, hour), amount, count in zip(grouped.index, grouped['sum'], grouped['count']):
+            metrics.add_totals(biketype, transaction, None if pd.isna(hour) else int(hour), amount, count)
+        return metrics
+
+    #Totals of a sales csv folded chunk by chunk, only the four columns needed are read,
+    #so memory stays bounded by chunk_rows whatever the size of the day
+    @classmethod
+    def from_csv(cls, path, chunk_rows=SALES_CHUNK_ROWS):
+        metrics = cls()
+        columns = ['Bike Type', 'Transaction Type', 'Time', 'Amount']
+        with pd.read_csv(path, usecols=columns, dtype={col: 'category' for col in columns[:3]}, chunksize=chunk_rows) as chunks:
+            for chunk in chunks:
+                INSTRUMENTS.count('rows_read', 'sales', len(chunk))
+                metrics.merge(cls.from_sales(chunk))
+        return metrics
+
+    #Add the amount and count of sales of one bike type, transaction type and hour
+    def add_totals(self, biketype, transaction, hour, amount, count):
+        self.revenue_by_type[biketype] = self.revenue_by_type.get(biketype, 0) + amount
+        self.number_by_type[biketype] = self.number_by_type.get(biketype, 0) + count
+        self.revenue_by_transaction[transaction] = self.revenue_by_transaction.get(transaction, 0) + amount
+        self.number_by_transaction[transaction] = self.number_by_transaction.get(transaction, 0) + count
+        if hour is not None:
+            self.hourly_revenue[hour] = self.hourly_revenue.get(hour, 0) + amount
+
+    #Add newly recorded sales rows (dicts keyed by sales column)
+    def add(self, rows):
+        for row in rows:
+            self.add_totals(row['Bike Type'], row['Transaction Type'], _sale_hour(row['Time']), row['Amount'], 1)
+
+    #Add the totals of another set of sales, e.g. another day
+    def merge(self, other):
+        for mine, theirs in [(self.revenue_by_type, other.revenue_by_type), (self.number_by_type, other.number_by_type),
+                             (self.revenue_by_transaction, other.revenue_by_transaction), (self.number_by_transaction, other.number_by_transaction),
+                             (self.hourly_revenue, other.hourly_revenue)]:
+            for key, value in theirs.items():
+                mine[key] = mine.get(key, 0) + value
+        return self
+
+    def report(self, todaydate):
+        return SalesReport(todaydate, dict(self.revenue_by_type), dict(self.number_by_type), dict(self.hourly_revenue))
+
+    #Compact columnar form of the totals, used for the cache of closed days
+    def to_arrays(self):
+        arrays = {}
+        for name in ['revenue_by_type', 'number_by_type', 'revenue_by_transaction', 'number_by_transaction', 'hourly_revenue']:
+            totals = getattr(self, name)
+            arrays[name + '_keys'] = np.array([str(key) for key in totals], dtype=str)
+            arrays[name] = np.array(list(totals.values()))
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        metrics = cls()
+        for name in ['revenue_by_type', 'number_by_type', 'revenue_by_transaction', 'number_by_transaction', 'hourly_revenue']:
+            keys = arrays[name + '_keys'].tolist()
+            if name == 'hourly_revenue':
+                keys = [int(key) for key in keys]
+            values = arrays[name].tolist()
+            if name.startswith('number'):
+                values = [int(value) for value in values]
+            setattr(metrics, name, dict(zip(keys, values)))
+        return metrics
+
+#Sales totals of one daily sales csv, run in worker processes for range reports
+def _sales_file_metrics(path):
+    return SalesMetrics.from_csv(path)
+
+class SalesReport:
+    #Sales figures of one day, computed once and rendered for both the console and the text file
+    bike_types = ["adult", "kid", "tandem", "family", "pgk"]
+
+    def __init__(self, todaydate, revenue_by_type, number_by_type, hourly_revenue):
+        self.todaydate = todaydate
+        self.revenue_by_type = revenue_by_type
+        self.number_by_type = number_by_type
+        #revenue keyed by hour of the day, in hour order
+        self.hourly_revenue = dict(sorted(hourly_revenue.items()))
+        self.total_revenue = sum(revenue_by_type.values())
+        self.total_number = sum(number_by_type.values())
+        #Top 3 hours, earlier hour first when revenue is equal
+        self.top_hours = sorted(self.hourly_revenue.items(), key=lambda x: x[1], reverse=True)[:3]
+
+    #Report of a sales frame, aggregated in one grouped pass
+    @classmethod
+    def from_sales(cls, sales_df, todaydate):
+        return SalesMetrics.from_sales(sales_df).report(todaydate)
+
+    def proportions(self, values, total):
+        if total != 0:
+            return [value / total for value in values]
+        return [0] * len(values)
+
+    #Report text as shown on screen
+    def render(self):
+        with INSTRUMENTS.timer('stage', 'report_render'):
+            return self.__render()
+
+    def __render(self):
+        bike_types = self.bike_types
+        lines = []
+        lines.append(f"SALES REPORT     Date: {self.todaydate}\n")
+
+        # I. Total Revenue
+        lines.append("I. Total Revenue")
+        lines.append(f"The total revenue: ${self.total_revenue}\n")
+        # Revenue by bike type
+        revenue_by_types = [self.revenue_by_type.get(bike_type, 0) for bike_type in bike_types]
+        revenue_proportions = self.proportions(revenue_by_types, self.total_revenue)
+        # Table
+        max_length = max(len(bike_type) for bike_type in bike_types)
+        lines.append("Bike Type\tRevenue\tProportion")
+        lines.append("-----------------------------------")
+        for i, bike_type in enumerate(bike_types):
+            padding = " " * (len("bike_type") - len(bike_type))
+            lines.append(f"{bike_type}{padding}\t${revenue_by_types[i]:6.2f}\t{revenue_proportions[i]:06.2%}")
+        lines.append("-----------------------------------\n")
+        # Bar chart
+        sorted_data = sorted(zip(bike_types, revenue_proportions), key=lambda x: x[1], reverse=True)
+        lines.append("Revenue Ranking\n")
+        for bike_type, revenue_proportion in sorted_data:
+            bar = "#" * int(revenue_proportion * 40)
+            space = " " * (max_length - len(bike_type))
+            lines.append(f"{bike_type}{space}\t | {bar}  {revenue_proportion:.2%}\n")
+        lines.append("\n")
+
+        # II. Popularity
+        lines.append("II. Popularity")
+        lines.append(f"The total number of bicycles rented: {self.total_number}\n")
+        # Number by bike type
+        number_by_types = [self.number_by_type.get(bike_type, 0) for bike_type in bike_types]
+        number_proportions = self.proportions(number_by_types, self.total_number)
+        # Table
+        lines.append("Bike Type\tNumber\tProportion")
+        lines.append("-----------------------------------")
+        for i, bike_type in enumerate(bike_types):
+            padding = " " * (len("bike_type") - len(bike_type))
+            padding_2 = " " * (len("Number") - len(str(number_by_types[i])))
+            lines.append(f"{bike_type}{padding}\t{number_by_types[i]}{padding_2}\t{number_proportions[i]:06.2%}")
+        lines.append("-----------------------------------\n")
+        # Bar chart
+        sorted_number = sorted(zip(bike_types, number_proportions), key=lambda x: x[1], reverse=True)
+        lines.append("Popularity Ranking\n")
+        for bike_type, number_proportion in sorted_number:
+            bar = "#" * int(number_proportion * 40)
+            space = " " * (max_length - len(bike_type))
+            lines.append(f"{bike_type}{space}\t | {bar}  {number_proportion:.2%}\n")
+        lines.append("\n")
+
+        # III. Hourly Revenue
+        lines.append("III. Hourly revenue")
+        # Top 3 Hours of Revenue
+        if self.hourly_revenue:
+            lines.append("Top 3 Hours of Revenue:\n")
+            for hour, h_revenue in self.top_hours:
+                lines.append(f"Hour {hour:02}:00 - {hour+1:02}:00: ${h_revenue:.2f}")
+            lines.append("\n")
+        else:
+            lines.append("Hourly revenue data is empty.\n")
+        # Hourly Revenue Plot
+        lines.append("Hourly Revenue Plot")
+        max_revenue = max(self.hourly_revenue.values(), default=0)
+        for hour in range(24):
+            hourly_revenue_amount = self.hourly_revenue.get(hour, 0)
+            if hourly_revenue_amount > 0:
+                scaled_amount = int(hourly_revenue_amount / max_revenue * 40)
+                lines.append(f"{hour:02}:00 - {hour+1:02}:00 | {'*' * scaled_amount} ${hourly_revenue_amount:.2f}")
+        lines.append("\n")
+        return "\n".join(lines) + "\n"
+
+class InventoryPage:
+    #One page of a filtered inventory query, with the bike counts of the whole fleet from the status index
+    def __init__(self, rows, total, page, page_size, counts):
+        self.rows = rows
+        self.total = total
+        self.page = page
+        self.page_size = page_size
+        #number of bikes per (Bike Type, Status)
+        self.counts = counts
+        self.pages = max(1, math.ceil(total / page_size))
+
+    #Page text as shown on screen
+    def render(self):
+        lines = []
+        first = (self.page - 1) * self.page_size + 1 if self.total else 0
+        lines.append(f"Bicycles {first}-{first + len(self.rows) - 1 if self.total else 0} of {self.total}     Page {self.page} of {self.pages}")
+        if len(self.rows):
+            with pd.option_context('display.float_format', '{:.2f}'.format):
+                lines.append(self.rows.to_string(index=False))
+        else:
+            lines.append("No bicycles found.")
+        lines.append("\nInformation on Bicycles Available for Rent:")
+        lines.append(f"{'Bike Type':<5s}      {'Total Number Avaliable':>5s}")
+        for (bike_type, status), count in sorted(self.counts.items()):
+            if status == 'In' and count:
+                lines.append(f"{bike_type:<10s}  {count:>20d}")
+        lines.append(f"\nRented bicycles outside: {sum(count for (bike_type, status), count in self.counts.items() if status == 'Out')}")
+        return "\n".join(lines) + "\n"
+
+#Items start to start + count of lists chained one after another, whole lists before the start are skipped
+#by size and the page is sliced out of the rest, so a deep page costs the same as the first one
+def _page_of(groups, start, count):
+    page = []
+    for group in groups:
+        if start >= len(group):
+            start -= len(group)
+            continue
+        page.extend(group[start:start + count - len(page)])
+        start = 0
+        if len(page) == count:
+            break
+    return page
+
+class BookingSchedule:
+    #Reserved [start, end) intervals of each bike. A bike's bookings never overlap, so their starts and ends
+    #are kept as two lists sorted together and a conflict check is one bisect however many bookings there are
+    def __init__(self):
+        self.__starts = {}
+        self.__ends = {}
+        #number of bookings per bike type, types without any skip the checks
+        self.booked = {}
+
+    #True when no booking of the bike overlaps [start, end)
+    def is_free(self, sn, start, end):
+        ends = self.__ends.get(sn)
+        if not ends:
+            return True
+        #the first booking ending after start is the only one that can overlap
+        i = bisect.bisect_right(ends, start)
+        return i == len(ends) or self.__starts[sn][i] >= end
+
+    #The first count serial numbers of sns that are free over [start, end)
+    def free(self, sns, start, end, count=None):
+        return list(itertools.islice((sn for sn in sns if self.is_free(sn, start, end)), count))
+
+    def add(self, sn, biketype, start, end):
+        starts = self.__starts.setdefault(sn, [])
+        i = bisect.bisect_left(starts, start)
+        starts.insert(i, start)
+        self.__ends.setdefault(sn, []).insert(i, end)
+        self.booked[biketype] = self.booked.get(biketype, 0) + 1
+
+    def remove(self, sn, biketype, start, end):
+        starts = self.__starts[sn]
+        i = bisect.bisect_left(starts, start)
+        del starts[i]
+        del self.__ends[sn][i]
+        if not starts:
+            del self.__starts[sn], self.__ends[sn]
+        self.booked[biketype] -= 1
 
 class BicycleDA:
     #Initialization
-    def __init__(self):
-        #initializing and linking the csv database to protected __db
-        self.__db = 'bicycle_db.csv'
-        #naming the database table
-        self.__tableName = "bicycles"
+    def __init__(self, storage=None, flush_every=50, flush_interval=30, tariff=None):
+        #storage backend of the inventory and sales, csv files unless another one is given
+        self.__storage = storage if storage is not None else CsvStorage()
+        #rates of this outlet
+        self.tariff = tariff if tariff is not None else TARIFF
         #columns required in our inventory list
-        self.__columns = ['Bike Type', 'Serial Number', 'Price', 'Price Unit', 'Status', 'Contact', 'Time Out', 'Booked Hours', 'Est Time In']
-        #loading of database into dataframe
-        try:
-            df = pd.read_csv(self.__db)
-        except FileNotFoundError:
-            #Create file when can't find the file
-            df = pd.DataFrame(columns=self.__columns)
-            df.to_csv(self.__db, index=False)
-    
+        self.__columns = INVENTORY_COLUMNS
+        #write-behind settings: inventory is saved after this many changes or seconds, and on exit
+        self.__flush_every = flush_every
+        self.__flush_interval = flush_interval
+        self.__pending = 0
+        self.__last_flush = time.monotonic()
+        #serial numbers changed since the last commit to storage
+        self.__dirty = {}
+        #sales totals of the day, set up by initsales
+        self.__metrics = SalesMetrics()
+        #changes of the current operation, written to the storage's write-ahead log before it is acknowledged
+        self.__wal = []
+        #loading of database into dataframe, kept in memory for the whole session
+        df = self.__typed(self.__storage.load_inventory(self.__columns))
+        reservations = self.__storage.load_reservations()
+        #Changes logged after the last snapshot, e.g. before a power cut, are replayed and saved in a new snapshot
+        entries = self.__storage.recover()
+        if entries:
+            with INSTRUMENTS.timer('stage', 'wal_replay'):
+                df, reservations = self.__replay(df, reservations, entries)
+        self.__load(df)
+        self.__load_reservations(reservations)
+        if entries:
+            self.__pending = len(entries)
+            self.__bookings_dirty = True
+            self.flush()
+        atexit.register(self.flush)
+
+    #Read the inventory and reservations again if another process sharing the files has saved them
+    def __refresh(self):
+        with self.__storage.locked():
+            if self.__storage.changed():
+                INSTRUMENTS.count('reloads', 'inventory')
+                self.__load(self.__storage.load_inventory(self.__columns))
+                self.__load_reservations(self.__storage.load_reservations())
+
+    #Decorator for mutations: run under the storage lock on the latest inventory, so a change
+    #made by another counter process is picked up before this one is applied and saved
+    def __mutation(method):
+        def locked(self, *args, **kwargs):
+            with self.__storage.locked():
+                self.__refresh()
+                return method(self, *args, **kwargs)
+        return locked
+
+    #Keep inventory in memory, indexed by serial number and by (Bike Type, Status)
+    def __load(self, df):
+        with INSTRUMENTS.timer('stage', 'inventory_index'):
+            self.__index(df)
+
+    def __index(self, df):
+        df = self.__typed(df)
+        self.__df = df
+        self.__by_status = {}
+        #Row positions of each (Bike Type, Status) in inventory order, so any page is one slice
+        self.__positions = {}
+        for position, (sn, biketype, status) in enumerate(zip(df['Serial Number'], df['Bike Type'], df['Status'])):
+            self.__by_status.setdefault((biketype, status), {})[sn] = None
+            self.__positions.setdefault((biketype, status), []).append(position)
+        #Bikes each customer has out, by contact number
+        self.__by_contact = {}
+        out = df[(df['Status'] == 'Out').to_numpy() & df['Contact'].notna().to_numpy()]
+        for sn, contact in zip(out['Serial Number'], out['Contact']):
+            self.__by_contact.setdefault(int(contact), {})[sn] = None
+        #Estimate return times of the rented bikes, sorted per bike type
+        self.__returns = {}
+        out = df[(df['Status'] == 'Out').to_numpy() & df['Est Time In'].notna().to_numpy()].sort_values('Est Time In', kind='stable')
+        for biketype, time_in in zip(out['Bike Type'], out['Est Time In']):
+            self.__returns.setdefault(biketype, []).append(time_in)
+        #Highest serial number used per bike type, so numbers are never reused after a gap
+        numbers = pd.to_numeric(df['Serial Number'].str[1:], errors='coerce')
+        self.__last_sn = numbers.groupby(df['Bike Type'], observed=True).max().fillna(0).astype(int).to_dict()
+
+    #Apply write-ahead log entries to the snapshot of the inventory and reservations
+    def __replay(self, df, reservations, entries):
+        for entry in entries:
+            if entry['op'] == 'set':
+                sns = [sn for sn in entry['sns'] if sn in df.index]
+                df.loc[sns, list(entry['values'])] = [_wal_parse(col, value) for col, value in entry['values'].items()]
+            elif entry['op'] == 'add':
+                new_rows = self.__typed(pd.DataFrame(dict(entry['values'], **{'Serial Number': entry['sns']}), columns=self.__columns))
+                df = _concat_typed([df, new_rows[~new_rows.index.isin(df.index)]])
+            elif entry['op'] == 'book':
+                reservations = [row for row in reservations if int(row['Booking']) != entry['booking']]
+                reservations += [dict(row, Start=datetime.fromisoformat(row['Start']), End=datetime.fromisoformat(row['End'])) for row in entry['rows']]
+            elif entry['op'] == 'unbook':
+                reservations = [row for row in reservations if int(row['Booking']) != entry['booking']]
+        return df, reservations
+
+    #Reservations by booking number, with the booked intervals of every bike in the schedule
+    def __load_reservations(self, rows):
+        self.__reservations = {}
+        self.__schedule = BookingSchedule()
+        for row in rows:
+            booking = self.__reservations.setdefault(int(row['Booking']), {
+                'Bike Type': row['Bike Type'], 'Contact': int(row['Contact']), 'Start': row['Start'], 'End': row['End'], 'Serial Number': []})
+            booking['Serial Number'].append(row['Serial Number'])
+            self.__schedule.add(row['Serial Number'], row['Bike Type'], row['Start'], row['End'])
+        self.__next_booking = max(self.__reservations, default=0) + 1
+        self.__bookings_dirty = False
+
+    #Reservations are saved with the inventory when storage is write-behind, straight away otherwise
+    def __save_reservations(self):
+        if self.__storage.write_behind:
+            self.__storage.log(self.__wal)
+            self.__wal.clear()
+            self.__bookings_dirty = True
+            self.__touch()
+        else:
+            self.__write_reservations()
+
+    def __write_reservations(self):
+        self.__wal.clear()
+        self.__bookings_dirty = False
+        self.__storage.save_reservations([{'Booking': booking, 'Serial Number': sn, 'Bike Type': reservation['Bike Type'], 'Contact': reservation['Contact'],
+                                           'Start': reservation['Start'], 'End': reservation['End']}
+                                          for booking, reservation in self.__reservations.items() for sn in reservation['Serial Number']])
+
+    #Column types used for the in-memory inventory, indexed by serial number
+    def __typed(self, df):
+        df = _typed(df, INVENTORY_DTYPES)
+        df.index = df['Serial Number'].values
+        return df
+
+    #Serial numbers of a bike type with the given status, in inventory order
+    def __serials(self, biketype, status):
+        return self.__by_status.get((biketype, status), {})
+
+    #Update inventory rows in memory and keep the status, contact and return time indexes in step
+    def __apply(self, sns, changes):
+        with INSTRUMENTS.timer('stage', 'inventory_update'):
+            self.__update(sns, changes)
+
+    def __update(self, sns, changes):
+        self.__wal.append({'op': 'set', 'sns': list(sns), 'values': {col: _wal_value(value) for col, value in changes.items()}})
+        df = self.__df
+        columns = ['Bike Type', 'Status', 'Contact', 'Est Time In']
+        #A few rows are read cell by cell, which is much cheaper than a .loc lookup
+        if len(sns) <= 16:
+            old = [[df.at[sn, col] for sn in sns] for col in columns]
+            positions = [df.index.get_loc(sn) for sn in sns]
+        else:
+            rows = df.loc[sns, columns]
+            old = [rows[col].tolist() for col in columns]
+            positions = df.index.get_indexer(sns).tolist()
+        for sn, position, biketype, status, contact, time_in in zip(sns, positions, *old):
+            new_status = changes.get('Status', status)
+            if new_status != status:
+                self.__serials(biketype, status).pop(sn, None)
+                self.__by_status.setdefault((biketype, new_status), {})[sn] = None
+                ordered = self.__positions[(biketype, status)]
+                del ordered[bisect.bisect_left(ordered, position)]
+                bisect.insort(self.__positions.setdefault((biketype, new_status), []), position)
+            if 'Contact' in changes:
+                if not pd.isna(contact) and contact in self.__by_contact:
+                    self.__by_contact[contact].pop(sn, None)
+                    if not self.__by_contact[contact]:
+                        del self.__by_contact[contact]
+                if changes['Contact'] is not None:
+                    self.__by_contact.setdefault(int(changes['Contact']), {})[sn] = None
+            if 'Status' in changes or 'Est Time In' in changes:
+                returns = self.__returns.setdefault(biketype, [])
+                if status == 'Out' and not pd.isna(time_in):
+                    del returns[bisect.bisect_left(returns, time_in)]
+                time_in = changes.get('Est Time In', time_in)
+                if new_status == 'Out' and time_in is not None and not pd.isna(time_in):
+                    bisect.insort(returns, pd.Timestamp(time_in))
+        if len(sns) == 1:
+            #A single row is written cell by cell, a .loc assignment costs more than the rest of the update
+            for col, value in changes.items():
+                df.at[sns[0], col] = value
+        else:
+            #One vectorized assignment for all rows and columns
+            df.loc[sns, list(changes)] = list(changes.values())
+        self.__dirty.update(dict.fromkeys(sns))
+
+    #Hand the changed inventory rows and the sales rows of one operation to storage together
+    def __commit(self, sales_rows=()):
+        changed = list(self.__dirty)
+        sales_rows = list(sales_rows)
+        #The change and its sales rows are durable in the log before they are written
+        self.__storage.log(self.__wal, sales_rows)
+        self.__wal.clear()
+        self.__storage.commit(self.__df, changed, sales_rows)
+        self.__dirty.clear()
+        self.__metrics.add(sales_rows)
+        if self.__storage.write_behind:
+            self.__touch(len(changed))
+
+    #Count changes and flush to csv when the batch size or interval is reached
+    def __touch(self, count=1):
+        self.__pending += count
+        if self.__pending >= self.__flush_every or time.monotonic() - self.__last_flush >= self.__flush_interval:
+            self.flush()
+
+    #Write the in-memory inventory to storage if there are unsaved changes
+    @_timed
+    def flush(self):
+        saved = self.__pending or self.__bookings_dirty
+        if self.__pending:
+            self.__storage.save_inventory(self.__df)
+            self.__pending = 0
+        if self.__bookings_dirty:
+            self.__write_reservations()
+        if saved:
+            #The new snapshot holds every logged change
+            self.__storage.checkpoint()
+        self.__last_flush = time.monotonic()
+        self.__storage.sync()
+
     #Initialization of sales csv
+    @__mutation
+    @_timed
     def initsales(self,todaydate):
-        #sales csv
-        #sale_list_filename = 'sales_list' + todaydate + '.csv'
-        self.__sales = 'sales_list_' + todaydate + '.csv'
-        #naming the sales tables
-        self.__salestableName = 'sales'
         #columns for sales
-        self.__salescolumns = ['Bike Type','Price','Price Unit','Contact','Time','Transaction Type','Amount']
-        #loading of database into dataframe
-        try:
-            sales_df = pd.read_csv(self.__sales)
-        except FileNotFoundError:
-            #Reset bike inventory status when is a new day
-            self.reset_inv()
-            #Create file when can't find the file
-            sales_df = pd.DataFrame(columns=self.__salescolumns)
-            sales_df.to_csv(self.__sales, index=False)
+        self.__salescolumns = SALES_COLUMNS
+        #Open the sales journal, the file is created with its header when missing
+        if self.__storage.open_sales(todaydate, self.__salescolumns):
+            #A new day, which has no sales to read yet
+            self.__rollover(todaydate)
+            self.__metrics = SalesMetrics()
+        else:
+            #Running totals of the day, rebuilt from the sales recorded so far
+            self.__metrics = self.__storage.day_metrics()
+
+    #Running sales totals of the day, kept up to date without reading the sales file
+    #(read again when the file is shared, since other processes add sales to it)
+    @_timed
+    def sales_metrics(self):
+        if self.__storage.shared:
+            with self.__storage.locked():
+                self.__metrics = self.__storage.day_metrics()
+        return self.__metrics
     
-    #To reset inventory status
+    #End of day pipeline, run when a new date is opened: open rentals are carried over, bookings that ended
+    #unused are dropped, the closed days of sales are archived and the inventory snapshot is saved
+    def __rollover(self, todaydate):
+        self.reset_inv()
+        self.__expire_reservations(datetime.strptime(todaydate, '%Y%m%d'))
+        with INSTRUMENTS.timer('stage', 'sales_archive'):
+            self.__storage.archive_sales(todaydate)
+        self.flush()
+
+    #To reset inventory status for a new day. Rentals still out are carried over as they are, an overdue one
+    #is charged its excess when it comes back; only bikes in store that still have a contact are cleared
+    @__mutation
+    @_timed
     def reset_inv(self):
-        df = pd.read_csv(self.__db) 
-        df['Status']='In'
-        df['Contact']=None
-        df.to_csv(self.__db,index = False)
-     
-    #Display bike inventory    
-    def displayBicycles(self):
+        df = self.__df
+        sns = df.index[(df['Status'] != 'Out').to_numpy() & df['Contact'].notna().to_numpy()].tolist()
+        if not sns:
+            return
+        self.__apply(sns, {"Contact": None})
+        self.__commit()
+
+    #Bikes matching the filters, one page at a time ordered by bike type, status and inventory order
+    #Type and status filters are served from the status index, contact and overdue (bikes not back by
+    #the given datetime) are checked over the rented bikes only; only the rows of the page are read
+    @_timed
+    def query_bicycles(self, biketype=None, status=None, contact=None, overdue_at=None, page=1, page_size=20):
+        self.__refresh()
+        if contact is not None or overdue_at is not None:
+            #Only rented bikes have a contact and an estimate return time
+            status = 'Out' if status in (None, 'Out') else ''
+        keys = [(bike_type, bike_status) for bike_type, bike_status in sorted(self.__by_status)
+                if (biketype is None or bike_type == biketype) and (status is None or bike_status == status)]
+        start = (page - 1) * page_size
+        if contact is None and overdue_at is None:
+            groups = [self.__positions.get(key, []) for key in keys]
+            total = sum(len(positions) for positions in groups)
+            sns = self.__df.index[_page_of(groups, start, page_size)].tolist()
+        else:
+            groups = [self.__by_status[key] for key in keys]
+            if contact is not None:
+                #Only the bikes the customer has out, from the contact index
+                rented = self.__by_contact.get(contact, {})
+                candidates = [sn for serials in groups for sn in rented if sn in serials]
+            else:
+                candidates = [sn for serials in groups for sn in serials]
+            rows = self.__df.loc[candidates, ['Contact', 'Est Time In']]
+            keep = np.ones(len(candidates), dtype=bool)
+            if overdue_at is not None:
+                keep &= (rows['Est Time In'] < overdue_at).to_numpy()
+            matching = [candidates[i] for i in np.flatnonzero(keep)]
+            total = len(matching)
+            sns = matching[start:start + page_size]
+        rows = self.__df.loc[sns, ['Bike Type', 'Serial Number', 'Status', 'Contact', 'Time Out', 'Booked Hours', 'Est Time In']]
+        rows = _csv_frame(rows).astype(object)
+        #fillna would turn a column of whole and half hours back into floats
+        rows = rows.where(rows.notna(), '')
+        counts = {key: len(serials) for key, serials in self.__by_status.items()}
+        return InventoryPage(rows, total, page, page_size, counts)
+
+    #Display one page of the bike inventory
+    def displayBicycles(self, page=1, page_size=20, **filters):
         try:
-            #Read csv
-            df = pd.read_csv(self.__db)
-            #Filter bike inventory
-            selected_columns = ['Bike Type', 'Serial Number', 'Status','Contact']
-            selected_df = df[selected_columns]
-            with pd.option_context('display.float_format', '{:.0f}'.format):
-                print(selected_df)
-            
-            # Display bikes with 'in' status
-            in_df = df[df['Status'] == 'In'][['Bike Type','Serial Number','Status']]
-            in_df_sum=in_df.groupby('Bike Type').size().reset_index(name='Count')                       
-            print("\nInformation on Bicycles Available for Rent:")
-            print(f"{'Bike Type':<5s}      {'Total Number Avaliable':>5s}")
-            for index,row in in_df_sum.iterrows():
-                bike_type = row['Bike Type']
-                count = row['Count']
-                print(f"{bike_type:<10s}  {count:>20d}")
-            
-            # Display bikes with 'out' status
-            out_df = df[df['Status'] == 'Out'][['Serial Number', 'Contact', 'Time Out', 'Booked Hours', 'Est Time In']]
-            # Convert all contact input to integer to prevent decimal values
-            out_df['Contact'] = out_df['Contact'].apply(lambda x: int(x) if not pd.isna(x) else x)
-            with pd.option_context('display.float_format', '{:.2f}'.format):
-                print("\nInformation on Rented Bicycles Outside:")
-                print(out_df)
+            print(self.query_bicycles(page=page, page_size=page_size, **filters).render())
         except pd.errors.EmptyDataError:
             print("No data available.")
         except Exception as e:
             print("Error:", e)
             sys.exit(1)
         
+    #Add a number of bikes like the given one in one go, returns the new serial numbers
+    @__mutation
+    @_timed
+    def add_bicycles(self, bicycle, bike_quantity):
+        biketype = bicycle.biketype
+        first = self.__last_sn.get(biketype, 0) + 1
+        sns = [f"{biketype[0].upper()}{n:03d}" for n in range(first, first + bike_quantity)]
+        if not sns:
+            return sns
+        values = {
+            'Bike Type': biketype,
+            'Price': self.tariff.price[biketype],
+            'Price Unit': self.tariff.unit[biketype],
+            'Status': bicycle.status,
+            'Contact': bicycle.contact,
+            'Time Out': bicycle.time_out,
+            'Booked Hours': bicycle.booked_hours,
+            'Est Time In': bicycle.est_time_in
+        }
+        new_rows = pd.DataFrame(dict(values, **{'Serial Number': sns}), columns=self.__columns)
+        #Every new bike has the same values apart from its serial number
+        self.__wal.append({'op': 'add', 'sns': sns, 'values': {col: _wal_value(value) for col, value in values.items()}})
+        #New bikes are appended after the existing ones instead of re-sorting the inventory
+        first_position = len(self.__df)
+        self.__df = _concat_typed([self.__df, self.__typed(new_rows)])
+        self.__by_status.setdefault((biketype, bicycle.status), {}).update(dict.fromkeys(sns))
+        self.__positions.setdefault((biketype, bicycle.status), []).extend(range(first_position, first_position + len(sns)))
+        self.__last_sn[biketype] = first + bike_quantity - 1
+        self.__dirty.update(dict.fromkeys(sns))
+        self.__commit()
+        return sns
+
     #Create new bike in inventory
     def insertNewBicycle(self, bicycle, bike_quantity):
         try:
-            #Read csv
-            df = pd.read_csv(self.__db)
-            filtered_df = df[df['Bike Type'] == bicycle.biketype]
-            for i in range(bike_quantity):  
-                type_count = len(filtered_df)
-                sn = f"{bicycle.biketype[0].upper()}{type_count + 1:03d}"
-                new_row = {
-                    'Bike Type': bicycle.biketype,
-                    'Serial Number': sn,
-                    'Price': bicycle.price,
-                    'Price Unit': bicycle.priceUnit,
-                    'Status': bicycle.status,
-                    'Contact': bicycle.contact,
-                    'Time Out': bicycle.time_out,
-                    'Booked Hours': bicycle.booked_hours,
-                    'Est Time In': bicycle.est_time_in
-                }
-                new_row = pd.DataFrame(new_row, index=[0])
-                df = pd.concat([df,new_row],ignore_index = True)
-                filtered_df = df[df['Bike Type'] == bicycle.biketype] 
-            #save to bike csv
-            df.sort_values(by=['Serial Number'],inplace = True,ignore_index=True)
-            df.to_csv(self.__db, index=False)
+            self.add_bicycles(bicycle, bike_quantity)
             print("------- Bicycle added successfully. -------")
         except Exception as e:
             print("Error:", e)
             sys.exit(1)
             
     #To return available bike count
+    @_timed
     def get_inv(self,renttype):
-        df = pd.read_csv(self.__db)
-        available_df = df[(df.Status == 'In') & (df['Bike Type'] == renttype)]
-        return(available_df['Serial Number'].count())
+        self.__refresh()
+        return len(self.__serials(renttype, 'In'))
     
+    #Bikes of a type available at now and at each slot for the rest of the day, as (time, count)
+    #Bikes out count from their estimate return time, bikes already overdue are not counted
+    @_timed
+    def availability(self, biketype, curr_datetime, slot_minutes=30):
+        self.__refresh()
+        returns = self.__returns.get(biketype, [])
+        available = len(self.__serials(biketype, 'In'))
+        timeline = [(curr_datetime, available)]
+        step = timedelta(minutes=slot_minutes)
+        day_start = datetime.combine(curr_datetime.date(), dt_time())
+        slot = day_start + step * (int((curr_datetime - day_start) / step) + 1)
+        #One sweep over the sorted return times
+        position = bisect.bisect_right(returns, curr_datetime)
+        while slot < day_start + timedelta(days=1):
+            while position < len(returns) and returns[position] <= slot:
+                available += 1
+                position += 1
+            timeline.append((slot, available))
+            slot += step
+        return timeline
+
+    #Earliest time from curr_datetime by which rent_quantity bikes of a type are expected in store, None when not
+    #enough are out. Only bikes due back after curr_datetime count, so the time given is never one already passed
+    @_timed
+    def next_available(self, biketype, rent_quantity, curr_datetime):
+        self.__refresh()
+        returns = self.__returns.get(biketype, [])
+        missing = rent_quantity - len(self.__serials(biketype, 'In'))
+        if missing <= 0:
+            return curr_datetime
+        position = bisect.bisect_right(returns, curr_datetime)
+        if position + missing > len(returns):
+            return None
+        return returns[position + missing - 1]
+
     #To return specific bike SN status
     def get_sn(self,sn):
-        df = pd.read_csv(self.__db)
-        available_df = df[(df.Status == 'Out') & (df['Serial Number'] == sn)]
-        return(available_df['Status'].count())
+        self.__refresh()
+        if sn in self.__df.index and self.__df.at[sn, 'Status'] == 'Out':
+            return 1
+        return 0
     
     #To return the rate for specific bike type
     def get_rate_for_bike_type(self, bike_type):
-        bicycle = Bicycle(bike_type)
-        # Call the get_price method in Bicycle class to get the rate for the specified bike type
-        rate = bicycle.get_price()
-        return rate
+        return self.tariff.price[bike_type]
     
+    #Rent a batch of bikes of one type in one update, returns (serials, total price, rounded hours) or None when short of bikes
+    #The rental may run past midnight, the bikes then stay out when the next day starts
+    @__mutation
+    @_timed
+    def rent_bikes(self,renttype,duration,curr_time,contact,rent_quantity,todaydate):
+        available = self.__serials(renttype, 'In')
+        if rent_quantity <= 0 or len(available) < rent_quantity:
+            return None
+        #Round up to whole charging blocks of the type, presented in hours
+        blocks, pricesum = self.tariff.quote_one(renttype, duration)
+        round_duration = self.tariff.block_hours(renttype, blocks)
+        #Estimate return time is the same for the whole batch
+        curr_datetime = datetime.combine(datetime.strptime(todaydate, '%Y%m%d'), curr_time)
+        time_in = curr_datetime + timedelta(hours=round_duration)
+        if self.__schedule.booked.get(renttype):
+            #Bikes booked before the estimate return time are kept for their reservation
+            sns = self.__schedule.free(available, curr_datetime, time_in, rent_quantity)
+            if len(sns) < rent_quantity:
+                return None
+        else:
+            #Take the first available bikes straight from the status index
+            sns = list(itertools.islice(available, rent_quantity))
+        self.__hand_out(sns, renttype, curr_time, contact, round_duration, time_in, pricesum)
+        return sns, pricesum * rent_quantity, round_duration
+
+    #Mark bikes as rented until time_in and record a rental sale of pricesum for each of them
+    def __hand_out(self, sns, renttype, curr_time, contact, booked_hours, time_in, pricesum):
+        self.__apply(sns, {"Status": "Out", "Time Out": _since_midnight(curr_time), "Contact": contact, "Booked Hours": booked_hours, "Est Time In": time_in})
+        #Sales rows for the whole batch, appended together
+        df = self.__df
+        #A few rows are read cell by cell like in __update
+        if len(sns) <= 16:
+            prices, units = [df.at[sn, 'Price'] for sn in sns], [df.at[sn, 'Price Unit'] for sn in sns]
+        else:
+            rows = df.loc[sns, ['Price', 'Price Unit']]
+            prices, units = rows['Price'].tolist(), rows['Price Unit'].tolist()
+        new_sales = [{'Bike Type': renttype, 'Serial Number': sn, 'Price': _wal_value(price), 'Price Unit': unit, 'Contact': contact,
+                      'Time': curr_time, 'Transaction Type': "Rental", 'Amount': pricesum}
+                     for sn, price, unit in zip(sns, prices, units)]
+        self.__commit(new_sales)
+
     #Bike rental function
     def rentalfee(self,renttype,duration,curr_time,contact,rent_quantity,todaydate):
         try:
-            #Read csv
-            df = pd.read_csv(self.__db)
-            sales_df = pd.read_csv(self.__sales)
-            #Filter df to available & bike type required
-            available_df = df[(df.Status == 'In') & (df['Bike Type'] == renttype)]
-            #counting of bikes in store for specific type
-            avail_count = 0
-            for row in available_df.itertuples():
-                avail_count+=1
-            #Initial variable
-            totalprice = 0
+            rented = self.rent_bikes(renttype,duration,curr_time,contact,rent_quantity,todaydate)
             #Check if there are bikes left and the rental quantity is not more than bikes in store
-            if available_df.empty == False and avail_count>=rent_quantity:
+            if rented is not None:
+                sns, totalprice, round_duration = rented
                 print("\nThe rented bike serial number is/are:")
-                for i in range (rent_quantity):
-                    #To get the first row of filtered bike inventory
-                    SN = available_df.loc[available_df.index[i],'Serial Number']
-                    df.loc[df['Serial Number']==SN,"Status"] = "Out"
-                    df.loc[df['Serial Number']==SN,"Time Out"] = curr_time
-                    df.loc[df['Serial Number']==SN,"Contact"] = contact
-                    rate = BicycleDA.get_rate_for_bike_type(self, renttype)
-                    #Calculate the estimate return time                  
-                        
-                    if renttype in ['adult', 'kid', 'tandem', 'family']:
-                        #round up to next hour
-                        round_duration = math.ceil(duration)
-                        df.loc[df['Serial Number'] == SN, "Booked Hours"] = int(duration)
-                        #saving current time as datetime
-                        curr_datetime = datetime.strptime(datetime.strptime(todaydate, '%Y%m%d').strftime('%Y%m%d') + ' ' + curr_time.strftime('%H:%M:%S'),'%Y%m%d %H:%M:%S')
-                        time_in = curr_datetime + timedelta(minutes=60 * round_duration)
-                        #calculating the overall price based on rental duration
-                        pricesum = rate * round_duration
-                    elif renttype == "pgk":
-                        #round up nearest 30mins
-                        round_duration = math.ceil(duration*2)
-                        df.loc[df['Serial Number'] == SN, "Booked Hours"] = duration
-                        #saving current time as datetime
-                        curr_datetime = datetime.strptime(datetime.strptime(todaydate, '%Y%m%d').strftime('%Y%m%d') + ' ' + curr_time.strftime('%H:%M:%S'),'%Y%m%d %H:%M:%S')
-                        time_in = curr_datetime + timedelta(minutes=60 * (round_duration/2))
-                        #calculating the overall price based on rental duration
-                        pricesum = rate * round_duration
-                        #the round_duration for pgk is for 30mins block, but should be presented in hours format
-                        round_duration = round_duration/2
-                    totalprice += pricesum
-                    df.loc[df['Serial Number'] == SN, "Est Time In"] = time_in
-
-                    #Update bike inventory status in csv
-                    df.to_csv(self.__db,index = False)
-                    #Create sales transaction row to save in sales_list csv
-                    new_sales = {
-                        'Bike Type': df.loc[df['Serial Number']==SN,"Bike Type"],
-                        'Serial Number': SN,
-                        'Price': df.loc[df['Serial Number']==SN,"Price"],
-                        'Price Unit': df.loc[df['Serial Number']==SN,"Price Unit"],
-                        'Time':df.loc[df['Serial Number']==SN,"Time Out"],
-                        'Transaction Type':"Rental",
-                        'Amount':pricesum,
-                        'Contact':df.loc[df['Serial Number']==SN,"Contact"]}
-                    new_sales = pd.DataFrame(new_sales)
-                    #Update sales_list csv
-                    sales_df = pd.concat([sales_df,new_sales],ignore_index=True)
-                    sales_df.to_csv(self.__sales,index = False)
-                    print(SN)
+                print("\n".join(sns))
                 #Print total amount
                 print(f"\nPlease pay ${totalprice} for booking {rent_quantity} {renttype} for {round_duration} hours.")
-                
-            
             else:
                 print(f"We do not have sufficient {renttype} bicycles available.")
+                expected = self.next_available(renttype, rent_quantity, datetime.combine(datetime.strptime(todaydate, '%Y%m%d'), curr_time))
+                if expected is not None:
+                    print(f"{rent_quantity} {renttype} bicycles are expected to be back by {expected.strftime('%H:%M')}.")
                 print("Would you like to choose another type to rent? ")
         except Exception as e:
             print("Error:",e)
             sys.exit(1)
+
+    #Bike reservation function
+    def reservebikes(self,renttype,start,duration,contact,rent_quantity):
+        try:
+            reserved = self.reserve_bikes(renttype,start,duration,contact,rent_quantity)
+            if reserved is not None:
+                booking, sns, end = reserved
+                print(f"\nBooking number {booking}: {rent_quantity} {renttype} from {start.strftime('%Y-%m-%d %H:%M')} to {end.strftime('%Y-%m-%d %H:%M')}.")
+                print("The reserved bike serial number is/are:")
+                print("\n".join(sns))
+            else:
+                print(f"We do not have {rent_quantity} {renttype} bicycles free for the whole period.")
+        except Exception as e:
+            print("Error:",e)
+            sys.exit(1)
+
+    #Reservation pick up function
+    def pickupreservation(self,booking,curr_time,todaydate):
+        try:
+            rented = self.pickup_reservation(booking,curr_time,todaydate)
+            if rented is not None:
+                sns, totalprice, round_duration = rented
+                print("\nThe rented bike serial number is/are:")
+                print("\n".join(sns))
+                print(f"\nPlease pay ${totalprice} for booking {len(sns)} bikes for {round_duration} hours.")
+            else:
+                print(f"Booking {booking} cannot be picked up: it does not exist, has ended, or the bikes are not back yet.")
+        except Exception as e:
+            print("Error:",e)
+            sys.exit(1)
     
+    #Bikes of a type free over [start, end): in store or due back by start, and with no booking overlapping it
+    #At most quantity serial numbers are given, bikes in store first
+    @_timed
+    def free_bikes(self, biketype, start, end, quantity=None):
+        self.__refresh()
+        return self.__free(biketype, start, end, quantity)
+
+    def __free(self, biketype, start, end, quantity=None):
+        df = self.__df
+        returned = (sn for sn in self.__serials(biketype, 'Out') if not df.at[sn, 'Est Time In'] > start)
+        return self.__schedule.free(itertools.chain(self.__serials(biketype, 'In'), returned), start, end, quantity)
+
+    #Book bikes of a type from start for a duration in hours, rounded up to charging blocks like a rental
+    #Returns (booking number, serial numbers, end) or None when not enough bikes are free over the whole period
+    @__mutation
+    @_timed
+    def reserve_bikes(self, renttype, start, duration, contact, rent_quantity):
+        end = start + timedelta(hours=self.tariff.round_hours(renttype, duration))
+        sns = self.__free(renttype, start, end, rent_quantity)
+        if rent_quantity <= 0 or len(sns) < rent_quantity:
+            return None
+        booking = self.__next_booking
+        self.__next_booking += 1
+        self.__book(booking, {'Bike Type': renttype, 'Contact': contact, 'Start': start, 'End': end, 'Serial Number': sns})
+        self.__save_reservations()
+        return booking, sns, end
+
+    #Reservation of a booking number as a dict, None when there is no such booking
+    def reservation(self, booking):
+        self.__refresh()
+        return self.__reservations.get(booking)
+
+    def __book(self, booking, reservation):
+        self.__reservations[booking] = reservation
+        for sn in reservation['Serial Number']:
+            self.__schedule.add(sn, reservation['Bike Type'], reservation['Start'], reservation['End'])
+        self.__wal.append({'op': 'book', 'booking': booking, 'rows': [
+            {'Booking': booking, 'Serial Number': sn, 'Bike Type': reservation['Bike Type'], 'Contact': reservation['Contact'],
+             'Start': str(reservation['Start']), 'End': str(reservation['End'])} for sn in reservation['Serial Number']]})
+
+    def __unbook(self, booking):
+        reservation = self.__reservations.pop(booking)
+        for sn in reservation['Serial Number']:
+            self.__schedule.remove(sn, reservation['Bike Type'], reservation['Start'], reservation['End'])
+        self.__wal.append({'op': 'unbook', 'booking': booking})
+        return reservation
+
+    #Cancel a booking, returns False when there is no such booking
+    @__mutation
+    @_timed
+    def cancel_reservation(self, booking):
+        if booking not in self.__reservations:
+            return False
+        self.__unbook(booking)
+        self.__save_reservations()
+        return True
+
+    #Bookings that ended before the given datetime were never picked up and are dropped
+    def __expire_reservations(self, before):
+        expired = [booking for booking, reservation in self.__reservations.items() if reservation['End'] <= before]
+        for booking in expired:
+            self.__unbook(booking)
+        if expired:
+            self.__save_reservations()
+
+    #Hand over the bikes of a booking as a rental until the end of the booking, charged for the booked hours
+    #A booked bike that is not back yet is swapped for another free one. Returns (serials, total price, hours)
+    #or None when there is no such booking, it has ended or not enough bikes are free
+    @__mutation
+    @_timed
+    def pickup_reservation(self, booking, curr_time, todaydate):
+        reservation = self.__reservations.get(booking)
+        curr_datetime = datetime.combine(datetime.strptime(todaydate, '%Y%m%d'), curr_time)
+        if reservation is None or reservation['End'] <= curr_datetime:
+            return None
+        renttype = reservation['Bike Type']
+        self.__unbook(booking)
+        available = self.__serials(renttype, 'In')
+        sns = self.__schedule.free([sn for sn in reservation['Serial Number'] if sn in available], curr_datetime, reservation['End'])
+        missing = len(reservation['Serial Number']) - len(sns)
+        if missing:
+            sns += self.__schedule.free((sn for sn in available if sn not in sns), curr_datetime, reservation['End'], missing)
+        if len(sns) < len(reservation['Serial Number']):
+            #Keep the booking as it was
+            self.__book(booking, reservation)
+            self.__wal.clear()
+            return None
+        duration = (reservation['End'] - reservation['Start']) / timedelta(hours=1)
+        blocks, pricesum = self.tariff.quote_one(renttype, duration)
+        booked_hours = duration if self.tariff.block_minutes[renttype] % 60 else int(duration)
+        self.__hand_out(sns, renttype, curr_time, reservation['Contact'], booked_hours, reservation['End'], pricesum)
+        self.__save_reservations()
+        return sns, pricesum * len(sns), self.tariff.block_hours(renttype, blocks)
+
+    #Rented bikes not back by the given time with the overtime charge due so far, earliest estimate return time first
+    @_timed
+    def overdue(self, curr_time, todaydate):
+        self.__refresh()
+        sns = [sn for (biketype, status), serials in self.__by_status.items() if status == 'Out' for sn in serials]
+        rows = self.__df.loc[sns, ['Bike Type', 'Contact', 'Time Out', 'Est Time In']]
+        curr_datetime = datetime.combine(datetime.strptime(todaydate, '%Y%m%d'), curr_time)
+        #One comparison over all rented bikes
+        late = rows[(rows['Est Time In'] < curr_datetime).to_numpy()]
+        blocks, amounts = self.tariff.quote(late['Bike Type'].to_numpy(), seconds=(curr_datetime - late['Est Time In']).dt.total_seconds())
+        return late.assign(**{'Exceed Blocks': blocks, 'Amount': amounts}).sort_values('Est Time In', kind='stable')
+
+    #Return rented bikes in one pass, returns is a list of (serial number, return time)
+    #Gives a dict per return in the same order with the estimate return time and any excess charge,
+    #or None for a serial number that is not rented out
+    @__mutation
+    @_timed
+    def return_bikes(self, returns, todaydate):
+        #One bike takes the cell by cell path of return_bike
+        if len(returns) == 1:
+            return [self.return_bike(returns[0][0], returns[0][1], todaydate)]
+        df = self.__df
+        results = [None] * len(returns)
+        sns = [sn for sn, curr_time in returns]
+        #A serial number given twice is only returned once
+        keep = (df['Status'].reindex(sns) == 'Out').to_numpy() & ~pd.Index(sns).duplicated()
+        positions = np.flatnonzero(keep)
+        if not len(positions):
+            return results
+        sns = [sns[p] for p in positions]
+        times = [returns[p][1] for p in positions]
+        rows = df.loc[sns, ['Bike Type', 'Price', 'Price Unit', 'Contact', 'Est Time In']]
+        #Calculate exceed durations in blocks of each bike type and the extra charges together
+        day = datetime.strptime(todaydate, '%Y%m%d')
+        curr_datetimes = pd.to_datetime([datetime.combine(day, curr_time) for curr_time in times])
+        time_in = rows['Est Time In']
+        blocks, amounts = self.tariff.quote(rows['Bike Type'].to_numpy(), seconds=(curr_datetimes - pd.DatetimeIndex(time_in)).total_seconds())
+        sales_rows = []
+        for position, sn, curr_time, return_type, price, unit, contact, est_time_in, exceed_blocks, pricesum in zip(
+                positions, sns, times, *(rows[col].tolist() for col in ['Bike Type', 'Price', 'Price Unit', 'Contact']),
+                time_in, blocks.tolist(), amounts.tolist()):
+            results[position] = self.__returned(sn, curr_time, return_type, price, unit, contact, est_time_in, exceed_blocks, pricesum, sales_rows)
+        #Reset status
+        self.__apply(sns, {"Status": "In", "Time Out": None, "Booked Hours": 0, "Est Time In": None, "Contact": None})
+        #Save the status changes and all excess charges as one batch
+        self.__commit(sales_rows)
+        return results
+
+    #Result dict of one returned bike, its excess charge is added to sales_rows when there is one
+    def __returned(self, sn, curr_time, return_type, price, unit, contact, est_time_in, exceed_blocks, pricesum, sales_rows):
+        #Add sales csv trans when there is excess charges
+        if exceed_blocks > 0:
+            sales_rows.append({
+                'Bike Type': return_type,
+                'Serial Number': sn,
+                'Price': price,
+                'Price Unit': unit,
+                'Time': curr_time.strftime('%H:%M:%S'),
+                'Transaction Type': "Excess Hour Charges",
+                'Amount': pricesum,
+                'Contact': contact})
+        return {'Serial Number': sn, 'Bike Type': return_type, 'Est Time In': est_time_in,
+                'Exceed Blocks': exceed_blocks, 'Exceed Hours': self.tariff.block_hours(return_type, exceed_blocks),
+                'Amount': max(pricesum, 0)}
+
+    #Return a rented bike, returns a dict with the estimate return time and any excess charge, or None for a wrong serial number
+    #A single bike is read cell by cell from its row, which is much cheaper than the batch path of return_bikes
+    @__mutation
+    @_timed
+    def return_bike(self,sn,curr_time,todaydate):
+        df = self.__df
+        if sn not in df.index or df.at[sn, 'Status'] != 'Out':
+            return None
+        return_type, price, unit, contact, time_in = (df.at[sn, col] for col in ['Bike Type', 'Price', 'Price Unit', 'Contact', 'Est Time In'])
+        #Calculate exceed duration in blocks of the bike type and the extra charge
+        curr_datetime = datetime.combine(datetime.strptime(todaydate, '%Y%m%d'), curr_time)
+        blocks, amount = self.tariff.quote_one(return_type, seconds=(curr_datetime - time_in).total_seconds())
+        sales_rows = []
+        result = self.__returned(sn, curr_time, return_type, _wal_value(price), unit, _wal_value(contact), time_in,
+                                 blocks, amount, sales_rows)
+        #Reset status
+        self.__apply([sn], {"Status": "In", "Time Out": None, "Booked Hours": 0, "Est Time In": None, "Contact": None})
+        #Save the status change and the excess charge together
+        self.__commit(sales_rows)
+        return result
+
+    #Serial numbers of the bikes a customer has out
+    @_timed
+    def rentals_of(self, contact):
+        self.__refresh()
+        return list(self.__by_contact.get(contact, {}))
+
+    #Return every bike a customer has out in one go, a result dict per bike as in return_bike
+    @__mutation
+    @_timed
+    def return_by_contact(self, contact, curr_time, todaydate):
+        return self.return_bikes([(sn, curr_time) for sn in self.rentals_of(contact)], todaydate)
+
+    #All sales transactions of a customer across the days
+    @_timed
+    def contact_history(self, contact):
+        return self.__storage.contact_history(contact)
+
     #Return bike function            
     def returnbike(self,sn,curr_time,todaydate):
         try:
-            #Read csv
-            df = pd.read_csv(self.__db)
-            sales_df = pd.read_csv(self.__sales)
-            #Filter df to rented status and bike serial number
-            return_df = df[(df.Status == 'Out') & (df['Serial Number'] == sn)]
-            return_type = df.loc[df['Serial Number']==sn,"Bike Type"].iloc[0]
-            if return_df.empty == False:
-                #To get the first row of filtered bike inventory
-                SN = return_df.loc[return_df.index[0],'Serial Number']
-                #Calculate exceed duration and convert to hours
-                time_in = pd.to_datetime(df.loc[df['Serial Number']==SN,"Est Time In"], format='%Y%m%d %H:%M:%S')
-                time_in_str = time_in.iloc[0].strftime('%Y-%m-%d %H:%M')
-                #time_in = datetime.strptime(time_in,'%Y%m%d %H:%M:%S')
-                curr_datetime = datetime.strptime(datetime.strptime(todaydate, '%Y%m%d').strftime('%Y%m%d') + ' ' + curr_time.strftime('%H:%M:%S'),'%Y%m%d %H:%M:%S')
-                #curr_time = pd.to_datetime(curr_time, format='%Y%m%d %H:%M:%S')
-                exceed_duration = curr_datetime - time_in
-                print(f"\nEstimate return time: {time_in_str}")
-                if return_type in ['adult', 'kid', 'tandem', 'family']:
-                    exceed_duration = (exceed_duration.dt.total_seconds()/3600).apply(math.ceil).astype(int).iloc[0]
-                    print(f"\nThe excess charges is in terms of hourly block. \nThe rounded time difference is {exceed_duration} hours")
-                elif return_type == "pgk":
-                    exceed_duration = (exceed_duration.dt.total_seconds()/1800).apply(math.ceil).astype(int).iloc[0]
-                    exceed_duration_hrs = exceed_duration*0.5
-                    print(f"\nThe excess charges is in terms of half hourly block. \nThe rounded time difference is {exceed_duration_hrs} hours.")
-                
-                #Calculate extra charges
-                rate = BicycleDA.get_rate_for_bike_type(self, return_type)
-                pricesum = int(rate)*int(exceed_duration)
-                curr_time = curr_time.strftime('%H:%M:%S')     
-                #Add sales csv trans when there is excess charges
-                if exceed_duration>0:
-                    if return_type in ['adult', 'kid', 'tandem', 'family']:
-                        print(f"Please pay S${pricesum} for a exceed duration of {exceed_duration} hours")
-                    elif return_type == "pgk":
-                        print(f"Please pay S${pricesum} for a exceed duration of {exceed_duration_hrs} hours")
-                    new_sales = {
-                        'Bike Type': df.loc[df['Serial Number']==SN,"Bike Type"],
-                        'Serial Number': SN,
-                        'Price': df.loc[df['Serial Number']==SN,"Price"],
-                        'Price Unit': df.loc[df['Serial Number']==SN,"Price Unit"],
-                        'Time':curr_time,
-                        'Transaction Type':"Excess Hour Charges",
-                        'Amount':pricesum,
-                        'Contact':df.loc[df['Serial Number']==SN,"Contact"]}
-                    new_sales = pd.DataFrame(new_sales)
-                    sales_df = pd.concat([sales_df,new_sales],ignore_index=True)
-                    sales_df.to_csv(self.__sales,index = False)
+            returned = self.return_bike(sn,curr_time,todaydate)
+            if returned is not None:
+                print(f"\nEstimate return time: {returned['Est Time In'].strftime('%Y-%m-%d %H:%M')}")
+                if self.tariff.block_minutes[returned['Bike Type']] == 30:
+                    print(f"\nThe excess charges is in terms of half hourly block. \nThe rounded time difference is {returned['Exceed Hours']} hours.")
+                else:
+                    print(f"\nThe excess charges is in terms of hourly block. \nThe rounded time difference is {returned['Exceed Hours']} hours")
+                if returned['Exceed Blocks']>0:
+                    print(f"Please pay S${returned['Amount']} for a exceed duration of {returned['Exceed Hours']} hours")
                 else:
-                    print(f"There is no excess charges. The bike {SN} is returned to shop. Thank you.")
-                #Reset status
-                df.loc[df['Serial Number']==SN,"Status"] = "In"
-                df.loc[df['Serial Number']==SN,"Time Out"] = None
-                df.loc[df['Serial Number']==SN,"Booked Hours"] = 0
-                df.loc[df['Serial Number']==SN,"Est Time In"] = None
-                df.loc[df['Serial Number']==SN,"Contact"] = None
-                #Update bike csv
-                df.to_csv(self.__db,index = False)
+                    print(f"There is no excess charges. The bike {sn} is returned to shop. Thank you.")
             else:
                 print("The bike serial number is wrong. Please double check.")
                 print("We will return to Main Menu ")
@@ -311,128 +2157,300 @@ class BicycleDA:
             print("Error:",e)
             sys.exit(1)   
             
-    #To generate output sales report as txt file  
-    def sales_report_output(self,todaydate):
+    #Return all bikes a customer has out
+    def returnbycontact(self,contact,curr_time,todaydate):
+        try:
+            returned = self.return_by_contact(contact,curr_time,todaydate)
+            if returned:
+                print(f"\n{len(returned)} bike(s) returned for {contact}:")
+                for bike in returned:
+                    print(f"{bike['Serial Number']}  estimate return time {bike['Est Time In'].strftime('%Y-%m-%d %H:%M')}  excess charges ${bike['Amount']} for {max(bike['Exceed Hours'], 0)} hours")
+                total = sum(bike['Amount'] for bike in returned)
+                if total > 0:
+                    print(f"Please pay S${total} for the exceed duration")
+                else:
+                    print("There is no excess charges. Thank you.")
+            else:
+                print(f"There is no bike rented out to {contact}.")
+        except Exception as e:
+            print("Error:",e)
+            sys.exit(1)
+
+    #To print the bikes a customer has out and all their past transactions
+    def customerlookup(self,contact):
+        try:
+            print(f"\nBikes rented out to {contact}: {', '.join(self.rentals_of(contact)) or 'none'}")
+            history = self.contact_history(contact)
+            if len(history):
+                print(f"\nTransactions of {contact} ({len(history)}, ${history['Amount'].sum()} in total):")
+                print(_csv_frame(history)[['Date', 'Time', 'Bike Type', 'Serial Number', 'Transaction Type', 'Amount']].to_string(index=False))
+            else:
+                print(f"\nNo transactions found for {contact}.")
+        except Exception as e:
+            print("Error:",e)
+            sys.exit(1)
+
+    #To generate output sales report as txt file, an already computed report is written as is
+    @_timed
+    def sales_report_output(self,todaydate,report=None):
+            if report is None:
+                report = self.sales_metrics().report(todaydate)
             file_name = f"SALES_REPORT_{todaydate}.txt"
             file_count = 1
             while os.path.exists(file_name):
                 file_name = f"SALES_REPORT_{todaydate}_{file_count}.txt"
                 file_count += 1                
             with open(file_name, "w") as file:
-                original_stdout = sys.stdout
-                sys.stdout = file
-                self.salesreport(todaydate)
-                sys.stdout = original_stdout
+                file.write(report.render())
     
-    #To generate sales analysis                 
+    #Sales report over a range of days, today's figures come from the running totals
+    @_timed
+    def range_sales_report(self, start, end, todaydate, workers=None):
+        metrics = self.__storage.sales_metrics_range(start, end, skip_date=todaydate, workers=workers)
+        if start <= todaydate <= end:
+            metrics.merge(self.sales_metrics())
+        return metrics.report(f"{start} - {end}")
+
+    #To print the sales analysis over a range of days
+    def range_salesreport(self, start, end, todaydate, workers=None):
+        try:
+            report = self.range_sales_report(start, end, todaydate, workers)
+            print(report.render(), end="")
+            return report
+        except Exception as e:
+            print("Error:",e)
+            sys.exit(1)
+
+    #To generate sales analysis, returns the report so it can also be saved
     def salesreport(self, todaydate):
         try:
-            # Read csv
-            sales_df = pd.read_csv(self.__sales)
-            print(f"SALES REPORT     Date: {todaydate}\n")
-            
-            # I. Total Revenue
-            print("I. Total Revenue")
-            total_revenue = sales_df["Amount"].sum()
-            print(f"The total revenue: ${total_revenue}\n")
-            # Revenue by bike type
-            bike_types = ["adult", "kid", "tandem", "family", "pgk"]
-            revenue_by_types = []
-            for bike_type in bike_types:
-                revenue_by_type = sales_df[sales_df["Bike Type"] == bike_type]["Amount"].sum()
-                revenue_by_types.append(revenue_by_type)
-            revenue_proportions = []
-            if total_revenue != 0:
-                revenue_proportions = [revenue_by_type / total_revenue for revenue_by_type in revenue_by_types]
-            else:
-                revenue_proportions = [0] * len(revenue_by_types)
-            # Table
-            max_length = max(len(bike_type) for bike_type in bike_types)
-            print("Bike Type\tRevenue\tProportion")
-            print("-----------------------------------")
-            for i, bike_type in enumerate(bike_types):
-                padding = " " * (len("bike_type") - len(bike_type))
-                print(f"{bike_type}{padding}\t${revenue_by_types[i]:6.2f}\t{revenue_proportions[i]:06.2%}")
-            print("-----------------------------------\n")            
-            # Bar chart
-            sorted_data = sorted(zip(bike_types, revenue_proportions), key=lambda x: x[1], reverse=True)
-            print("Revenue Ranking\n")
-            for bike_type, revenue_proportion in sorted_data:
-                scaled_amount = int(revenue_proportion * 40)
-                bar = "#" * scaled_amount
-                space = " " * (max_length - len(bike_type))
-                print(f"{bike_type}{space}\t | {bar}  {revenue_proportion:.2%}\n")
-                #print(f"{bike_type}{space} | {bar}  {revenue_proportion:.2%}\n")    
-            print("\n")
-            
-            # II. Popularity
-            print("II. Popularity")
-            total_number = sales_df.shape[0]
-            print(f"The total number of bicycles rented: {total_number}\n")
-            # Number by bike type
-            number_by_types = []
-            for bike_type in bike_types:
-                number_by_type = sales_df[sales_df["Bike Type"] == bike_type].shape[0]
-                number_by_types.append(number_by_type)
-            number_proportions = []
-            if total_number != 0:
-                number_proportions = [number_by_type / total_number for number_by_type in number_by_types]
-            else:
-                number_proportions = [0] * len(number_by_types)
-            # Table
-            print("Bike Type\tNumber\tProportion")
-            print("-----------------------------------")
-            for i, bike_type in enumerate(bike_types):
-                padding = " " * (len("bike_type") - len(bike_type))
-                padding_2 = " " * (len("Number") - len(str(number_by_type)))
-                print(f"{bike_type}{padding}\t{number_by_types[i]}{padding_2}\t{number_proportions[i]:06.2%}")
-            print("-----------------------------------\n") 
-            # Bar chart
-            sorted_number = sorted(zip(bike_types, number_proportions), key=lambda x: x[1], reverse=True)            
-            print("Popularity Ranking\n")    
-            for bike_type, number_proportion in sorted_number:
-                scaled_amount = int(number_proportion * 40)
-                bar = "#" * scaled_amount
-                space = " " * (max_length - len(bike_type))
-                print(f"{bike_type}{space}\t | {bar}  {number_proportion:.2%}\n")
-            print("\n")
-            
-            # III. Hourly Revenue
-            print("III. Hourly revenue")                 
-            sales_df["Time"] = pd.to_datetime(sales_df["Time"])
-            hourly_revenue = sales_df.groupby(sales_df["Time"].dt.hour)["Amount"].sum()
-            # Top 3 Hours of Revenue
-            if not hourly_revenue.empty:
-                top_hours = hourly_revenue.nlargest(3)
-                print("Top 3 Hours of Revenue:\n")
-                for hour, h_revenue in top_hours.items():
-                    print(f"Hour {hour:02}:00 - {hour+1:02}:00: ${h_revenue:.2f}")  
-                print("\n")
-            else:
-                print("Hourly revenue data is empty.\n")
-            # Hourly Revenue Plot
-            print("Hourly Revenue Plot")
-            max_revenue = hourly_revenue.max()
-            for hour in range(24):
-                hourly_revenue_amount = hourly_revenue.get(hour, 0)
-                if hourly_revenue_amount > 0: 
-                    scaled_amount = int(hourly_revenue_amount / max_revenue * 40)
-                    line = f"{hour:02}:00 - {hour+1:02}:00 | {'*' * scaled_amount} ${hourly_revenue_amount:.2f}"
-                    print(line)
-            print("\n")
+            report = self.sales_metrics().report(todaydate)
+            print(report.render(), end="")
+            return report
         except Exception as e:
             print("Error:",e)
             sys.exit(1)
 
+#Folder with one sub-folder per outlet, each holding the inventory, sales and reservations of that outlet only
+OUTLETS_DIR = 'outlets'
+
+#Folder of an outlet, created on first use, or the current folder when no outlet is given
+def _outlet_directory(outlet):
+    if outlet is None:
+        return '.'
+    directory = os.path.join(OUTLETS_DIR, outlet)
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+#Tariff given on the command line, else the outlet's own tariff.json, else the default rates
+def _outlet_tariff(directory, path=None):
+    if path is None and os.path.exists(os.path.join(directory, 'tariff.json')):
+        path = os.path.join(directory, 'tariff.json')
+    return Tariff.from_file(path) if path else None
+
+#Storage of an outlet folder: its sqlite database when it has one, its csv files otherwise
+def _outlet_storage(directory, shared=False):
+    databases = sorted(name for name in os.listdir(directory) if name.endswith('.db'))
+    if databases:
+        return SqliteStorage(os.path.join(directory, databases[0]), import_from=None)
+    return CsvStorage(directory, shared=shared)
+
+#Bikes in store per bike type of one outlet, run in worker processes for chain-wide queries
+def _outlet_available(directory):
+    storage = _outlet_storage(directory)
+    try:
+        available = {}
+        for (biketype, status), count in storage.inventory_counts().items():
+            available[biketype] = available.get(biketype, 0) + (count if status == 'In' else 0)
+        return available
+    finally:
+        storage.close()
+
+#Sales totals of one outlet over [start, end], run in worker processes for chain-wide reports
+def _outlet_sales_metrics(directory, start, end):
+    storage = _outlet_storage(directory)
+    try:
+        return storage.sales_metrics_range(start, end, workers=1)
+    finally:
+        storage.close()
+
+class Chain:
+    #Head office view over all outlets. Every outlet owns its shard in outlets/<name>/, chain-wide figures
+    #are computed per shard in parallel and merged, so no process ever reads one big inventory or sales file
+    def __init__(self, root=OUTLETS_DIR, workers=None):
+        self.root = root
+        self.workers = workers
+
+    def outlets(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, name)))
+
+    #Run fn over every outlet folder, one outlet per task, results keyed by outlet name
+    def __fan_out(self, fn, *args):
+        names = self.outlets()
+        directories = [os.path.join(self.root, name) for name in names]
+        if len(directories) > 1 and self.workers != 1:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(self.workers) as pool:
+                results = list(pool.map(fn, directories, *[[arg] * len(directories) for arg in args]))
+        else:
+            results = [fn(directory, *args) for directory in directories]
+        return dict(zip(names, results))
+
+    #Bikes in store per outlet and bike type, an outlet only lists the types it has
+    def inventory(self):
+        return self.__fan_out(_outlet_available)
+
+    #Bikes of one type in store at each outlet that has the type
+    def available(self, biketype):
+        return {name: counts[biketype] for name, counts in self.inventory().items() if biketype in counts}
+
+    #Sales report of the whole chain over [start, end], and the revenue of each outlet
+    def sales_report(self, start, end):
+        per_outlet = self.__fan_out(_outlet_sales_metrics, start, end)
+        metrics = SalesMetrics()
+        for outlet_metrics in per_outlet.values():
+            metrics.merge(outlet_metrics)
+        revenue = {name: sum(outlet_metrics.revenue_by_type.values()) for name, outlet_metrics in per_outlet.items()}
+        return metrics.report(f"{start} - {end}, all outlets"), revenue
+
+    #Table of the bikes in store, one line per outlet and a chain total
+    def render_inventory(self, inventory=None):
+        inventory = self.inventory() if inventory is None else inventory
+        types = list(dict.fromkeys(list(SalesReport.bike_types) + [t for counts in inventory.values() for t in counts]))
+        width = max([len("Outlet"), len("Total")] + [len(name) for name in inventory])
+        lines = [f"{'Outlet':<{width}}  " + "  ".join(f"{t:>7}" for t in types)]
+        for name, counts in inventory.items():
+            lines.append(f"{name:<{width}}  " + "  ".join(f"{counts[t]:>7}" if t in counts else f"{'-':>7}" for t in types))
+        lines.append(f"{'Total':<{width}}  " + "  ".join(f"{sum(counts.get(t, 0) for counts in inventory.values()):>7}" for t in types))
+        return "\n".join(lines) + "\n"
+
 #Set a custom exception to be raised when it is necessary to exit the application
 class ExitException(Exception):
     pass
 
+#Operation timestamp as datetime, 'yyyy-MM-dd HH:MM' (or with a T) and 'yyyyMMdd HH:MM' are accepted
+def _parse_timestamp(value):
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return datetime.strptime(value, '%Y%m%d %H:%M')
+
+#Make numpy numbers and timestamps printable as json
+def _json_value(value):
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
 class BicycleController:
-    def __init__(self):
-        print('\n===========================================')
-        print('              Welcome to \n    Bicycle Rental Management System!')
-        print('============================================')
+    def __init__(self, storage=None, banner=True, tariff=None):
+        #storage backend handed to BicycleDA, csv files when None
+        self.storage = storage
+        #rates of the outlet, the default tariff when None
+        self.tariff = tariff
+        if banner:
+            print('\n===========================================')
+            print('              Welcome to \n    Bicycle Rental Management System!')
+            print('============================================')
+
+    #Run a stream of operations without prompts, one json result line per operation
+    #Each operation has "op" (add/rent/return/overdue/availability/history/reserve/free/pickup/cancel/report) and a "time";
+    #rent needs type, quantity, hours and contact, return needs sn, a list of sns or a contact, add needs type and quantity,
+    #history needs contact, availability needs type and can give a quantity, reserve needs type, quantity, start, hours and
+    #contact, free needs type, start and hours, pickup and cancel need a booking, report can give start/end dates for a range
+    def batch(self, lines, output, csv_input=False):
+        bicycle_da = BicycleDA(self.storage, flush_every=float('inf'), flush_interval=float('inf'), tariff=self.tariff)
+        todaydate = None
+        records = csv.DictReader(lines) if csv_input else (json.loads(line) for line in lines if line.strip())
+        #The write-ahead log is synced once for the whole run, the results are only final when the batch is done
+        with self.storage.group_commit():
+            for number, record in enumerate(records, 1):
+                result = {'line': number, 'op': record.get('op')}
+                try:
+                    timestamp = _parse_timestamp(record['time'])
+                    #A new date in the stream starts that day's sales
+                    if timestamp.strftime('%Y%m%d') != todaydate:
+                        todaydate = timestamp.strftime('%Y%m%d')
+                        bicycle_da.initsales(todaydate)
+                    op = record.get('op')
+                    if op == 'add':
+                        result['serials'] = bicycle_da.add_bicycles(Bicycle(record['type'].lower(), tariff=bicycle_da.tariff), int(record['quantity']))
+                    elif op == 'rent':
+                        renttype = record['type'].lower()
+                        #rent_bikes rounds the hours to charging blocks while pricing them
+                        rented = bicycle_da.rent_bikes(renttype, float(record['hours']), timestamp.time(), int(record['contact']), int(record['quantity']), todaydate)
+                        if rented is None:
+                            raise ValueError(f"not enough {renttype} bicycles available")
+                        result['serials'], result['amount'], result['hours'] = rented
+                    elif op == 'return' and record.get('contact'):
+                        #Everything a customer has out
+                        returned = bicycle_da.return_by_contact(int(record['contact']), timestamp.time(), todaydate)
+                        result['returned'] = [{'sn': r['Serial Number'], 'amount': r['Amount'], 'exceed_hours': r['Exceed Hours']} for r in returned]
+                    elif op == 'history':
+                        contact = int(record['contact'])
+                        history = _csv_frame(bicycle_da.contact_history(contact))
+                        result['rented'] = bicycle_da.rentals_of(contact)
+                        result['transactions'] = history.astype(object).where(history.notna(), None).to_dict('records')
+                    elif op == 'return' and record.get('sns'):
+                        #Several bikes returned at the same time
+                        sns = [sn.upper().strip() for sn in record['sns']]
+                        returned = bicycle_da.return_bikes([(sn, timestamp.time()) for sn in sns], todaydate)
+                        result['returned'] = [{'sn': sn, 'amount': r['Amount'], 'exceed_hours': r['Exceed Hours']} for sn, r in zip(sns, returned) if r is not None]
+                        result['not_rented'] = [sn for sn, r in zip(sns, returned) if r is None]
+                    elif op == 'return':
+                        returned = bicycle_da.return_bike(record['sn'].upper().strip(), timestamp.time(), todaydate)
+                        if returned is None:
+                            raise ValueError(f"{record['sn']} is not rented out")
+                        result['amount'] = returned['Amount']
+                        result['exceed_hours'] = returned['Exceed Hours']
+                    elif op == 'availability':
+                        renttype = record['type'].lower()
+                        result['timeline'] = [{'time': slot.strftime('%H:%M'), 'available': count} for slot, count in bicycle_da.availability(renttype, timestamp)]
+                        if record.get('quantity'):
+                            expected = bicycle_da.next_available(renttype, int(record['quantity']), timestamp)
+                            result['expected'] = expected.strftime('%Y-%m-%d %H:%M') if expected is not None else None
+                    elif op == 'reserve':
+                        renttype = record['type'].lower()
+                        duration = bicycle_da.tariff.round_hours(renttype, float(record['hours']))
+                        reserved = bicycle_da.reserve_bikes(renttype, _parse_timestamp(record['start']), duration, int(record['contact']), int(record['quantity']))
+                        if reserved is None:
+                            raise ValueError(f"not enough {renttype} bicycles free for the whole period")
+                        result['booking'], result['serials'], result['end'] = reserved
+                    elif op == 'free':
+                        renttype = record['type'].lower()
+                        start = _parse_timestamp(record['start'])
+                        result['serials'] = bicycle_da.free_bikes(renttype, start, start + timedelta(hours=float(record['hours'])),
+                                                                  int(record['quantity']) if record.get('quantity') else None)
+                    elif op == 'pickup':
+                        rented = bicycle_da.pickup_reservation(int(record['booking']), timestamp.time(), todaydate)
+                        if rented is None:
+                            raise ValueError(f"booking {record['booking']} cannot be picked up")
+                        result['serials'], result['amount'], result['hours'] = rented
+                    elif op == 'cancel':
+                        if not bicycle_da.cancel_reservation(int(record['booking'])):
+                            raise ValueError(f"there is no booking {record['booking']}")
+                    elif op == 'overdue':
+                        late = bicycle_da.overdue(timestamp.time(), todaydate)
+                        result['overdue'] = [{'sn': sn, 'type': row['Bike Type'], 'contact': row['Contact'], 'est_time_in': row['Est Time In'], 'amount': row['Amount']}
+                                             for sn, row in late.iterrows()]
+                    elif op == 'report':
+                        if record.get('start'):
+                            report = bicycle_da.range_sales_report(record['start'], record.get('end') or todaydate, todaydate)
+                        else:
+                            report = bicycle_da.sales_metrics().report(todaydate)
+                        result['revenue'] = report.total_revenue
+                        result['revenue_by_type'] = report.revenue_by_type
+                        result['number_by_type'] = report.number_by_type
+                        result['hourly_revenue'] = report.hourly_revenue
+                    else:
+                        raise ValueError(f"unknown operation {op!r}")
+                    result['ok'] = True
+                except Exception as e:
+                    result['ok'] = False
+                    result['error'] = str(e)
+                output.write(json.dumps(result, default=_json_value) + '\n')
+        bicycle_da.flush()
     
     # Set a function that checks if user input is "exit" every time, in order to allow the user to exit the system anywhere
     def exit_check(self,prompt):
@@ -442,23 +2460,145 @@ class BicycleController:
             raise ExitException()
         return user_input
         
+    #Ask for the current time until one is keyed in as HH:MM
+    def current_time(self):
+        while True:
+            try:
+                return datetime.strptime(self.exit_check("What is the current timing? (HH:MM) "),'%H:%M').time()
+            except ValueError:
+                print("Please follow the HH:MM format only!")
+
+    #Ask for the contact number of a rental until a valid one is keyed in
+    def contact_number(self):
+        while True:
+            contact = self.exit_check("Please key in the contact number: ")
+            #Validate hp number before save
+            #Assuming all SG handphone number starts with 8 or 9 and contains 8 digits
+            # 80000000 - 99999999 can be used as contact number
+            if contact.strip().isdigit() and 80000000 <= int(contact) < 100000000:
+                print("\n===========================================")
+                print("Confirmation: ")
+                print(f"The contact number is : {int(contact)}")
+                return int(contact)
+            print("Please key in the correct contact number format! (8 digits starting with 8 or 9)")
+
+    #Ask for the details of an advance booking and reserve the bikes
+    def reservation_booking(self, bicycle_da):
+        while True:
+            renttype = self.exit_check("What Bicycle do you want to book: ").lower().strip()
+            if renttype in bicycle_da.tariff.types:
+                break
+            print("Please key in correct type!")
+        while True:
+            try:
+                rent_quantity = int(self.exit_check("Enter No. of Bicycle to Book: ").strip())
+                break
+            except ValueError:
+                print("Invalid input. Please enter a number.")
+        while True:
+            try:
+                start = datetime.strptime(self.exit_check("Start of the booking? (yyyyMMdd HH:MM) ").strip(), '%Y%m%d %H:%M')
+                break
+            except ValueError:
+                print("Please follow the yyyyMMdd HH:MM format only!")
+        while True:
+            try:
+                duration = bicycle_da.tariff.round_hours(renttype, float(self.exit_check("How many hours do you want to book it for: ").strip()))
+                break
+            except ValueError:
+                print("Please key in hours only!")
+        bicycle_da.reservebikes(renttype, start, duration, self.contact_number(), rent_quantity)
+
+    #Ask for the filters of the inventory view, an empty answer means no filter
+    def inventory_filters(self, todaydate):
+        filters = {}
+        biketype = self.exit_check("Bike type (Enter for all): ").lower().strip()
+        if biketype:
+            filters['biketype'] = biketype
+        status = self.exit_check("Status In/Out (Enter for all): ").strip().capitalize()
+        if status in ('In', 'Out'):
+            filters['status'] = status
+        contact = self.exit_check("Contact number (Enter for all): ").strip()
+        if contact.isdigit():
+            filters['contact'] = int(contact)
+        while True:
+            overdue = self.exit_check("Overdue at time (HH:MM, Enter for all): ").strip()
+            if not overdue:
+                break
+            try:
+                filters['overdue_at'] = datetime.combine(datetime.strptime(todaydate, '%Y%m%d'), datetime.strptime(overdue, '%H:%M').time())
+                break
+            except ValueError:
+                print("Please follow the HH:MM format only!")
+        return filters
+
+    #Start and end date of a report period, counted back from today
+    def report_period(self, period, todaydate):
+        today = datetime.strptime(todaydate, '%Y%m%d')
+        if period == 'week':
+            return (today - timedelta(days=6)).strftime('%Y%m%d'), todaydate
+        if period == 'month':
+            return todaydate[:6] + '01', todaydate
+        if period == 'year':
+            return todaydate[:4] + '0101', todaydate
+        start, end = period.split('-')
+        start = datetime.strptime(start.strip(), '%Y%m%d').strftime('%Y%m%d')
+        end = datetime.strptime(end.strip(), '%Y%m%d').strftime('%Y%m%d')
+        if start > end:
+            raise ValueError(period)
+        return start, end
+
+    #Load the inventory on a background thread, pandas is imported there while the first prompt waits for input
+    def __preload(self):
+        self.__loader = {}
+        def load():
+            try:
+                self.__loader['bicycle_da'] = BicycleDA(self.storage, tariff=self.tariff)
+            except Exception as e:
+                self.__loader['error'] = e
+        self.__loader['thread'] = threading.Thread(target=load, daemon=True)
+        self.__loader['thread'].start()
+
+    #Open the sales day once the inventory is loaded, also in the background so the menu is shown straight away
+    def __open_day(self, todaydate):
+        preload = self.__loader['thread']
+        def open_day():
+            preload.join()
+            if 'error' in self.__loader:
+                return
+            try:
+                self.__loader['bicycle_da'].initsales(todaydate)
+            except Exception as e:
+                self.__loader['error'] = e
+        self.__loader['thread'] = threading.Thread(target=open_day, daemon=True)
+        self.__loader['thread'].start()
+
+    def __loaded(self):
+        self.__loader['thread'].join()
+        if 'error' in self.__loader:
+            raise self.__loader['error']
+        return self.__loader['bicycle_da']
+
     #Main Menu
     def main(self):
+        self.__preload()
         #adding a datetime input to log the current time of logging in
         while True:
-            todaydate_input = self.exit_check("Please key in today date: (yyyyMMdd) ")
             try:
+                todaydate_input = self.exit_check("Please key in today date: (yyyyMMdd) ")
                 todaydate = datetime.strptime(todaydate_input,'%Y%m%d').strftime('%Y%m%d')
                 break
             except ValueError:
                 print("Please follow the yyyyMMdd format only!")
             except ExitException:
+                #let the background load finish before the interpreter shuts down
+                self.__loader['thread'].join()
                 sys.exit()
            
         
-        #initializing the bicycle inventory object
-        bicycle_da = BicycleDA() 
-        bicycle_da.initsales(todaydate)
+        #the inventory already being loaded while the date was keyed in goes on loading while the menu is read,
+        #the first option waits for it
+        self.__open_day(todaydate)
         
         #looping to allow the script to jump back to menu
         while True:
@@ -469,16 +2609,37 @@ class BicycleController:
             print("3. Rental and Payment")
             print("4. Return Rental")
             print("5. Sales Report Today")
+            print("6. Sales Report for a Period")
+            print("7. Customer Lookup")
+            print("8. Reservations")
             print("X. Exit")
             print("===========================================")
             #getting user input to decide the options
             choice = input("Enter your choice: ")
             choice = choice.strip()
+            bicycle_da = self.__loaded()
             
             if choice == '1':
-                #Display Bicycles
-                print("\n")
-                bicycle_da.displayBicycles()
+                #Display Bicycles one page at a time, with optional filters
+                filters = {}
+                page = 1
+                try:
+                    while True:
+                        print("\n")
+                        result = bicycle_da.query_bicycles(page=page, **filters)
+                        print(result.render())
+                        action = self.exit_check("N: next page, P: previous page, F: filter, Enter: back to menu ").strip().lower()
+                        if action == 'n' and page < result.pages:
+                            page += 1
+                        elif action == 'p' and page > 1:
+                            page -= 1
+                        elif action == 'f':
+                            filters = self.inventory_filters(todaydate)
+                            page = 1
+                        elif action == '':
+                            break
+                except ExitException:
+                    sys.exit()
             elif choice == '2':
                 #Add new bicycles
                 while True:
@@ -490,7 +2651,7 @@ class BicycleController:
                         biketype = self.exit_check("Enter Bicycle Type : ")
                         biketype = biketype.lower().strip()
                         #Error Handling
-                        if biketype not in ["adult", "kid", "tandem", "family", "pgk"]:
+                        if biketype not in bicycle_da.tariff.types:
                             print("Please key in correct type!")
                             continue
                         #Get total bike quantity to add
@@ -501,7 +2662,7 @@ class BicycleController:
                     except ValueError:
                         print("Invalid input. Please enter a number.")
                 #Trigger add bicycle module
-                new_bicycle = Bicycle(biketype)
+                new_bicycle = Bicycle(biketype, tariff=bicycle_da.tariff)
                 bicycle_da.insertNewBicycle(new_bicycle,bike_quantity)    
                 
             elif choice == '3':
@@ -535,10 +2696,7 @@ class BicycleController:
                             print("Note that the rental is in terms of hourly block.")
                             duration = float(self.exit_check("How many hours do you want to rent it for: ").strip())
                             #Round off the duration
-                            if renttype.lower().strip() == 'pgk':
-                                duration = (math.ceil(duration*2))/2
-                            else:
-                                duration = math.ceil(duration)
+                            duration = bicycle_da.tariff.round_hours(renttype.lower().strip(), duration)
                             print(f"The rental hours is {duration} hours.")
                             break
                         except ExitException:
@@ -549,43 +2707,46 @@ class BicycleController:
                     curr_datetime = datetime.combine(datetime.strptime(todaydate, "%Y%m%d"),curr_time)
                     est_time_in = curr_datetime + timedelta(minutes=60 * duration)
                     print(f"The estimate return timing is : {est_time_in}")
-                    if est_time_in.day >curr_datetime.day:
-                        print("The bike will return on next day. PLease reduce the hours and try again.")
-                    else:
-                        #Proceed if the est return time is before 2359.
-                        while True:
-                           try:
-                               contact = self.exit_check("Please key in the contact number: ")
-                               #Validate hp number before save
-                               if contact.isdigit():
-                                   contact = int(contact)
-                                   #Assuming all SG handphone number starts with 8 or 9 and contains 8 digits
-                                   # 80000000 - 99999999 can be used as contact number
-                                   if 80000000<=contact < 100000000:
-                                       print("\n===========================================")
-                                       print("Confirmation: ")
-                                       print(f"The contact number is : {contact}")
-                                       break
-                                   else:
-                                       print("Please key in the correct contact number format! (8 digits starting with 8 or 9)")
-                               else:
-                                   print("Please key in the correct contact number format! (8 digits starting with 8 or 9)")
-                           except ExitException:
-                               sys.exit()
-                           except:
-                               print("Please key in the correct contact number format! (8 digits starting with 8 or 9)")
-                        bicycle_da.rentalfee(renttype.lower(), duration,curr_time,contact,rent_quantity,todaydate)
+                    if est_time_in.date() > curr_datetime.date():
+                        print("The bike will return on a later day, the rental carries over midnight.")
+                    try:
+                        contact = self.contact_number()
+                    except ExitException:
+                        sys.exit()
+                    bicycle_da.rentalfee(renttype.lower(), duration,curr_time,contact,rent_quantity,todaydate)
                 else:
+                    try:
+                        curr_time = self.current_time()
+                    except ExitException:
+                        sys.exit()
+                    expected = bicycle_da.next_available(renttype.lower().strip(), 1, datetime.combine(datetime.strptime(todaydate, "%Y%m%d"), curr_time))
+                    if expected is not None:
+                        print(f"The next {renttype} bike is expected to be back at {expected.strftime('%H:%M')}.")
                     print("Please select other type of bicycles.")
                     
             elif choice == '4':
                 try:
                 #Return rental
-                    sn = self.exit_check("Key in the returned bike serial number: ")
-                    bike_inv = bicycle_da.get_sn(sn.upper().strip())
+                    sn = self.exit_check("Key in the returned bike serial number, or the contact number to return all bikes of a customer: ")
+                    if sn.strip().isdigit():
+                        contact = int(sn.strip())
+                        bike_inv = len(bicycle_da.rentals_of(contact))
+                    else:
+                        contact = None
+                        bike_inv = bicycle_da.get_sn(sn.upper().strip())
                 except ExitException:
                     sys.exit()
-                if bike_inv>0:
+                if bike_inv>0 and contact is not None:
+                    while True:
+                       try:
+                           curr_time = datetime.strptime(self.exit_check("What is the current timing? (HH:MM) "),'%H:%M').time()
+                           break
+                       except ExitException:
+                           sys.exit()
+                       except:
+                           print("Please follow the HH:MM format only!")
+                    bicycle_da.returnbycontact(contact,curr_time,todaydate)
+                elif bike_inv>0:
                     #Get return time
                     while True:
                        try:
@@ -603,7 +2764,7 @@ class BicycleController:
             elif choice == '5':
                 # Sales Report
                 print("\n")
-                bicycle_da.salesreport(todaydate)
+                report = bicycle_da.salesreport(todaydate)
                 try:
                     # Output file
                     while True:
@@ -611,7 +2772,7 @@ class BicycleController:
                         output_choice = self.exit_check("Do you want to output the report to a text file? (yes/no): ")          
                         # Generate Sales report in .txt file
                         if output_choice.lower().strip() == "yes":                
-                            bicycle_da.sales_report_output(todaydate)
+                            bicycle_da.sales_report_output(todaydate, report)
                             print("Sales Report has been saved.")
                             break
                         # Does not generate Sales report in .txt file
@@ -627,15 +2788,122 @@ class BicycleController:
                     sys.exit()
                     
             
+            elif choice == '6':
+                # Sales Report over several days
+                try:
+                    while True:
+                        period = self.exit_check("Report period (week/month/year or yyyyMMdd-yyyyMMdd): ").lower().strip()
+                        try:
+                            start, end = self.report_period(period, todaydate)
+                            break
+                        except ValueError:
+                            print("Please key in week, month, year or two dates as yyyyMMdd-yyyyMMdd!")
+                    print("\n")
+                    report = bicycle_da.range_salesreport(start, end, todaydate)
+                    while True:
+                        output_choice = self.exit_check("Do you want to output the report to a text file? (yes/no): ").lower().strip()
+                        if output_choice == "yes":
+                            bicycle_da.sales_report_output(f"{start}_{end}", report)
+                            print("Sales Report has been saved.")
+                            break
+                        elif output_choice in ["no", "x"]:
+                            print("Report not saved.")
+                            break
+                        else:
+                            print("Invalid choice. Please try again.")
+                except ExitException:
+                    sys.exit()
+
+            elif choice == '7':
+                # Customer lookup by contact number
+                try:
+                    while True:
+                        contact = self.exit_check("Please key in the contact number: ").strip()
+                        if contact.isdigit():
+                            break
+                        print("Please key in the correct contact number format! (8 digits starting with 8 or 9)")
+                    bicycle_da.customerlookup(int(contact))
+                except ExitException:
+                    sys.exit()
+
+            elif choice == '8':
+                # Advance bookings: book bikes for a later time, hand them over, or cancel
+                try:
+                    action = self.exit_check("B: book, P: pick up, C: cancel, Enter: back to menu ").strip().lower()
+                    if action == 'b':
+                        self.reservation_booking(bicycle_da)
+                    elif action in ('p', 'c'):
+                        while True:
+                            booking = self.exit_check("Please key in the booking number: ").strip()
+                            if booking.isdigit():
+                                booking = int(booking)
+                                break
+                            print("Invalid input. Please enter a number.")
+                        if action == 'c':
+                            if bicycle_da.cancel_reservation(booking):
+                                print(f"Booking {booking} is cancelled.")
+                            else:
+                                print(f"There is no booking {booking}.")
+                        else:
+                            while True:
+                               try:
+                                   curr_time = datetime.strptime(self.exit_check("What is the current timing? (HH:MM) "),'%H:%M').time()
+                                   break
+                               except ValueError:
+                                   print("Please follow the HH:MM format only!")
+                            bicycle_da.pickupreservation(booking,curr_time,todaydate)
+                except ExitException:
+                    sys.exit()
+
             elif choice.lower() == 'x':
                 #Exit
+                bicycle_da.flush()
                 print("System terminated. Thank you!")
                 break
             else:
                 print("Invalid choice. Please try again.")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bicycle Rental Management System")
+    parser.add_argument("--sqlite", metavar="FILE", help="keep inventory and sales in a sqlite database instead of csv files, existing csv files are imported on first use")
+    parser.add_argument("--shared", action="store_true", help="csv files are used by several counter processes at once, lock them and write every change through")
+    parser.add_argument("--batch", metavar="FILE", help="run the operations in a jsonl or csv file ('-' for jsonl on stdin) without prompts")
+    parser.add_argument("--output", metavar="FILE", help="where batch results are written as jsonl, stdout by default")
+    parser.add_argument("--tariff", metavar="FILE", help="json file with the price, price unit and block minutes of each bike type")
+    parser.add_argument("--outlet", metavar="NAME", help="run the counter of one outlet, its inventory and sales are kept in outlets/NAME/")
+    parser.add_argument("--chain", choices=["inventory", "report"], help="print the bikes in store or the sales report of all outlets together")
+    parser.add_argument("--type", help="with --chain inventory, only the bikes in store of this type per outlet")
+    parser.add_argument("--start", help="first day (yyyyMMdd) of the --chain report, today by default")
+    parser.add_argument("--end", help="last day (yyyyMMdd) of the --chain report, today by default")
+    parser.add_argument("--metrics", metavar="FILE", help="time every operation and its stages, written at exit as json or as Prometheus text for .prom files")
+    parser.add_argument("--profile", metavar="FILE", help="run under cProfile and write the pstats file at exit")
+    args = parser.parse_args()
+    _observe_session(args.metrics, args.profile)
+    if args.chain:
+        chain = Chain()
+        if args.chain == 'inventory' and args.type:
+            for outlet, available in chain.available(args.type.lower()).items():
+                print(f"{outlet}: {available} {args.type.lower()} bikes available")
+        elif args.chain == 'inventory':
+            print(chain.render_inventory(), end="")
+        else:
+            todaydate = datetime.now().strftime('%Y%m%d')
+            report, revenue = chain.sales_report(args.start or todaydate, args.end or todaydate)
+            print(report.render(), end="")
+            print("Revenue by outlet")
+            for outlet, amount in revenue.items():
+                print(f"{outlet}\t${amount:.2f}")
+        sys.exit()
+    directory = _outlet_directory(args.outlet)
+    storage = SqliteStorage(os.path.join(directory, args.sqlite), import_from=directory) if args.sqlite else CsvStorage(directory, shared=args.shared)
+    tariff = _outlet_tariff(directory, args.tariff)
+    if args.batch:
+        lines = sys.stdin if args.batch == '-' else open(args.batch, newline='')
+        output = open(args.output, 'w') if args.output else sys.stdout
+        with lines, output:
+            BicycleController(storage, banner=False, tariff=tariff).batch(lines, output, csv_input=args.batch.lower().endswith('.csv'))
+        sys.exit()
     #calling of Controller through BicycleController class object
-    Controller = BicycleController()
+    Controller = BicycleController(storage, tariff=tariff)
     Controller.main()
     
\ No newline at end of file
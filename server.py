@@ -0,0 +1,389 @@
+# -*- coding: utf-8 -*-
+
+# Local HTTP/JSON service that owns the inventory for several rental counters.
+# One BicycleDA is kept in memory by the asyncio event loop. Every rent, return and add runs on
+# the loop thread without awaiting in between, so mutations are applied one at a time and two
+# counters can never both take the same 'In' bike. Reads are served from the same memory while
+# other connections wait on the network.
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import signal
+import traceback
+import urllib.error
+import urllib.request
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit, parse_qs, quote
+
+import main
+
+class ClosedDayError(Exception):
+    #A request for a day before the one the service is on
+    pass
+
+#Value of a request field converted by convert, ValueError naming the field when it is missing or
+#not of the right kind. Optional fields missing from the request are None
+def _field(fields, name, convert, required=True):
+    value = fields.get(name)
+    if value is None or value == '':
+        if required:
+            raise ValueError(f"missing field '{name}'")
+        return None
+    try:
+        return convert(value)
+    except (TypeError, ValueError, OverflowError) as e:
+        raise ValueError(f"field '{name}' is not valid: {value!r}") from e
+
+def _text(value):
+    if not isinstance(value, str):
+        raise TypeError(value)
+    return value.strip()
+
+#Whole number above zero, from json numbers or query text
+def _count(value):
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError(value)
+    number = int(value)
+    if number <= 0:
+        raise ValueError(value)
+    return number
+
+def _hours(value):
+    if isinstance(value, bool):
+        raise TypeError(value)
+    hours = float(value)
+    if not math.isfinite(hours) or hours <= 0:
+        raise ValueError(value)
+    return hours
+
+def _timestamp(value):
+    return main._parse_timestamp(_text(value))
+
+def _serials(value):
+    if not isinstance(value, list) or not value:
+        raise TypeError(value)
+    return [_text(sn).upper() for sn in value]
+
+#Every method and path dispatch answers, requests are timed under these names only so clients cannot add labels
+ROUTES = frozenset([('GET', '/inventory'), ('GET', '/bicycles'), ('GET', '/metrics'), ('GET', '/report'), ('GET', '/availability'),
+                    ('GET', '/free'), ('GET', '/overdue'), ('GET', '/history'), ('POST', '/rent'), ('POST', '/reserve'),
+                    ('POST', '/pickup'), ('POST', '/cancel'), ('POST', '/return'), ('POST', '/add')])
+
+class BicycleService:
+    def __init__(self, storage=None, flush_interval=5, tariff=None):
+        #Saving is done by the periodic flush task, not inside a request
+        self.bicycle_da = main.BicycleDA(storage, flush_every=float('inf'), flush_interval=float('inf'), tariff=tariff)
+        self.todaydate = None
+        self.__flush_interval = flush_interval
+
+    #The only place the sales day changes: the day of the request is opened when it is later than the one
+    #being served, and a request for an earlier day is refused, so the service never goes back to a closed day
+    def __day(self, timestamp):
+        todaydate = timestamp.strftime('%Y%m%d')
+        if self.todaydate is not None and todaydate < self.todaydate:
+            raise ClosedDayError(f"the sales of {todaydate} are closed, the service is on {self.todaydate}")
+        if todaydate != self.todaydate:
+            self.bicycle_da.initsales(todaydate)
+            self.todaydate = todaydate
+        return todaydate
+
+    def __bike_type(self, fields, name='type', required=True):
+        biketype = _field(fields, name, _text, required)
+        if biketype is not None and biketype.lower() not in self.bicycle_da.tariff.types:
+            raise ValueError(f"unknown bike type {biketype!r}")
+        return biketype.lower() if biketype is not None else None
+
+    #Route one request to BicycleDA, returns (status, response dict)
+    #Every field is checked before anything is changed. Requests that record sales carry the time they
+    #happened at the counter, the service does not guess it from its own clock
+    def dispatch(self, method, path, query, body):
+        da = self.bicycle_da
+        #Query strings give a list per name, the first value is used
+        query = {name: values[0] for name, values in query.items()}
+        if method == 'GET' and path == '/inventory':
+            biketype = self.__bike_type(query, required=False)
+            if biketype is None:
+                return 200, {'available': {t: da.get_inv(t) for t in da.tariff.types}}
+            return 200, {'type': biketype, 'available': da.get_inv(biketype)}
+        if method == 'GET' and path == '/bicycles':
+            #One page of the inventory, filtered like the menu view
+            filters = {'biketype': self.__bike_type(query, 'biketype', required=False), 'status': _field(query, 'status', _text, required=False),
+                       'contact': _field(query, 'contact', _count, required=False), 'overdue_at': _field(query, 'overdue_at', _timestamp, required=False)}
+            page = _field(query, 'page', _count, required=False) or 1
+            page_size = _field(query, 'page_size', _count, required=False) or 20
+            result = da.query_bicycles(page=page, page_size=page_size, **filters)
+            return 200, {'total': result.total, 'page': result.page, 'pages': result.pages,
+                         'bicycles': result.rows.to_dict('records'),
+                         'available': {bike_type: count for (bike_type, status), count in result.counts.items() if status == 'In'}}
+        if method == 'GET' and path == '/metrics':
+            return 200, main.INSTRUMENTS.snapshot()
+        if method == 'GET' and path == '/report':
+            #The report of the day being served, a time only opens the first day when none is open yet
+            if self.todaydate is None:
+                self.__day(_field(query, 'time', _timestamp))
+            report = da.sales_metrics().report(self.todaydate)
+            return 200, {'date': self.todaydate, 'revenue': report.total_revenue, 'revenue_by_type': report.revenue_by_type,
+                         'number_by_type': report.number_by_type, 'hourly_revenue': report.hourly_revenue}
+        if method == 'POST' and path == '/rent':
+            timestamp = _field(body, 'time', _timestamp)
+            renttype = self.__bike_type(body)
+            duration = da.tariff.round_hours(renttype, _field(body, 'hours', _hours))
+            contact = _field(body, 'contact', _count)
+            quantity = _field(body, 'quantity', _count)
+            rented = da.rent_bikes(renttype, duration, timestamp.time(), contact, quantity, self.__day(timestamp))
+            if rented is None:
+                return 409, {'error': f"not enough {renttype} bicycles available"}
+            serials, amount, hours = rented
+            return 200, {'serials': serials, 'amount': amount, 'hours': hours}
+        if method == 'GET' and path == '/availability':
+            timestamp = _field(query, 'time', _timestamp)
+            biketype = self.__bike_type(query)
+            quantity = _field(query, 'quantity', _count, required=False)
+            result = {'timeline': [{'time': slot.strftime('%H:%M'), 'available': count} for slot, count in da.availability(biketype, timestamp)]}
+            if quantity is not None:
+                expected = da.next_available(biketype, quantity, timestamp)
+                result['expected'] = expected.strftime('%Y-%m-%d %H:%M') if expected is not None else None
+            return 200, result
+        if method == 'GET' and path == '/free':
+            biketype = self.__bike_type(query)
+            start = _field(query, 'start', _timestamp)
+            end = start + timedelta(hours=_field(query, 'hours', _hours))
+            return 200, {'serials': da.free_bikes(biketype, start, end, _field(query, 'quantity', _count, required=False))}
+        if method == 'POST' and path == '/reserve':
+            renttype = self.__bike_type(body)
+            start = _field(body, 'start', _timestamp)
+            duration = da.tariff.round_hours(renttype, _field(body, 'hours', _hours))
+            reserved = da.reserve_bikes(renttype, start, duration, _field(body, 'contact', _count), _field(body, 'quantity', _count))
+            if reserved is None:
+                return 409, {'error': f"not enough {renttype} bicycles free for the whole period"}
+            booking, serials, end = reserved
+            return 200, {'booking': booking, 'serials': serials, 'end': end}
+        if method == 'POST' and path == '/pickup':
+            timestamp = _field(body, 'time', _timestamp)
+            booking = _field(body, 'booking', _count)
+            rented = da.pickup_reservation(booking, timestamp.time(), self.__day(timestamp))
+            if rented is None:
+                return 409, {'error': f"booking {booking} cannot be picked up"}
+            serials, amount, hours = rented
+            return 200, {'serials': serials, 'amount': amount, 'hours': hours}
+        if method == 'POST' and path == '/cancel':
+            booking = _field(body, 'booking', _count)
+            if not da.cancel_reservation(booking):
+                return 404, {'error': f"there is no booking {booking}"}
+            return 200, {'booking': booking}
+        if method == 'GET' and path == '/overdue':
+            #Only reads the rented bikes, the time of the question does not open its day
+            timestamp = _field(query, 'time', _timestamp)
+            late = da.overdue(timestamp.time(), timestamp.strftime('%Y%m%d'))
+            return 200, {'overdue': [{'sn': sn, 'type': row['Bike Type'], 'contact': row['Contact'], 'est_time_in': row['Est Time In'], 'amount': row['Amount']}
+                                     for sn, row in late.iterrows()]}
+        if method == 'GET' and path == '/history':
+            contact = _field(query, 'contact', _count)
+            history = main._csv_frame(da.contact_history(contact))
+            return 200, {'rented': da.rentals_of(contact), 'transactions': history.astype(object).where(history.notna(), None).to_dict('records')}
+        if method == 'POST' and path == '/return' and body.get('contact') is not None:
+            timestamp = _field(body, 'time', _timestamp)
+            contact = _field(body, 'contact', _count)
+            returned = da.return_by_contact(contact, timestamp.time(), self.__day(timestamp))
+            return 200, {'returned': [{'sn': r['Serial Number'], 'amount': r['Amount'], 'exceed_hours': r['Exceed Hours']} for r in returned], 'not_rented': []}
+        if method == 'POST' and path == '/return' and body.get('sns') is not None:
+            timestamp = _field(body, 'time', _timestamp)
+            sns = _field(body, 'sns', _serials)
+            returned = da.return_bikes([(sn, timestamp.time()) for sn in sns], self.__day(timestamp))
+            return 200, {'returned': [{'sn': sn, 'amount': r['Amount'], 'exceed_hours': r['Exceed Hours']} for sn, r in zip(sns, returned) if r is not None],
+                         'not_rented': [sn for sn, r in zip(sns, returned) if r is None]}
+        if method == 'POST' and path == '/return':
+            timestamp = _field(body, 'time', _timestamp)
+            sn = _field(body, 'sn', _text).upper()
+            returned = da.return_bike(sn, timestamp.time(), self.__day(timestamp))
+            if returned is None:
+                return 404, {'error': f"{sn} is not rented out"}
+            return 200, {'amount': returned['Amount'], 'exceed_hours': returned['Exceed Hours']}
+        if method == 'POST' and path == '/add':
+            timestamp = _field(body, 'time', _timestamp)
+            biketype = self.__bike_type(body)
+            quantity = _field(body, 'quantity', _count)
+            self.__day(timestamp)
+            return 200, {'serials': da.add_bicycles(main.Bicycle(biketype, tariff=da.tariff), quantity)}
+        return 404, {'error': f"no route for {method} {path}"}
+
+    #Answer one request, every error is turned into a response: 400 for a bad request, 409 for a closed
+    #day and 500 for anything else, so a client always gets a reply
+    def respond(self, method, target, raw):
+        url = urlsplit(target)
+        try:
+            body = json.loads(raw) if raw else {}
+            if not isinstance(body, dict):
+                raise ValueError("the body must be a json object")
+            route = f"{method} {url.path}" if (method, url.path) in ROUTES else 'unmatched'
+            with main.INSTRUMENTS.timer('operation', route):
+                return self.dispatch(method, url.path, parse_qs(url.query), body)
+        except ClosedDayError as e:
+            return 409, {'error': str(e)}
+        except (KeyError, ValueError) as e:
+            return 400, {'error': f"bad request: {e}"}
+        except Exception as e:
+            traceback.print_exc()
+            return 500, {'error': f"internal error: {e!r}"}
+
+    #One keep-alive connection, requests are answered in order
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                    length = int(headers.get('content-length', 0))
+                    if length < 0:
+                        raise ValueError(length)
+                except ValueError:
+                    #The rest of the stream cannot be trusted after a broken request line or length
+                    headers['connection'] = 'close'
+                    status, result = 400, {'error': "bad request: malformed request line or content-length"}
+                else:
+                    raw = await reader.readexactly(length) if length else b''
+                    status, result = self.respond(method, target, raw)
+                payload = json.dumps(result, default=main._json_value).encode()
+                writer.write(f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                             f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n".encode() + payload)
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    #Save the inventory every few seconds while serving
+    async def flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.__flush_interval)
+            self.bicycle_da.flush()
+
+    #Serve until interrupted or sent SIGTERM, a SIGTERM stops the service like Ctrl+C: the inventory is
+    #flushed and the metrics and profile are written at exit
+    async def serve(self, host='127.0.0.1', port=8080):
+        server = await asyncio.start_server(self.handle, host, port)
+        flusher = asyncio.create_task(self.flush_periodically())
+        stopping = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        try:
+            loop.add_signal_handler(signal.SIGTERM, stopping.set)
+        except (NotImplementedError, AttributeError):
+            #No signal handlers on the Windows event loop
+            pass
+        try:
+            async with server:
+                await stopping.wait()
+        finally:
+            flusher.cancel()
+            self.bicycle_da.flush()
+
+#Time of a counter operation, the clock of the counter unless one is given
+def _counter_time(timestamp=None):
+    return timestamp or datetime.now().strftime('%Y-%m-%d %H:%M')
+
+class BicycleClient:
+    #Thin client for a counter, same operations as BicycleDA but answered by the service
+    def __init__(self, url='http://127.0.0.1:8080'):
+        self.url = url.rstrip('/')
+
+    def __call(self, method, path, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(self.url + path, data=data, method=method, headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request) as response:
+                return json.load(response)
+        except urllib.error.HTTPError as e:
+            return json.load(e)
+
+    def get_inv(self, renttype):
+        return self.__call('GET', f'/inventory?type={renttype}')['available']
+
+    def rent_bikes(self, renttype, duration, contact, rent_quantity, timestamp=None):
+        result = self.__call('POST', '/rent', {'type': renttype, 'hours': duration, 'contact': contact, 'quantity': rent_quantity, 'time': _counter_time(timestamp)})
+        if 'error' in result:
+            return None
+        return result['serials'], result['amount'], result['hours']
+
+    def return_bike(self, sn, timestamp=None):
+        result = self.__call('POST', '/return', {'sn': sn, 'time': _counter_time(timestamp)})
+        return None if 'error' in result else result
+
+    def return_bikes(self, sns, timestamp=None):
+        return self.__call('POST', '/return', {'sns': sns, 'time': _counter_time(timestamp)})
+
+    def return_by_contact(self, contact, timestamp=None):
+        return self.__call('POST', '/return', {'contact': contact, 'time': _counter_time(timestamp)})
+
+    def history(self, contact):
+        return self.__call('GET', f'/history?contact={contact}')
+
+    def availability(self, renttype, rent_quantity=None, timestamp=None):
+        query = f"?type={renttype}&time={quote(_counter_time(timestamp))}" + (f"&quantity={rent_quantity}" if rent_quantity else '')
+        return self.__call('GET', '/availability' + query)
+
+    def reserve_bikes(self, renttype, start, duration, contact, rent_quantity):
+        result = self.__call('POST', '/reserve', {'type': renttype, 'start': start, 'hours': duration, 'contact': contact, 'quantity': rent_quantity})
+        if 'error' in result:
+            return None
+        return result['booking'], result['serials'], result['end']
+
+    def free_bikes(self, renttype, start, duration, rent_quantity=None):
+        query = f"?type={renttype}&start={quote(start)}&hours={duration}" + (f"&quantity={rent_quantity}" if rent_quantity else '')
+        return self.__call('GET', '/free' + query)['serials']
+
+    def pickup_reservation(self, booking, timestamp=None):
+        result = self.__call('POST', '/pickup', {'booking': booking, 'time': _counter_time(timestamp)})
+        if 'error' in result:
+            return None
+        return result['serials'], result['amount'], result['hours']
+
+    def cancel_reservation(self, booking):
+        return 'error' not in self.__call('POST', '/cancel', {'booking': booking})
+
+    def overdue(self, timestamp=None):
+        return self.__call('GET', f'/overdue?time={quote(_counter_time(timestamp))}')['overdue']
+
+    def add_bicycles(self, biketype, bike_quantity, timestamp=None):
+        return self.__call('POST', '/add', {'type': biketype, 'quantity': bike_quantity, 'time': _counter_time(timestamp)})['serials']
+
+    def report(self, timestamp=None):
+        return self.__call('GET', f'/report?time={quote(_counter_time(timestamp))}')
+
+    def metrics(self):
+        return self.__call('GET', '/metrics')
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the bicycle inventory to several rental counters")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--sqlite", metavar="FILE", help="keep inventory and sales in a sqlite database instead of csv files")
+    parser.add_argument("--flush-interval", type=float, default=5, help="seconds between inventory saves")
+    parser.add_argument("--tariff", metavar="FILE", help="json file with the price, price unit and block minutes of each bike type")
+    parser.add_argument("--outlet", metavar="NAME", help="serve one outlet, its inventory and sales are kept in outlets/NAME/")
+    parser.add_argument("--metrics", metavar="FILE", help="time every request and its stages, served at GET /metrics and written at exit")
+    parser.add_argument("--profile", metavar="FILE", help="run under cProfile and write the pstats file at exit")
+    args = parser.parse_args()
+    main._observe_session(args.metrics, args.profile)
+    directory = main._outlet_directory(args.outlet)
+    storage = main.SqliteStorage(os.path.join(directory, args.sqlite), import_from=directory) if args.sqlite else main.CsvStorage(directory)
+    tariff = main._outlet_tariff(directory, args.tariff)
+    service = BicycleService(storage, args.flush_interval, tariff)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    print("Service stopped.")
@@ -0,0 +1,32 @@
+import os
+import sys
+
+import pytest
+
+#The modules live at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+
+
+@pytest.fixture
+def directory(tmp_path):
+    return str(tmp_path)
+
+
+#BicycleDA on csv files in a temporary folder, saving only on flush like the service does
+@pytest.fixture
+def open_da(directory):
+    opened = []
+    def open_da(storage=None, **kwargs):
+        kwargs.setdefault('flush_every', float('inf'))
+        kwargs.setdefault('flush_interval', float('inf'))
+        storage = storage if storage is not None else main.CsvStorage(directory)
+        da = main.BicycleDA(storage, **kwargs)
+        opened.append((da, storage))
+        return da
+    yield open_da
+    #Nothing is left for the flush at exit to write into the removed folder
+    for da, storage in opened:
+        da.flush()
+        storage.close()
@@ -0,0 +1,83 @@
+import gzip
+import os
+from datetime import time
+
+import pytest
+
+import main
+
+
+def sales_bytes(path):
+    with open(path, 'rb') as file:
+        return file.read()
+
+
+def test_rollover_keeps_rentals_out_and_archives_the_closed_day(open_da, directory):
+    da = open_da()
+    da.initsales('20230101')
+    da.add_bicycles(main.Bicycle('adult'), 3)
+    da.rent_bikes('adult', 1, time(10, 0), 91234567, 1, '20230101')
+    da.rent_bikes('adult', 3, time(22, 0), 81234567, 1, '20230101')
+    day_one = sales_bytes(os.path.join(directory, 'sales_list_20230101.csv'))
+    da.initsales('20230102')
+    assert not os.path.exists(os.path.join(directory, 'sales_list_20230101.csv'))
+    with gzip.open(os.path.join(directory, 'sales_archive', 'sales_20230101.csv.gz')) as segment:
+        assert segment.read() == day_one
+    #Both rentals stay out, the one past midnight is returned on time and the other is charged its excess
+    assert da.rentals_of(91234567) == ['A001'] and da.rentals_of(81234567) == ['A002']
+    assert da.return_bike('A002', time(0, 30), '20230102')['Amount'] == 0
+    assert da.return_bike('A001', time(9, 0), '20230102')['Exceed Hours'] == 22
+    #Reports and customer lookups still read the archived day
+    report = da.range_sales_report('20230101', '20230102', '20230102')
+    assert report.total_revenue == 8 + 24 + 22 * 8
+    assert da.contact_history(91234567)['Date'].tolist() == ['20230101', '20230102']
+
+
+def test_an_archived_day_opened_again_is_restored_and_archived_again(open_da, directory):
+    da = open_da()
+    da.initsales('20230101')
+    da.add_bicycles(main.Bicycle('kid'), 2)
+    da.rent_bikes('kid', 1, time(10, 0), 91234567, 1, '20230101')
+    da.initsales('20230102')
+    da.initsales('20230101')
+    assert os.path.exists(os.path.join(directory, 'sales_list_20230101.csv'))
+    assert not os.path.exists(os.path.join(directory, 'sales_archive', 'sales_20230101.csv.gz'))
+    da.rent_bikes('kid', 1, time(15, 0), 81234567, 1, '20230101')
+    day_one = sales_bytes(os.path.join(directory, 'sales_list_20230101.csv'))
+    da.initsales('20230103')
+    with gzip.open(os.path.join(directory, 'sales_archive', 'sales_20230101.csv.gz')) as segment:
+        assert segment.read() == day_one
+    assert da.contact_history(81234567)['Time'].astype(str).tolist() == ['0 days 15:00:00']
+
+
+def test_a_crash_during_restore_never_loses_the_day(directory, monkeypatch):
+    archive = main.SalesArchive(os.path.join(directory, 'sales_archive'), block_size=60)
+    path = os.path.join(directory, 'sales_list_20230101.csv')
+    journal = main.SalesJournal(path, main.SALES_COLUMNS)
+    journal.append([{'Bike Type': 'adult', 'Amount': 8, 'Contact': 90000000 + n, 'Serial Number': f"A{n:03d}"} for n in range(10)])
+    journal.close()
+    archive.add('20230101', path)
+    #The csv is written back but the process dies before the index entry is dropped
+    atomic_write = main._atomic_write
+    def crash_on_index(target, write, mode='w'):
+        if target == archive.index_path:
+            raise KeyboardInterrupt
+        atomic_write(target, write, mode)
+    monkeypatch.setattr(main, '_atomic_write', crash_on_index)
+    with pytest.raises(KeyboardInterrupt):
+        archive.restore('20230101', path)
+    monkeypatch.undo()
+    archive = main.SalesArchive(os.path.join(directory, 'sales_archive'), block_size=60)
+    assert os.path.exists(path) and '20230101' in archive
+    #Sales recorded on the restored csv are archived with the rest
+    journal = main.SalesJournal(path, main.SALES_COLUMNS)
+    journal.append([{'Bike Type': 'kid', 'Amount': 6, 'Contact': 91234567, 'Serial Number': 'K001'}])
+    journal.close()
+    day = sales_bytes(path)
+    archive.add('20230101', path)
+    assert not os.path.exists(path)
+    with gzip.open(archive.segment_path('20230101')) as segment:
+        assert segment.read() == day
+    last = day.rindex(b'\n', 0, len(day) - 1) + 1
+    assert archive.read_lines('20230101', [last]) == [day[last:]]
+    assert '20230101' in main.SalesArchive(os.path.join(directory, 'sales_archive'))
@@ -0,0 +1,30 @@
+from datetime import datetime, time
+
+import main
+
+
+def test_next_available_never_gives_a_time_already_passed(open_da):
+    da = open_da()
+    da.initsales('20230101')
+    da.add_bicycles(main.Bicycle('tandem'), 3)
+    da.rent_bikes('tandem', 1, time(9, 0), 91234567, 2, '20230101')
+    da.rent_bikes('tandem', 3, time(9, 0), 81234567, 1, '20230101')
+    assert da.next_available('tandem', 1, datetime(2023, 1, 1, 9, 30)) == datetime(2023, 1, 1, 10, 0)
+    assert da.next_available('tandem', 2, datetime(2023, 1, 1, 9, 30)) == datetime(2023, 1, 1, 10, 0)
+    assert da.next_available('tandem', 3, datetime(2023, 1, 1, 9, 30)) == datetime(2023, 1, 1, 12, 0)
+    #Both bikes due at 10:00 are overdue by 11:00, only the one due at noon is still expected
+    assert da.next_available('tandem', 1, datetime(2023, 1, 1, 11, 0)) == datetime(2023, 1, 1, 12, 0)
+    assert da.next_available('tandem', 2, datetime(2023, 1, 1, 11, 0)) is None
+    assert da.next_available('tandem', 1, datetime(2023, 1, 1, 13, 0)) is None
+
+
+def test_availability_counts_bikes_back_by_each_slot(open_da):
+    da = open_da()
+    da.initsales('20230101')
+    da.add_bicycles(main.Bicycle('kid'), 3)
+    da.rent_bikes('kid', 1, time(9, 0), 91234567, 2, '20230101')
+    timeline = dict(da.availability('kid', datetime(2023, 1, 1, 9, 15)))
+    assert timeline[datetime(2023, 1, 1, 9, 15)] == 1
+    assert timeline[datetime(2023, 1, 1, 9, 30)] == 1
+    assert timeline[datetime(2023, 1, 1, 10, 0)] == 3
+    assert timeline[datetime(2023, 1, 1, 23, 30)] == 3
@@ -0,0 +1,67 @@
+import io
+import json
+import os
+
+import pandas as pd
+
+import main
+
+
+def run(directory, operations, csv_input=False):
+    storage = main.CsvStorage(directory)
+    output = io.StringIO()
+    lines = operations if csv_input else [json.dumps(operation) + '\n' for operation in operations]
+    main.BicycleController(storage, banner=False).batch(lines, output, csv_input=csv_input)
+    storage.close()
+    return [json.loads(line) for line in output.getvalue().splitlines()]
+
+
+def test_every_operation_gets_a_result_line(directory):
+    results = run(directory, [
+        {'op': 'add', 'type': 'adult', 'quantity': 3, 'time': '2024-01-01 08:00'},
+        {'op': 'add', 'type': 'pgk', 'quantity': 1, 'time': '2024-01-01 08:00'},
+        {'op': 'rent', 'type': 'adult', 'quantity': 2, 'hours': 1.2, 'contact': 91234567, 'time': '2024-01-01 09:00'},
+        {'op': 'rent', 'type': 'pgk', 'quantity': 1, 'hours': 0.7, 'contact': 81234567, 'time': '2024-01-01 09:00'},
+        {'op': 'rent', 'type': 'adult', 'quantity': 2, 'hours': 1, 'contact': 71234567, 'time': '2024-01-01 09:30'},
+        {'op': 'return', 'sn': 'a001', 'time': '2024-01-01 12:00'},
+        {'op': 'return', 'contact': 81234567, 'time': '2024-01-01 10:00'},
+        {'op': 'return', 'sns': ['A002', 'A003'], 'time': '2024-01-01 12:00'},
+        {'op': 'fly', 'time': '2024-01-01 12:00'},
+        {'op': 'report', 'time': '2024-01-01 12:00'},
+    ])
+    assert [result['line'] for result in results] == list(range(1, 11))
+    assert [result['ok'] for result in results] == [True] * 4 + [False] + [True] * 3 + [False, True]
+    assert results[2]['serials'] == ['A001', 'A002'] and results[2]['amount'] == 32 and results[2]['hours'] == 2
+    assert results[3]['amount'] == 26 and results[3]['hours'] == 1
+    assert results[5]['amount'] == 8 and results[5]['exceed_hours'] == 1
+    assert results[6]['returned'] == [{'sn': 'P001', 'amount': 0, 'exceed_hours': 0}]
+    assert results[7]['returned'] == [{'sn': 'A002', 'amount': 8, 'exceed_hours': 1}] and results[7]['not_rented'] == ['A003']
+    assert results[9]['revenue'] == 32 + 26 + 8 + 8
+    inventory = pd.read_csv(os.path.join(directory, 'bicycle_db.csv'))
+    assert (inventory['Status'] == 'In').all()
+
+
+def test_csv_operations(directory):
+    results = run(directory, ['op,type,quantity,hours,contact,time\n',
+                              'add,kid,2,,,2024-01-01 08:00\n',
+                              'rent,kid,1,1.5,91234567,2024-01-01 09:00\n'], csv_input=True)
+    assert [result['ok'] for result in results] == [True, True]
+    assert results[1]['amount'] == 12 and results[1]['hours'] == 2
+    #The rounded hours are what is booked in the inventory
+    inventory = pd.read_csv(os.path.join(directory, 'bicycle_db.csv'), index_col='Serial Number')
+    assert inventory.at['K001', 'Booked Hours'] == 2
+
+
+def test_the_log_is_synced_once_for_the_whole_batch(directory, monkeypatch):
+    synced = []
+    fsync = os.fsync
+    monkeypatch.setattr(main.os, 'fsync', lambda fd: synced.append(fd) or fsync(fd))
+    wal = main.WriteAheadLog(os.path.join(directory, 'bicycle_db.wal'))
+    with wal.group():
+        for number in range(50):
+            wal.append([{'op': 'set', 'sns': [f"A{number:03}"], 'values': {'Status': 'Out'}}])
+    assert len(synced) == 1
+    wal.append([{'op': 'set', 'sns': ['A001'], 'values': {'Status': 'In'}}])
+    assert len(synced) == 2
+    assert len(wal.entries()) == 51
+    wal.close()
@@ -0,0 +1,52 @@
+import os
+from datetime import time
+
+import pytest
+
+import main
+
+
+#Two outlets that have not saved their last changes: north on csv files, south on sqlite
+@pytest.fixture
+def outlets(open_da, directory):
+    root = os.path.join(directory, 'outlets')
+    north, south = os.path.join(root, 'north'), os.path.join(root, 'south')
+    os.makedirs(north)
+    os.makedirs(south)
+    da = open_da(main.CsvStorage(north))
+    da.initsales('20230101')
+    da.add_bicycles(main.Bicycle('adult'), 3)
+    da.add_bicycles(main.Bicycle('pgk'), 1)
+    da.flush()
+    da.rent_bikes('adult', 2, time(9, 0), 91234567, 2, '20230101')
+    da.rent_bikes('pgk', 1, time(9, 0), 81234567, 1, '20230101')
+    da.return_bike('P001', time(11, 0), '20230101')
+    da = open_da(main.SqliteStorage(os.path.join(south, 'bicycle_rental.db'), import_from=None))
+    da.initsales('20230101')
+    da.add_bicycles(main.Bicycle('adult'), 2)
+    da.add_bicycles(main.Bicycle('kid'), 2)
+    da.rent_bikes('kid', 1, time(10, 0), 71234567, 1, '20230101')
+    return root
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_bikes_in_store_include_changes_not_saved_yet(outlets, workers):
+    chain = main.Chain(outlets, workers=workers)
+    assert chain.available('adult') == {'north': 1, 'south': 2}
+    assert chain.available('kid') == {'south': 1}
+    assert chain.inventory() == {'north': {'adult': 1, 'pgk': 1}, 'south': {'adult': 2, 'kid': 1}}
+    total = chain.render_inventory().splitlines()[-1].split()
+    assert total[:4] == ['Total', '3', '1', '0']
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_sales_report_merges_the_outlets(outlets, workers):
+    report, revenue = main.Chain(outlets, workers=workers).sales_report('20230101', '20230101')
+    assert revenue == {'north': 16 * 2 + 26 + 26, 'south': 6}
+    assert report.total_revenue == 16 * 2 + 26 + 26 + 6
+    assert report.number_by_type == {'adult': 2, 'pgk': 2, 'kid': 1}
+
+
+def test_no_outlets(directory):
+    chain = main.Chain(os.path.join(directory, 'outlets'))
+    assert chain.outlets() == [] and chain.inventory() == {}
@@ -0,0 +1,54 @@
+import os
+
+import pandas as pd
+
+import main
+
+
+def write_day(directory, date, rows):
+    sales = pd.DataFrame([{'Bike Type': biketype, 'Price': 8, 'Price Unit': 'per hour', 'Contact': contact, 'Time': when,
+                           'Transaction Type': 'Rental', 'Amount': amount, 'Serial Number': 'A001'}
+                          for biketype, contact, when, amount in rows], columns=main.SALES_COLUMNS)
+    main._atomic_write(os.path.join(directory, f"sales_list_{date}.csv"), lambda file: sales.to_csv(file, index=False))
+
+
+def contact_index(directory):
+    return main.ContactIndex(directory, os.path.join(directory, 'sales_cache', 'contacts.csv'))
+
+
+def amounts(index, contact):
+    return index.history(contact)[['Date', 'Amount']].values.tolist()
+
+
+def test_a_day_rewritten_larger_is_indexed_again(directory):
+    write_day(directory, '20230101', [('adult', 91234567, '09:00:00', 8), ('kid', 81234567, '10:00:00', 6)])
+    index = contact_index(directory)
+    assert amounts(index, 91234567) == [['20230101', 8]]
+    #Same day written again with longer rows, the old offsets point into the middle of rows
+    write_day(directory, '20230101', [('tandem', 71234567, '08:00:00', 1600), ('adult', 91234567, '09:00:00', 800),
+                                      ('adult', 91234567, '11:00:00', 808), ('family', 81234567, '12:00:00', 3500)])
+    assert amounts(index, 91234567) == [['20230101', 800], ['20230101', 808]]
+    assert amounts(index, 81234567) == [['20230101', 3500]]
+    #The index file holds no rows of the old file, a new process reads the same
+    again = contact_index(directory)
+    assert amounts(again, 91234567) == [['20230101', 800], ['20230101', 808]]
+    assert amounts(again, 71234567) == [['20230101', 1600]]
+
+
+def test_rows_appended_later_are_indexed_once(directory):
+    write_day(directory, '20230101', [('adult', 91234567, '09:00:00', 8)])
+    assert amounts(contact_index(directory), 91234567) == [['20230101', 8]]
+    with open(os.path.join(directory, 'sales_list_20230101.csv'), 'a') as file:
+        file.write('adult,8,per hour,91234567,10:00:00,Rental,16,A002\n')
+    assert amounts(contact_index(directory), 91234567) == [['20230101', 8], ['20230101', 16]]
+    assert amounts(contact_index(directory), 91234567) == [['20230101', 8], ['20230101', 16]]
+
+
+def test_a_day_removed_without_archiving_is_skipped(directory):
+    write_day(directory, '20230101', [('adult', 91234567, '09:00:00', 8)])
+    write_day(directory, '20230102', [('adult', 91234567, '09:00:00', 16)])
+    index = contact_index(directory)
+    assert amounts(index, 91234567) == [['20230101', 8], ['20230102', 16]]
+    os.remove(os.path.join(directory, 'sales_list_20230101.csv'))
+    assert amounts(index, 91234567) == [['20230102', 16]]
+    assert amounts(contact_index(directory), 91234567) == [['20230102', 16]]
@@ -0,0 +1,53 @@
+import csv
+from datetime import time
+
+import main
+
+
+def booked_hours(directory):
+    with open(f"{directory}/bicycle_db.csv", newline='') as file:
+        return {row['Serial Number']: row['Booked Hours'] for row in csv.DictReader(file)}
+
+
+def test_whole_booked_hours_are_written_as_int(open_da, directory):
+    da = open_da()
+    da.initsales('20230101')
+    da.add_bicycles(main.Bicycle('adult'), 2)
+    da.add_bicycles(main.Bicycle('pgk'), 2)
+    da.rent_bikes('adult', 2, time(9, 0), 91234567, 1, '20230101')
+    da.flush()
+    assert booked_hours(directory) == {'A001': '2', 'A002': '0', 'P001': '0', 'P002': '0'}
+    da.rent_bikes('pgk', 1.5, time(9, 0), 91234567, 1, '20230101')
+    da.flush()
+    assert booked_hours(directory) == {'A001': '2', 'A002': '0', 'P001': '1.5', 'P002': '0'}
+    assert [row['Booked Hours'] for row in da.query_bicycles().rows.to_dict('records')] == [0, 2, 0, 1.5]
+
+
+def test_inventory_reads_back_the_same(open_da, directory):
+    da = open_da()
+    da.initsales('20230101')
+    da.add_bicycles(main.Bicycle('pgk'), 2)
+    da.rent_bikes('pgk', 1.5, time(9, 0), 91234567, 1, '20230101')
+    da.flush()
+    first = da.query_bicycles().rows
+    again = open_da()
+    again.initsales('20230101')
+    assert again.query_bicycles().rows.equals(first)
+    assert again.return_bike('P001', time(10, 31), '20230101')['Exceed Hours'] == 0.5
+
+
+def test_pages_follow_type_status_and_inventory_order(open_da):
+    da = open_da()
+    da.initsales('20230101')
+    da.add_bicycles(main.Bicycle('kid'), 5)
+    da.add_bicycles(main.Bicycle('adult'), 30)
+    da.rent_bikes('adult', 1, time(9, 0), 91234567, 3, '20230101')
+    da.return_bike('A002', time(9, 30), '20230101')
+    da.add_bicycles(main.Bicycle('adult'), 2)
+    expected = ([f"A{n:03d}" for n in range(1, 33) if n not in (1, 3)] + ['A001', 'A003'] + [f"K{n:03d}" for n in range(1, 6)])
+    pages = [da.query_bicycles(page=page, page_size=7) for page in range(1, 7)]
+    assert [sn for page in pages for sn in page.rows['Serial Number']] == expected
+    assert pages[0].total == 37 and pages[0].pages == 6
+    assert da.query_bicycles(status='Out', page_size=1, page=2).rows['Serial Number'].tolist() == ['A003']
+    assert da.query_bicycles(biketype='kid', page=2, page_size=4).rows['Serial Number'].tolist() == ['K005']
+    assert da.query_bicycles(biketype='kid', page=3, page_size=4).rows.empty
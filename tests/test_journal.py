@@ -0,0 +1,55 @@
+import csv
+from datetime import time
+
+import main
+
+
+def read_rows(path):
+    with open(path, newline='') as file:
+        return list(csv.reader(file))
+
+
+def test_new_file_starts_with_the_header(directory):
+    path = f"{directory}/sales_list_20230101.csv"
+    journal = main.SalesJournal(path, main.SALES_COLUMNS)
+    journal.close()
+    assert read_rows(path) == [main.SALES_COLUMNS]
+
+
+def test_rows_are_appended_in_column_order(directory):
+    path = f"{directory}/sales_list_20230101.csv"
+    journal = main.SalesJournal(path, main.SALES_COLUMNS)
+    journal.append([{'Bike Type': 'adult', 'Price': 8, 'Price Unit': 'per hour', 'Contact': 91234567,
+                     'Time': '10:00:00', 'Transaction Type': 'Rental', 'Amount': 16, 'Serial Number': 'A001'}])
+    journal.close()
+    journal = main.SalesJournal(path, main.SALES_COLUMNS)
+    journal.append([{'Bike Type': 'kid', 'Amount': 6, 'Serial Number': 'K001'}])
+    journal.close()
+    header, first, second = read_rows(path)
+    assert header == main.SALES_COLUMNS
+    assert dict(zip(header, first))['Serial Number'] == 'A001'
+    assert dict(zip(header, second)) == dict.fromkeys(main.SALES_COLUMNS, '') | {'Bike Type': 'kid', 'Amount': '6', 'Serial Number': 'K001'}
+
+
+def test_old_column_order_is_rewritten_once(directory):
+    path = f"{directory}/sales_list_20230101.csv"
+    old_columns = [col for col in main.SALES_COLUMNS if col != 'Serial Number']
+    with open(path, 'w', newline='') as file:
+        csv.writer(file).writerows([old_columns, ['adult', 8, 'per hour', 91234567, '10:00:00', 'Rental', 16]])
+    main.SalesJournal(path, main.SALES_COLUMNS).close()
+    header, row = read_rows(path)
+    assert header == main.SALES_COLUMNS
+    assert dict(zip(header, row))['Amount'] == '16'
+
+
+def test_sales_of_a_day_are_kept_across_restarts(open_da):
+    da = open_da()
+    da.initsales('20230101')
+    da.add_bicycles(main.Bicycle('adult'), 3)
+    serials, amount, hours = da.rent_bikes('adult', 2, time(10, 0), 91234567, 2, '20230101')
+    assert amount == 32
+    da.flush()
+    da = open_da()
+    da.initsales('20230101')
+    assert da.sales_metrics().report('20230101').total_revenue == 32
+    assert da.get_inv('adult') == 1
@@ -0,0 +1,31 @@
+import re
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def instruments():
+    instruments = main.Instrumentation()
+    instruments.enabled = True
+    return instruments
+
+
+def test_label_values_are_escaped(instruments):
+    instruments.observe('operation', 'GET /nope0"x', 0.001)
+    instruments.observe('stage', 'a\\b\nc', 0.001)
+    instruments.count('bytes_written', 'say "hi"', 3)
+    text = instruments.to_prometheus()
+    assert 'operation="GET /nope0\\"x"' in text
+    assert 'stage="a\\\\b\\nc"' in text
+    assert 'source="say \\"hi\\""' in text
+    #Every sample line is name{labels} value with properly closed quoted label values
+    sample = re.compile(r'^[a-z_]+\{([a-z]+="(?:[^"\\\n]|\\.)*",?)+\} \S+$')
+    for line in text.splitlines():
+        assert line.startswith('# TYPE') or sample.match(line), line
+
+
+def test_timed_keeps_the_name_of_the_operation():
+    assert main.BicycleDA.flush.__name__ == 'flush'
+    assert main.BicycleDA.flush.__wrapped__.__name__ == 'flush'
@@ -0,0 +1,43 @@
+from datetime import time
+
+import pandas as pd
+
+import main
+
+
+def rented_da(open_da, directory):
+    da = open_da()
+    da.initsales('20230101')
+    da.add_bicycles(main.Bicycle('adult'), 4)
+    da.add_bicycles(main.Bicycle('pgk'), 2)
+    da.rent_bikes('adult', 1, time(9, 0), 91234567, 4, '20230101')
+    da.rent_bikes('pgk', 1, time(9, 0), 81234567, 2, '20230101')
+    return da
+
+
+def excess_rows(directory):
+    sales = pd.read_csv(f"{directory}/sales_list_20230101.csv")
+    return sales[sales['Transaction Type'] == 'Excess Hour Charges'].drop(columns='Serial Number').to_dict('records')
+
+
+def test_single_return_matches_the_batch_path(open_da, directory):
+    da = rented_da(open_da, directory)
+    single = [da.return_bike(sn, time(11, 10), '20230101') for sn in ['A001', 'P001']]
+    batch = da.return_bikes([('A002', time(11, 10)), ('P002', time(11, 10))], '20230101')
+    for one, other in zip(single, batch):
+        assert {**one, 'Serial Number': None} == {**other, 'Serial Number': None}
+    assert single[0]['Exceed Hours'] == 2 and single[0]['Amount'] == 16
+    assert single[1]['Exceed Hours'] == 1.5 and single[1]['Amount'] == 39
+    rows = excess_rows(directory)
+    assert rows[0] == rows[2] and rows[1] == rows[3]
+    assert da.get_inv('adult') == 2 and da.get_inv('pgk') == 2
+    assert da.rentals_of(91234567) == ['A003', 'A004']
+
+
+def test_only_bikes_out_are_returned(open_da, directory):
+    da = rented_da(open_da, directory)
+    assert da.return_bike('A001', time(9, 30), '20230101')['Amount'] == 0
+    assert da.return_bike('A001', time(9, 30), '20230101') is None
+    assert da.return_bike('Z999', time(9, 30), '20230101') is None
+    assert da.return_bikes([('A002', time(9, 30)), ('A002', time(9, 30)), ('A001', time(9, 30))], '20230101')[1:] == [None, None]
+    assert excess_rows(directory) == []
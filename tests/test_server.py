@@ -0,0 +1,165 @@
+import asyncio
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+import main
+import server
+
+
+@pytest.fixture
+def service(directory):
+    storage = main.CsvStorage(directory)
+    service = server.BicycleService(storage)
+    status, result = service.respond('POST', '/add', json.dumps({'type': 'adult', 'quantity': 5, 'time': '2024-01-01 09:00'}).encode())
+    assert status == 200
+    yield service
+    service.bicycle_da.flush()
+    storage.close()
+
+
+def post(service, path, body):
+    return service.respond('POST', path, json.dumps(body).encode())
+
+
+def test_rent_and_return(service):
+    status, result = post(service, '/rent', {'type': 'adult', 'hours': 2, 'contact': 91234567, 'quantity': 2, 'time': '2024-01-01 10:00'})
+    assert status == 200 and result['amount'] == 32
+    status, result = post(service, '/return', {'sn': result['serials'][0].lower(), 'time': '2024-01-01 13:00'})
+    assert status == 200 and result['exceed_hours'] == 1
+    assert service.respond('GET', '/inventory?type=adult', b'') == (200, {'type': 'adult', 'available': 4})
+
+
+@pytest.mark.parametrize('body', [
+    {'type': 'adult', 'hours': 2, 'contact': None, 'quantity': 1, 'time': '2024-01-01 10:00'},
+    {'type': 'adult', 'hours': 2, 'contact': [91234567], 'quantity': 1, 'time': '2024-01-01 10:00'},
+    {'type': 'adult', 'hours': 'two', 'contact': 91234567, 'quantity': 1, 'time': '2024-01-01 10:00'},
+    {'type': 'adult', 'hours': -1, 'contact': 91234567, 'quantity': 1, 'time': '2024-01-01 10:00'},
+    {'type': 'adult', 'hours': 2, 'contact': 91234567, 'quantity': 1.5, 'time': '2024-01-01 10:00'},
+    {'type': 'rocket', 'hours': 2, 'contact': 91234567, 'quantity': 1, 'time': '2024-01-01 10:00'},
+    {'type': 7, 'hours': 2, 'contact': 91234567, 'quantity': 1, 'time': '2024-01-01 10:00'},
+    {'type': 'adult', 'hours': 2, 'contact': 91234567, 'quantity': 1, 'time': 'noon'},
+    {'type': 'adult', 'hours': 2, 'contact': 91234567, 'quantity': 1},
+])
+def test_bad_rent_is_refused_before_anything_changes(service, body):
+    status, result = post(service, '/rent', body)
+    assert status == 400 and result['error'].startswith('bad request')
+    assert service.bicycle_da.get_inv('adult') == 5
+
+
+@pytest.mark.parametrize('raw', [b'[1, 2]', b'"rent"', b'{"type": ', b'\xff'])
+def test_body_must_be_a_json_object(service, raw):
+    assert service.respond('POST', '/rent', raw)[0] == 400
+
+
+def test_return_needs_a_serial_list_of_text(service):
+    assert post(service, '/return', {'sns': 'A001', 'time': '2024-01-01 12:00'})[0] == 400
+    assert post(service, '/return', {'sns': [1, 2], 'time': '2024-01-01 12:00'})[0] == 400
+
+
+def test_request_without_time_does_not_move_the_day(service, directory):
+    assert post(service, '/add', {'type': 'adult', 'quantity': 1})[0] == 400
+    assert service.respond('GET', '/report', b'')[0] == 200
+    assert service.todaydate == '20240101'
+    assert [name for name in os.listdir(directory) if name.startswith('sales_list_')] == ['sales_list_20240101.csv']
+
+
+def test_day_only_moves_forward(service, directory):
+    rent = {'type': 'adult', 'hours': 1, 'contact': 91234567, 'quantity': 1}
+    assert post(service, '/rent', dict(rent, time='2024-01-02 10:00'))[0] == 200
+    status, result = post(service, '/rent', dict(rent, time='2024-01-01 18:00'))
+    assert status == 409
+    assert service.todaydate == '20240102'
+    #The closed day stays archived instead of being put back
+    assert not os.path.exists(os.path.join(directory, 'sales_list_20240101.csv'))
+    assert os.path.exists(os.path.join(directory, 'sales_archive', 'sales_20240101.csv.gz'))
+
+
+def test_unexpected_error_is_answered_with_500(service, monkeypatch):
+    def broken(renttype):
+        raise RuntimeError("disk on fire")
+    monkeypatch.setattr(service.bicycle_da, 'get_inv', broken)
+    status, result = service.respond('GET', '/inventory?type=adult', b'')
+    assert status == 500 and 'disk on fire' in result['error']
+
+
+def test_every_request_on_the_socket_gets_a_reply(service):
+    async def exchange():
+        listener = await asyncio.start_server(service.handle, '127.0.0.1', 0)
+        port = listener.sockets[0].getsockname()[1]
+        replies = []
+        async with listener:
+            for request in (b'POST /rent HTTP/1.1\r\nContent-Length: 6\r\n\r\n[1, 2]',
+                            b'POST /rent HTTP/1.1\r\nContent-Length: 14\r\n\r\n{"contact": nu',
+                            b'GARBAGE\r\n\r\n',
+                            b'GET /inventory?type=adult HTTP/1.1\r\nContent-Length: -3\r\n\r\n'):
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                writer.write(request)
+                await writer.drain()
+                replies.append(await reader.readline())
+                writer.close()
+        return replies
+    replies = asyncio.run(exchange())
+    assert all(reply.startswith(b'HTTP/1.1 400') for reply in replies), replies
+
+
+def test_report_does_not_move_the_day(service):
+    assert service.respond('GET', '/report?time=2024-01-05+10:00', b'') == service.respond('GET', '/report', b'')
+    assert service.todaydate == '20240101'
+
+
+
+def test_overdue_does_not_move_the_day(service, directory):
+    assert post(service, '/rent', {'type': 'adult', 'hours': 1, 'contact': 91234567, 'quantity': 1, 'time': '2024-01-01 10:00'})[0] == 200
+    status, result = service.respond('GET', '/overdue?time=2024-01-11+10:00', b'')
+    assert status == 200 and [late['contact'] for late in result['overdue']] == [91234567]
+    assert service.todaydate == '20240101'
+    assert not os.path.exists(os.path.join(directory, 'sales_archive'))
+    assert post(service, '/rent', {'type': 'adult', 'hours': 1, 'contact': 91234568, 'quantity': 1, 'time': '2024-01-01 11:00'})[0] == 200
+
+
+def test_requests_are_timed_by_route(service, monkeypatch):
+    monkeypatch.setattr(main.INSTRUMENTS, 'enabled', True)
+    main.INSTRUMENTS.reset()
+    for number in range(20):
+        assert service.respond('GET', f'/nope{number}"x', b'')[0] == 404
+    assert service.respond('GET', '/inventory?type=adult', b'')[0] == 200
+    assert post(service, '/rent', {'type': 'adult', 'hours': 1, 'contact': 91234567, 'quantity': 1, 'time': '2024-01-01 10:00'})[0] == 200
+    operations = main.INSTRUMENTS.snapshot()['operations']
+    assert operations['unmatched']['count'] == 20
+    assert {'GET /inventory', 'POST /rent'} <= set(operations)
+    assert not [name for name in operations if 'nope' in name]
+    main.INSTRUMENTS.reset()
+
+@pytest.mark.skipif(not hasattr(signal, 'SIGTERM') or sys.platform == 'win32', reason="needs SIGTERM")
+def test_sigterm_flushes_and_writes_metrics(directory):
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    process = subprocess.Popen([sys.executable, os.path.abspath(server.__file__), '--port', str(port), '--metrics', 'metrics.json'],
+                               cwd=directory, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    try:
+        client = server.BicycleClient(f'http://127.0.0.1:{port}')
+        for _ in range(100):
+            try:
+                client.add_bicycles('adult', 3, '2024-01-01 08:00')
+                break
+            except OSError:
+                time.sleep(0.05)
+        assert client.rent_bikes('adult', 1, 91234567, 1, '2024-01-01 09:00')[0] == ['A001']
+        process.send_signal(signal.SIGTERM)
+        output, _ = process.communicate(timeout=30)
+    finally:
+        process.kill()
+    assert process.returncode == 0, output
+    assert 'POST /rent' in json.load(open(os.path.join(directory, 'metrics.json')))['operations']
+    storage = main.CsvStorage(directory)
+    inventory = storage.load_inventory(main.INVENTORY_COLUMNS)
+    storage.close()
+    assert inventory.set_index('Serial Number')['Status'].to_dict() == {'A001': 'Out', 'A002': 'In', 'A003': 'In'}
@@ -0,0 +1,59 @@
+import multiprocessing
+import os
+from datetime import time
+
+import pytest
+
+import main
+
+pytestmark = pytest.mark.skipif(main.fcntl is None, reason="shared files need fcntl locks")
+
+
+def counter(directory, contact):
+    da = main.BicycleDA(main.CsvStorage(directory, shared=True))
+    da.initsales('20230101')
+    rented = []
+    for _ in range(5):
+        result = da.rent_bikes('adult', 1, time(9, 0), contact, 1, '20230101')
+        if result:
+            rented += result[0]
+    return rented
+
+
+def test_counters_never_rent_the_same_bike(directory):
+    da = main.BicycleDA(main.CsvStorage(directory, shared=True))
+    da.initsales('20230101')
+    da.add_bicycles(main.Bicycle('adult'), 30)
+    with multiprocessing.get_context('fork').Pool(8) as pool:
+        results = pool.starmap(counter, [(directory, 90000000 + n) for n in range(8)])
+    rented = [sn for result in results for sn in result]
+    assert len(rented) == len(set(rented)) == 30
+    #Every rental of the other processes is seen here, in the inventory and in the sales totals
+    assert da.get_inv('adult') == 0
+    assert da.sales_metrics().number_by_type == {'adult': 30}
+    with open(os.path.join(directory, 'sales_list_20230101.csv')) as file:
+        assert sum(1 for line in file) == 31
+
+
+def test_changes_of_another_counter_are_read_before_acting(directory):
+    first = main.BicycleDA(main.CsvStorage(directory, shared=True))
+    second = main.BicycleDA(main.CsvStorage(directory, shared=True))
+    first.initsales('20230101')
+    second.initsales('20230101')
+    first.add_bicycles(main.Bicycle('kid'), 2)
+    assert second.get_inv('kid') == 2
+    assert second.rent_bikes('kid', 1, time(9, 0), 91234567, 2, '20230101')[0] == ['K001', 'K002']
+    assert first.rent_bikes('kid', 1, time(9, 5), 81234567, 1, '20230101') is None
+    assert first.return_bike('K001', time(10, 0), '20230101')['Amount'] == 0
+    assert second.get_sn('K001') == 0 and second.rentals_of(91234567) == ['K002']
+    first.reserve_bikes('kid', main.datetime(2023, 1, 2, 10, 0), 1, 81234567, 1)
+    #K001 is booked by the first counter, K002 is back long before
+    assert second.free_bikes('kid', main.datetime(2023, 1, 2, 10, 0), main.datetime(2023, 1, 2, 11, 0)) == ['K002']
+
+
+def test_the_day_before_stays_a_plain_csv_for_counters_still_on_it(directory):
+    da = main.BicycleDA(main.CsvStorage(directory, shared=True))
+    for todaydate in ['20230101', '20230102', '20230103']:
+        da.initsales(todaydate)
+    assert sorted(name for name in os.listdir(directory) if name.startswith('sales_list_')) == ['sales_list_20230102.csv', 'sales_list_20230103.csv']
+    assert sorted(os.listdir(os.path.join(directory, 'sales_archive'))) == ['index.csv', 'sales_20230101.csv.gz']
@@ -0,0 +1,63 @@
+import os
+from datetime import datetime, time
+
+import pytest
+
+import main
+
+
+def storages(directory):
+    return {'csv': main.CsvStorage(directory),
+            'sqlite': main.SqliteStorage(os.path.join(directory, 'bicycle_rental.db'), import_from=directory)}
+
+
+#The same day of rentals, returns and bookings, with what a counter sees after each step
+def session(da):
+    seen = []
+    da.initsales('20230101')
+    da.add_bicycles(main.Bicycle('adult'), 4)
+    da.add_bicycles(main.Bicycle('pgk'), 2)
+    seen.append(da.rent_bikes('adult', 1.5, time(9, 0), 91234567, 3, '20230101'))
+    seen.append(da.rent_bikes('pgk', 1, time(9, 15), 81234567, 1, '20230101'))
+    seen.append(da.return_bike('A001', time(12, 0), '20230101'))
+    seen.append(da.return_by_contact(81234567, time(10, 40), '20230101'))
+    seen.append(da.reserve_bikes('adult', datetime(2023, 1, 2, 10, 0), 2, 70000000, 2))
+    seen.append(da.overdue(time(13, 0), '20230101')[['Bike Type', 'Contact', 'Amount']].to_dict('records'))
+    da.initsales('20230102')
+    seen.append(da.rentals_of(91234567))
+    seen.append(da.pickup_reservation(1, time(10, 0), '20230102'))
+    seen.append(da.return_bikes([('A002', time(12, 0)), ('A003', time(12, 0))], '20230102'))
+    report = da.range_sales_report('20230101', '20230102', '20230102')
+    seen.append((report.total_revenue, report.revenue_by_type, report.number_by_type, report.hourly_revenue))
+    history = da.contact_history(91234567)
+    seen.append(main._csv_frame(history)[['Date', 'Time', 'Transaction Type', 'Amount', 'Serial Number']].to_dict('records'))
+    seen.append(da.query_bicycles().rows.to_dict('records'))
+    return seen
+
+
+def test_csv_and_sqlite_give_the_same_answers(tmp_path):
+    answers = {}
+    for name in ['csv', 'sqlite']:
+        directory = str(tmp_path / name)
+        os.makedirs(directory)
+        storage = storages(directory)[name]
+        da = main.BicycleDA(storage, flush_every=float('inf'), flush_interval=float('inf'))
+        answers[name] = session(da)
+        da.flush()
+        storage.close()
+    assert answers['csv'] == answers['sqlite']
+
+
+@pytest.mark.parametrize('name', ['csv', 'sqlite'])
+def test_everything_is_there_after_a_restart(directory, name):
+    storage = storages(directory)[name]
+    da = main.BicycleDA(storage, flush_every=float('inf'), flush_interval=float('inf'))
+    session(da)
+    da.flush()
+    before = (da.query_bicycles().rows.to_dict('records'), da.sales_metrics().report('20230102').total_revenue, da.reservation(1))
+    storage.close()
+    storage = storages(directory)[name]
+    again = main.BicycleDA(storage, flush_every=float('inf'), flush_interval=float('inf'))
+    again.initsales('20230102')
+    assert (again.query_bicycles().rows.to_dict('records'), again.sales_metrics().report('20230102').total_revenue, again.reservation(1)) == before
+    storage.close()
@@ -0,0 +1,53 @@
+from datetime import time
+
+import numpy as np
+import pytest
+
+import main
+
+RATES = {'adult': {'price': 8, 'unit': 'per hour', 'block_minutes': 60},
+         'ebike': {'price': 5, 'unit': 'per 15 minutes', 'block_minutes': 15},
+         'cargo': {'price': 40, 'unit': 'per 2 hours', 'block_minutes': 120}}
+
+
+@pytest.mark.parametrize('biketype, hours, blocks, amount, rounded', [
+    ('ebike', 0.25, 1, 5, 0.25),
+    ('ebike', 0.3, 2, 10, 0.5),
+    ('ebike', 1.1, 5, 25, 1.25),
+    ('cargo', 0.5, 1, 40, 2),
+    ('cargo', 2.01, 2, 80, 4),
+    ('adult', 3, 3, 24, 3),
+])
+def test_custom_blocks_round_up(biketype, hours, blocks, amount, rounded):
+    tariff = main.Tariff(RATES)
+    assert tariff.quote_one(biketype, hours) == (blocks, amount)
+    assert tariff.round_hours(biketype, hours) == rounded
+    many_blocks, amounts = tariff.quote(np.array([biketype, 'adult']), [hours, 1])
+    assert (many_blocks[0], amounts[0]) == (blocks, amount)
+
+
+def test_overtime_in_seconds_uses_the_same_blocks():
+    tariff = main.Tariff(RATES)
+    assert tariff.quote_one('ebike', seconds=16 * 60) == (2, 10)
+    assert tariff.quote_one('ebike', seconds=-10 * 60) == (0, 0)
+    blocks, amounts = tariff.quote(np.array(['ebike', 'cargo']), seconds=[16 * 60, 121 * 60])
+    assert blocks.tolist() == [2, 2] and amounts.tolist() == [10, 80]
+
+
+def test_unknown_type_is_refused():
+    tariff = main.Tariff(RATES)
+    for price in [lambda: tariff.quote_one('kid', 1), lambda: tariff.round_hours('kid', 1),
+                  lambda: tariff.quote(np.array(['adult', 'kid']), [1, 1])]:
+        with pytest.raises(KeyError, match='kid'):
+            price()
+
+
+def test_rent_and_return_on_a_custom_tariff(open_da):
+    tariff = main.Tariff(RATES)
+    da = open_da(tariff=tariff)
+    da.initsales('20230101')
+    sns = da.add_bicycles(main.Bicycle('ebike', tariff=tariff), 2)
+    sns, total, hours = da.rent_bikes('ebike', 0.4, time(9, 0), 91234567, 2, '20230101')
+    assert (total, hours) == (20, 0.5)
+    returned = da.return_bike(sns[0], time(9, 50), '20230101')
+    assert returned['Exceed Blocks'] == 2 and returned['Exceed Hours'] == 0.5 and returned['Amount'] == 10
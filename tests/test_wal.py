@@ -0,0 +1,136 @@
+import os
+import subprocess
+import sys
+import textwrap
+from datetime import time
+
+import pandas as pd
+import pytest
+
+import main
+
+#Opens the folder, saves three bikes, then rents two and returns one without saving the inventory
+SESSION = textwrap.dedent('''
+    import os, sys
+    from datetime import time
+    sys.path.insert(0, {root!r})
+    import main
+    da = main.BicycleDA(main.CsvStorage('.'), flush_every=float('inf'), flush_interval=float('inf'))
+    da.initsales('20230101')
+    da.add_bicycles(main.Bicycle('adult'), 3)
+    da.flush()
+    da.rent_bikes('adult', 2, time(9, 0), 91234567, 2, '20230101')
+    da.return_bike('A001', time(12, 0), '20230101')
+    {crash}
+    da.rent_bikes('adult', 1, time(13, 0), 81234567, 1, '20230101')
+    os._exit(0)
+''')
+
+#Ways the process dies while the last rental is written to the sales csv
+CRASHES = {
+    'before the sales row': '''
+        def crash(self, rows):
+            os._exit(0)
+        main.SalesJournal.append = crash''',
+    'halfway through the sales row': '''
+        def crash(self, rows):
+            text = self.encode(rows)
+            with open(self.path, 'a', newline='') as file:
+                file.write(text[:len(text) // 2])
+            os._exit(0)
+        main.SalesJournal.append = crash''',
+    'after the sales row': '',
+}
+
+
+def run_session(directory, crash):
+    root = os.path.dirname(os.path.abspath(main.__file__))
+    code = SESSION.format(root=root, crash=textwrap.dedent(crash).strip())
+    subprocess.run([sys.executable, '-c', code], cwd=directory, check=True)
+
+
+def state(da, directory):
+    sales = pd.read_csv(os.path.join(directory, 'sales_list_20230101.csv'))
+    rows = da.query_bicycles().rows[['Serial Number', 'Status', 'Contact']].to_dict('records')
+    return rows, sales[['Transaction Type', 'Amount', 'Serial Number']].to_dict('records')
+
+
+@pytest.mark.parametrize('crash', list(CRASHES))
+def test_recovery_keeps_inventory_and_sales_together(open_da, directory, crash):
+    run_session(directory, CRASHES[crash])
+    da = open_da()
+    da.initsales('20230101')
+    rows, sales = state(da, directory)
+    assert rows == [{'Serial Number': 'A001', 'Status': 'In', 'Contact': ''},
+                    {'Serial Number': 'A002', 'Status': 'Out', 'Contact': 91234567},
+                    {'Serial Number': 'A003', 'Status': 'Out', 'Contact': 81234567}]
+    assert sales == [{'Transaction Type': 'Rental', 'Amount': 16, 'Serial Number': 'A001'},
+                     {'Transaction Type': 'Rental', 'Amount': 16, 'Serial Number': 'A002'},
+                     {'Transaction Type': 'Excess Hour Charges', 'Amount': 8, 'Serial Number': 'A001'},
+                     {'Transaction Type': 'Rental', 'Amount': 8, 'Serial Number': 'A003'}]
+    assert da.sales_metrics().report('20230101').total_revenue == 48
+    #The recovered state is saved as the new snapshot and the log starts empty
+    assert os.path.getsize(os.path.join(directory, 'bicycle_db.wal')) == 0
+
+
+def test_log_replayed_over_a_newer_snapshot_changes_nothing(open_da, directory):
+    run_session(directory, '')
+    with open(os.path.join(directory, 'bicycle_db.wal')) as file:
+        log = file.read()
+    da = open_da()
+    da.initsales('20230101')
+    recovered = state(da, directory)
+    da.flush()
+    #As if the process died after saving the snapshot but before the log was emptied
+    with open(os.path.join(directory, 'bicycle_db.wal'), 'w') as file:
+        file.write(log)
+    again = open_da()
+    again.initsales('20230101')
+    assert state(again, directory) == recovered
+
+
+def test_torn_log_line_is_skipped(open_da, directory):
+    run_session(directory, CRASHES['before the sales row'])
+    path = os.path.join(directory, 'bicycle_db.wal')
+    with open(path, 'r+') as file:
+        lines = file.readlines()
+        file.seek(0)
+        file.truncate()
+        file.writelines(lines[:-1] + [lines[-1][:len(lines[-1]) // 2]])
+    da = open_da()
+    da.initsales('20230101')
+    rows, sales = state(da, directory)
+    #The last rental never finished logging, so it is not there at all
+    assert {row['Serial Number']: row['Status'] for row in rows} == {'A001': 'In', 'A002': 'Out', 'A003': 'In'}
+    assert [row['Serial Number'] for row in sales] == ['A001', 'A002', 'A001']
+
+
+def test_shared_and_sqlite_storage_keep_no_log(directory):
+    shared = main.BicycleDA(main.CsvStorage(directory, shared=True))
+    shared.initsales('20230101')
+    shared.add_bicycles(main.Bicycle('adult'), 2)
+    shared.rent_bikes('adult', 1, time(9, 0), 91234567, 1, '20230101')
+    shared.flush()
+    storage = main.SqliteStorage(os.path.join(directory, 'bicycle_rental.db'), import_from=directory)
+    sqlite = main.BicycleDA(storage, flush_every=float('inf'), flush_interval=float('inf'))
+    sqlite.initsales('20230101')
+    sqlite.rent_bikes('adult', 1, time(9, 0), 91234567, 1, '20230101')
+    storage.close()
+    assert not os.path.exists(os.path.join(directory, 'bicycle_db.wal'))
+
+
+@pytest.mark.skipif(not os.path.isdir('/proc/self/fd'), reason="needs /proc to name synced files")
+def test_snapshot_rename_is_synced_before_the_log_is_emptied(open_da, directory, monkeypatch):
+    da = open_da()
+    da.initsales('20230101')
+    da.add_bicycles(main.Bicycle('adult'), 3)
+    synced = []
+    fsync = os.fsync
+    monkeypatch.setattr(main.os, 'fsync', lambda fd: synced.append(os.readlink(f"/proc/self/fd/{fd}")) or fsync(fd))
+    da.flush()
+    folder = os.path.realpath(directory)
+    wal = os.path.join(folder, 'bicycle_db.wal')
+    assert folder in synced and wal in synced
+    #the folder holding the renamed snapshot is synced after the snapshot and before the log is truncated
+    snapshot = max(i for i, path in enumerate(synced) if path.startswith(os.path.join(folder, 'bicycle_db.csv')))
+    assert snapshot < synced.index(folder, snapshot) < synced.index(wal)